@@ -0,0 +1,351 @@
+"""Command line entry point: python -m common
+convert|analyze|render|sweep|synthetic|benchmark.
+
+Only argparse is imported up front; every subcommand imports what it needs,
+so converting or analysing never loads matplotlib.
+"""
+
+import argparse
+import os
+from datetime import date
+from decimal import Decimal
+
+from common.constants.study import DOSES, INSURERS, PERIODS
+
+
+def number_range(value: str) -> list[Decimal]:
+    """A single number or an inclusive start:stop:step range, e.g. 0.1:0.9:0.1."""
+    if ":" not in value:
+        return [Decimal(value)]
+    start, stop, step = (Decimal(part) for part in value.split(":"))
+    if step <= 0:
+        raise argparse.ArgumentTypeError(f"step must be positive: {value}")
+    values = []
+    while start <= stop:
+        values.append(start)
+        start += step
+    return values
+
+
+def ints(values: list[list[Decimal]]) -> list[int]:
+    return [int(value) for group in values for value in group]
+
+
+def floats(values: list[list[Decimal]]) -> list[float]:
+    return [float(value) for group in values for value in group]
+
+
+def convert(args: argparse.Namespace) -> None:
+    from common.converter import convert
+
+    convert(args.store, incremental=args.incremental, max_workers=args.workers)
+
+
+def _study(args: argparse.Namespace):
+    from common.event_study import run_event_study
+    from common.storage import read_store
+
+    store = read_store(args.store, INSURERS[args.insurer])
+    return store, run_event_study(
+        store,
+        start_date=args.start_date,
+        end_date=args.end_date,
+        vax_period_in_days=args.vax_period,
+        onset_threshold=args.threshold,
+        outcome=args.outcome,
+    )
+
+
+def analyze(args: argparse.Namespace) -> None:
+    _, study = _study(args)
+    results = study.results(
+        ints(args.periods), ints(args.doses), args.approximate_above
+    ).sort(["age_cohort"])
+
+    output = args.output or f"out/{args.insurer}/results_all_periods.csv"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    results.write_csv(output)
+    print(f"✓ {results.height} rows written to {output}")
+
+
+def render(args: argparse.Namespace) -> None:
+    from common.onsets import daily_vaccinations
+    from common.render import render_charts, sums_charts, vax_timeline_charts
+
+    store, study = _study(args)
+    directory = args.output or f"out/{args.insurer}"
+    charts = vax_timeline_charts(
+        daily_vaccinations(store),
+        study.onset_map(),
+        directory,
+        args.vax_period,
+        ints(args.doses),
+    ) + sums_charts(
+        study,
+        args.insurer,
+        directory,
+        ints(args.periods),
+        ints(args.doses),
+        block_2x2=args.block_2x2,
+    )
+    summary = render_charts(charts, max_workers=args.workers, force=args.force)
+    print(f"✓ {summary['rendered']} charts rendered, {summary['skipped']} up to date")
+
+
+def sweep(args: argparse.Namespace) -> None:
+    from common.sweep import run_sweep, scenarios
+
+    runs = scenarios(
+        args.insurers,
+        ints(args.vax_periods),
+        args.start_dates,
+        args.end_dates,
+        floats(args.thresholds),
+        args.outcomes,
+    )
+    print(f"Running {len(runs)} scenarios")
+    results = run_sweep(
+        runs,
+        args.store,
+        periods=ints(args.periods),
+        doses=ints(args.doses),
+        approximate_above=args.approximate_above,
+        max_workers=args.workers,
+    )
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    if args.output.endswith(".csv"):
+        results.write_csv(args.output)
+    else:
+        results.write_parquet(args.output)
+    print(f"✓ {results.height} rows written to {args.output}")
+
+
+def synthetic(args: argparse.Namespace) -> None:
+    from common.synthetic import generate_sources
+
+    for insurer, (file_path, _) in generate_sources(
+        args.output, args.rows, args.seed
+    ).items():
+        print(f"✓ {insurer}: {file_path}")
+
+
+def benchmark(args: argparse.Namespace) -> None:
+    import polars as pl
+
+    from common.benchmark import STAGES, run_benchmark, verify
+    from common.synthetic import SCHEMAS, generate_sources
+
+    data = os.path.join(args.directory, "data")
+    sources = {
+        insurer: (os.path.join(data, f"{insurer.upper()}_preskladane.csv"), schema)
+        for insurer, schema in SCHEMAS.items()
+    }
+    if args.regenerate or not all(os.path.exists(path) for path, _ in sources.values()):
+        print(f"Generating {args.rows} rows per insurer in {data}")
+        sources = generate_sources(data, args.rows, args.seed)
+
+    if args.check_rows:
+        checks = verify(sources, args.check_rows)
+        for check, difference in checks.items():
+            print(f"✓ {check}" if difference is None else f"✗ {check}: {difference}")
+
+    timings = run_benchmark(sources, args.directory, args.stages or STAGES)
+    with pl.Config(tbl_rows=-1, tbl_cols=-1):
+        print(timings)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    timings.write_csv(args.output)
+    if args.check_rows and any(d is not None for d in checks.values()):
+        raise SystemExit("fast paths differ from the reference code")
+
+
+def _add_grid_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--periods",
+        nargs="+",
+        type=number_range,
+        default=[[Decimal(period)] for period in PERIODS],
+        help="before/after window lengths in days",
+    )
+    parser.add_argument(
+        "--doses",
+        nargs="+",
+        type=number_range,
+        default=[[Decimal(dose)] for dose in DOSES],
+    )
+    parser.add_argument(
+        "--approximate-above",
+        type=float,
+        default=None,
+        help="use the chi-square test for tables whose smallest cell reaches this",
+    )
+
+
+def _add_study_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--insurer", choices=list(INSURERS), default="cpzp")
+    parser.add_argument("--vax-period", type=int, default=30)
+    parser.add_argument(
+        "--start-date", type=date.fromisoformat, default=date(2015, 1, 1)
+    )
+    parser.add_argument("--end-date", type=date.fromisoformat, default=date(2025, 1, 1))
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.5,
+        help="onset threshold, share of the daily vaccination peak",
+    )
+    parser.add_argument(
+        "--outcome",
+        nargs="+",
+        metavar="ATC",
+        help="count only prescriptions of these ATC groups (any level, e.g. H02 L04AX)",
+    )
+    _add_grid_arguments(parser)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m common")
+    commands = parser.add_subparsers(dest="command", required=True)
+    tracing = argparse.ArgumentParser(add_help=False)
+    tracing.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="write per-stage timings, rows and peak memory as JSON to PATH "
+        "(same as DATACON_TRACE=PATH)",
+    )
+    shared = argparse.ArgumentParser(add_help=False, parents=[tracing])
+    shared.add_argument("--store", default="DATACON_data/persons")
+    shared.add_argument("--workers", type=int, default=None)
+
+    command = commands.add_parser(
+        "convert",
+        parents=[shared],
+        help="convert the preskladane extracts to the persons store",
+    )
+    command.add_argument(
+        "--incremental",
+        action="store_true",
+        help="convert only new or changed extracts (DATACON_data/<INSURER>_preskladane*.csv)",
+    )
+    command.set_defaults(handler=convert)
+
+    command = commands.add_parser(
+        "analyze", parents=[shared], help="write the results table"
+    )
+    _add_study_arguments(command)
+    command.add_argument(
+        "--output", help="default: out/<insurer>/results_all_periods.csv"
+    )
+    command.set_defaults(handler=analyze)
+
+    command = commands.add_parser(
+        "render",
+        parents=[shared],
+        help="draw the vax_period and sums charts that changed",
+    )
+    _add_study_arguments(command)
+    command.add_argument("--output", help="default: out/<insurer>")
+    command.add_argument("--force", action="store_true", help="redraw every chart")
+    command.add_argument("--block-2x2", action="store_true")
+    command.set_defaults(handler=render)
+
+    command = commands.add_parser(
+        "sweep", parents=[shared], help="run the results grid for many parameter sets"
+    )
+    command.add_argument(
+        "--insurers", nargs="+", choices=list(INSURERS), default=["cpzp"]
+    )
+    command.add_argument(
+        "--vax-periods",
+        nargs="+",
+        type=number_range,
+        default=[[Decimal(30)]],
+        help="VAX_PERIOD_IN_DAYS values or start:stop:step ranges",
+    )
+    command.add_argument(
+        "--start-dates", nargs="+", type=date.fromisoformat, default=[date(2015, 1, 1)]
+    )
+    command.add_argument(
+        "--end-dates", nargs="+", type=date.fromisoformat, default=[date(2025, 1, 1)]
+    )
+    command.add_argument(
+        "--thresholds",
+        nargs="+",
+        type=number_range,
+        default=[[Decimal("0.5")]],
+        help="onset thresholds (share of the daily vaccination peak) or ranges",
+    )
+    command.add_argument(
+        "--outcomes",
+        nargs="+",
+        metavar="ATC",
+        default=[None],
+        help="outcome definitions, each an ATC prefix or comma-separated prefixes "
+        "(e.g. H02 L04 H02,L04); default: every prescription",
+    )
+    _add_grid_arguments(command)
+    command.add_argument(
+        "--output",
+        default="out/sweep/results.parquet",
+        help="results table, .parquet or .csv",
+    )
+    command.set_defaults(handler=sweep)
+
+    command = commands.add_parser(
+        "synthetic",
+        parents=[tracing],
+        help="write synthetic CPZP and OZP preskladane extracts",
+    )
+    command.add_argument("--rows", type=int, default=1_000_000, help="rows per insurer")
+    command.add_argument("--seed", type=int, default=0)
+    command.add_argument("--output", default="DATACON_data/synthetic")
+    command.set_defaults(handler=synthetic)
+
+    command = commands.add_parser(
+        "benchmark",
+        parents=[tracing],
+        help="time and memory-profile the pipeline stages on synthetic extracts",
+    )
+    command.add_argument(
+        "--rows",
+        type=int,
+        default=1_000_000,
+        help="rows per insurer, when the extracts are (re)generated",
+    )
+    command.add_argument("--seed", type=int, default=0)
+    command.add_argument(
+        "--directory",
+        default="out/benchmark",
+        help="extracts (data/), store (persons/) and charts (out/) go here",
+    )
+    command.add_argument("--regenerate", action="store_true")
+    command.add_argument(
+        "--stages",
+        nargs="+",
+        help="any of read convert convert_to_store ingest aggregate render "
+        "(default: all)",
+    )
+    command.add_argument(
+        "--check-rows",
+        type=int,
+        default=50_000,
+        help="compare the fast paths with the reference code on this many rows "
+        "per insurer; 0 skips the checks",
+    )
+    command.add_argument("--output", default="out/benchmark/timings.csv")
+    command.set_defaults(handler=benchmark)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = build_parser().parse_args(argv)
+    if args.trace:
+        from common.trace import TRACE_ENV
+
+        # set before any worker is spawned, so the workers trace too
+        os.environ[TRACE_ENV] = args.trace
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+from dataclasses import dataclass
+
+import numpy as np
+import polars as pl
+
+# Length of an ATC code at each level of the hierarchy, e.g. L, L04, L04A,
+# L04AX, L04AX03
+ATC_LEVELS = {1: 1, 2: 3, 3: 4, 4: 5, 5: 7}
+
+
+@dataclass
+class AtcIndex:
+    """Prescription rows grouped by ATC code, codes sorted.
+
+    Every code sharing a prefix sits in one run of `codes`, so the rows of any
+    prefix, at any level, are the slice rows[offsets[lo]:offsets[hi]] found by
+    two binary searches. Prescriptions without an ATC code are not indexed.
+    """
+
+    codes: np.ndarray
+    rows: np.ndarray
+    offsets: np.ndarray
+    n_rows: int
+
+    @classmethod
+    def build(cls, drug_ids: np.ndarray, drugs: pl.DataFrame) -> "AtcIndex":
+        """Index prescriptions by the ATC code of their drug (common.drugs)."""
+        atc = drugs["atc_skupina"].cast(pl.String)
+        codes = np.sort(atc.drop_nulls().unique().to_numpy().astype(str))
+        # position of every drug's code in codes, -1 without a code
+        code_of_drug = np.where(
+            atc.is_null().to_numpy(),
+            -1,
+            np.searchsorted(codes, atc.fill_null("").to_numpy().astype(str)),
+        )
+        row_codes = code_of_drug[drug_ids]
+        order = np.argsort(row_codes, kind="stable")
+        counts = np.bincount(row_codes[row_codes >= 0], minlength=len(codes))
+        offsets = np.zeros(len(codes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(
+            codes=codes,
+            rows=order[len(order) - offsets[-1] :],
+            offsets=offsets,
+            n_rows=len(drug_ids),
+        )
+
+    def __span(self, prefix: str) -> tuple[int, int]:
+        lo = np.searchsorted(self.codes, prefix, side="left")
+        hi = np.searchsorted(self.codes, prefix + "\U0010ffff", side="left")
+        return self.offsets[lo], self.offsets[hi]
+
+    def count(self, prefix: str) -> int:
+        start, end = self.__span(prefix)
+        return int(end - start)
+
+    def rows_of(self, prefixes: str | list[str]) -> np.ndarray:
+        """Sorted prescription rows whose ATC code starts with any of the
+        prefixes."""
+        if isinstance(prefixes, str):
+            return np.sort(self.rows[slice(*self.__span(prefixes))])
+        # through a mask, as overlapping prefixes (L04, L04AX) share rows
+        return np.flatnonzero(self.mask(prefixes))
+
+    def mask(self, prefixes: str | list[str]) -> np.ndarray:
+        mask = np.zeros(self.n_rows, dtype=bool)
+        for prefix in [prefixes] if isinstance(prefixes, str) else prefixes:
+            mask[self.rows[slice(*self.__span(prefix))]] = True
+        return mask
+
+    def groups(self, level: int) -> pl.DataFrame:
+        """Codes at an ATC level (1-5) with their number of prescriptions."""
+        length = ATC_LEVELS[level]
+        return (
+            pl.DataFrame({"atc": self.codes, "prescriptions": np.diff(self.offsets)})
+            .filter(pl.col("atc").str.len_chars() >= length)
+            .with_columns(pl.col("atc").str.slice(0, length))
+            .group_by("atc")
+            .agg(pl.col("prescriptions").sum())
+            .sort("atc")
+        )
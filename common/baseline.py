@@ -0,0 +1,606 @@
+"""Frozen copies of the original code, the reference the fast paths are
+checked against (benchmark.verify and tests/): the converter of objectify.py
+and the loops of max_vax_analysis.ipynb as they were before any of them was
+optimized. Only the notebook globals became parameters; keep the rest as is.
+"""
+
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import polars as pl
+
+from common.constants.column_names import CPZP_COLUMNS, SHARED_COLUMNS
+from common.constants.column_types import TYP_UDALOSTI
+from common.constants.objects import (
+    AgeCohort,
+    Gender,
+    Person,
+    Prescription,
+    PrescriptionType,
+    Vaccine,
+)
+
+
+def read_preskladane_data(file_path: str, schema: pl.Schema) -> pl.DataFrame:
+    return pl.read_csv(
+        file_path,
+        null_values=["NA", ""],
+        schema=schema,
+    )
+
+
+class DataframeToPersonsClassConverter:
+    def __extract_person_info(self, df: pl.DataFrame) -> pl.DataFrame:
+        try:
+            person_info = df.group_by(SHARED_COLUMNS.ID_POJISTENCE.value).agg(
+                [
+                    pl.first(SHARED_COLUMNS.POHLAVI.value).alias("gender"),
+                    pl.first(SHARED_COLUMNS.ROK_NAROZENI.value).alias("birth_year"),
+                    pl.first(CPZP_COLUMNS.MESIC_NAROZENI.value).alias("birth_month"),
+                    pl.first(SHARED_COLUMNS.DATUM_UMRTI.value).alias("death_date"),
+                    pl.first(SHARED_COLUMNS.POSLEDNI_ZAHAJENI_POJISTENI.value).alias(
+                        "Posledni_zahajeni_pojisteni"
+                    ),
+                    pl.first(SHARED_COLUMNS.POSLEDNI_UKONCENI_POJISTENI.value).alias(
+                        "Posledni_ukonceni_pojisteni"
+                    ),
+                ]
+            )
+        except Exception as _e:
+            person_info = df.group_by(SHARED_COLUMNS.ID_POJISTENCE.value).agg(
+                [
+                    pl.first(SHARED_COLUMNS.POHLAVI.value).alias("gender"),
+                    pl.first(SHARED_COLUMNS.ROK_NAROZENI.value).alias("birth_year"),
+                    pl.first(SHARED_COLUMNS.DATUM_UMRTI.value).alias("death_date"),
+                    pl.first(SHARED_COLUMNS.POSLEDNI_ZAHAJENI_POJISTENI.value).alias(
+                        "Posledni_zahajeni_pojisteni"
+                    ),
+                    pl.first(SHARED_COLUMNS.POSLEDNI_UKONCENI_POJISTENI.value).alias(
+                        "Posledni_ukonceni_pojisteni"
+                    ),
+                ]
+            )
+
+        return person_info
+
+    def __extract_prescriptions(self, df: pl.DataFrame) -> pl.DataFrame:
+        try:
+            return (
+                df.filter(
+                    pl.col(SHARED_COLUMNS.TYP_UDALOSTI.value) == TYP_UDALOSTI.PREDPIS
+                )
+                .filter(pl.col(SHARED_COLUMNS.DATUM_UDALOSTI.value).is_not_null())
+                .group_by(SHARED_COLUMNS.ID_POJISTENCE.value)
+                .agg(
+                    [
+                        pl.col(SHARED_COLUMNS.DATUM_UDALOSTI.value).alias(
+                            "prescription_dates"
+                        ),
+                        pl.col(SHARED_COLUMNS.LECIVE_LATKY.value).alias("latka"),
+                        pl.col(SHARED_COLUMNS.EQUIV_SLOUCENINA.value).alias(
+                            "equiv_sloucenina"
+                        ),
+                        pl.col(SHARED_COLUMNS.PREDNISON_EQUIV.value).alias(
+                            "prednison_equiv"
+                        ),
+                        pl.col(SHARED_COLUMNS.POCET_BALENI.value).alias("pocet_baleni"),
+                        pl.col(SHARED_COLUMNS.POCET_V_BALENI.value).alias(
+                            "pocet_v_baleni"
+                        ),
+                        pl.col(SHARED_COLUMNS.SILA.value).alias("sila"),
+                        pl.col(CPZP_COLUMNS.SPECIALIZACE.value).alias("Specializace"),
+                        pl.col(SHARED_COLUMNS.ATC_SKUPINA.value).alias("ATC_skupina"),
+                        pl.col(SHARED_COLUMNS.LEKOVA_FORMA.value).alias("léková_forma"),
+                    ]
+                )
+            )
+        except Exception as _e:
+            return (
+                df.filter(
+                    pl.col(SHARED_COLUMNS.TYP_UDALOSTI.value) == TYP_UDALOSTI.PREDPIS
+                )
+                .filter(pl.col(SHARED_COLUMNS.DATUM_UDALOSTI.value).is_not_null())
+                .group_by(SHARED_COLUMNS.ID_POJISTENCE.value)
+                .agg(
+                    [
+                        pl.col(SHARED_COLUMNS.DATUM_UDALOSTI.value).alias(
+                            "prescription_dates"
+                        ),
+                        pl.col(SHARED_COLUMNS.LECIVE_LATKY.value).alias("latka"),
+                        pl.col(SHARED_COLUMNS.EQUIV_SLOUCENINA.value).alias(
+                            "equiv_sloucenina"
+                        ),
+                        pl.col(SHARED_COLUMNS.PREDNISON_EQUIV.value).alias(
+                            "prednison_equiv"
+                        ),
+                        pl.col(SHARED_COLUMNS.POCET_BALENI.value).alias("pocet_baleni"),
+                        pl.col(SHARED_COLUMNS.POCET_V_BALENI.value).alias(
+                            "pocet_v_baleni"
+                        ),
+                        pl.col(SHARED_COLUMNS.SILA.value).alias("sila"),
+                        pl.col(SHARED_COLUMNS.ATC_SKUPINA.value).alias("ATC_skupina"),
+                        pl.col(SHARED_COLUMNS.LEKOVA_FORMA.value).alias("léková_forma"),
+                    ]
+                )
+            )
+
+    def __extract_vaccines(self, df: pl.DataFrame) -> pl.DataFrame:
+        try:
+            return (
+                df.filter(
+                    pl.col(SHARED_COLUMNS.TYP_UDALOSTI.value) == TYP_UDALOSTI.VAKCINACE
+                )
+                .filter(pl.col(SHARED_COLUMNS.DATUM_UDALOSTI.value).is_not_null())
+                .group_by(SHARED_COLUMNS.ID_POJISTENCE.value)
+                .agg(
+                    [
+                        pl.col(SHARED_COLUMNS.DATUM_UDALOSTI.value).alias(
+                            "vaccine_dates"
+                        ),
+                        pl.col(CPZP_COLUMNS.KOD_UDALOSTI.value).alias("nazev"),
+                    ]
+                )
+            )
+        except Exception as _e:
+            return (
+                df.filter(
+                    pl.col(SHARED_COLUMNS.TYP_UDALOSTI.value) == TYP_UDALOSTI.VAKCINACE
+                )
+                .filter(pl.col(SHARED_COLUMNS.DATUM_UDALOSTI.value).is_not_null())
+                .group_by(SHARED_COLUMNS.ID_POJISTENCE.value)
+                .agg(
+                    [
+                        pl.col(SHARED_COLUMNS.DATUM_UDALOSTI.value).alias(
+                            "vaccine_dates"
+                        ),
+                    ]
+                )
+            )
+
+    def convert(self, df: pl.DataFrame) -> list[Person]:
+        persons = []
+
+        # Get unique person info efficiently
+        person_info = self.__extract_person_info(df)
+
+        # Get prescriptions efficiently
+        prescriptions_df = self.__extract_prescriptions(df)
+
+        # Get vaccinations efficiently
+        vaccines_df = self.__extract_vaccines(df)
+
+        # Join all the data together
+        combined = person_info.join(
+            prescriptions_df, on=SHARED_COLUMNS.ID_POJISTENCE.value, how="left"
+        ).join(vaccines_df, on=SHARED_COLUMNS.ID_POJISTENCE.value, how="left")
+
+        # Convert to Person objects
+        for row in combined.iter_rows(named=True):
+            person_id = row[SHARED_COLUMNS.ID_POJISTENCE.value]
+
+            # Convert gender
+            gender_code = row["gender"]
+            gender = Gender.MALE if gender_code == "M" else Gender.FEMALE
+
+            # Create birth date
+            birth_year = row["birth_year"]
+            birth_month = row.get("birth_month", None)
+            born_at = self.__create_birth_date(birth_year, birth_month)
+
+            # Death date
+            died_at = row["death_date"]
+
+            # Process prescriptions
+            prescriptions = []
+            prescription_dates = row["prescription_dates"] or []
+            latka = row["latka"] or []
+            equiv_sloucenina = row["equiv_sloucenina"] or []
+            prednison_equiv = row["prednison_equiv"] or []
+            pocet_baleni = row["pocet_baleni"] or []
+            pocet_v_baleni = row["pocet_v_baleni"] or []
+            sila = row["sila"] or []
+            specializace_lekare = row.get("Specializace", None)
+            atc_skupina = row["ATC_skupina"] or []
+            lekova_forma = row["léková_forma"] or []
+            prescription_types = []
+            for atc_code in atc_skupina:
+                if atc_code is None:
+                    prescription_types.append(PrescriptionType.KORTIKOID)
+                    continue
+                if atc_code.startswith("L04"):
+                    prescription_types.append(PrescriptionType.IMUNOSUPRESSIVE)
+                else:
+                    prescription_types.append(PrescriptionType.KORTIKOID)
+
+            for i, date in enumerate(prescription_dates):
+                age_cohort = self.__calculate_age_cohort(born_at, date)
+                if (
+                    sila[i] is not None
+                    and pocet_baleni[i] is not None
+                    and pocet_v_baleni[i] is not None
+                    and prednison_equiv[i] is not None
+                    and sila[i] != ""
+                ):
+                    sila[i] = float(
+                        sila[i].replace("MG", "").replace(",", ".").replace("/ML", "")
+                    )
+
+                    current_pred_equiv = (
+                        prednison_equiv[i]
+                        * pocet_v_baleni[i]
+                        * pocet_baleni[i]
+                        * sila[i]
+                    )
+                else:
+                    current_pred_equiv = 0
+
+                prescriptions.append(
+                    Prescription(
+                        date=date,
+                        latka=latka[i],
+                        equiv_sloucenina=equiv_sloucenina[i],
+                        prednison_equiv=current_pred_equiv,
+                        specializace_lekare=(
+                            specializace_lekare[i]
+                            if specializace_lekare is not None
+                            else None
+                        ),
+                        atc_skupina=atc_skupina[i],
+                        age_cohort_at_prescription=age_cohort,
+                        prescription_type=prescription_types[i],
+                        lekova_forma=lekova_forma[i],
+                    )
+                )
+
+            # Process vaccines
+            vaccine_dates = row["vaccine_dates"] or []
+            nazev = row.get("nazev", None)
+            vaccines = []
+            for i, vaccine_date in enumerate(vaccine_dates):
+                age_cohort_at_vaccination = self.__calculate_age_cohort(
+                    born_at, vaccine_date
+                )
+                vaccines.append(
+                    Vaccine(
+                        date=vaccine_date,
+                        dose_number=i + 1,  # Dose number starts from 1
+                        age_cohort=age_cohort_at_vaccination,
+                        nazev=nazev[i] if nazev is not None else None,
+                    )
+                )
+
+            # Create Person object
+            person_age_cohort = (
+                self.__calculate_age_cohort(born_at, died_at)
+                if died_at is not None
+                else self.__calculate_age_cohort(born_at, datetime.now())
+            )
+            person = Person(
+                id=person_id,
+                gender=gender,
+                born_at=born_at,
+                zahajeni_pojisteni=row["Posledni_zahajeni_pojisteni"],
+                ukonceni_pojisteni=row["Posledni_ukonceni_pojisteni"],
+                vaccines=vaccines,
+                prescriptions=prescriptions,
+                died_at=died_at,
+                age_cohort=person_age_cohort,
+            )
+
+            persons.append(person)
+
+        return persons
+
+    def __create_birth_date(self, year: int, month: int | None) -> datetime:
+        month = month if month is not None else 1
+        return datetime(year, month, 1)
+
+    def __calculate_age_cohort(
+        self, birth_date: datetime, event_date: datetime
+    ) -> AgeCohort:
+        age = event_date.year - birth_date.year
+
+        if event_date.month < birth_date.month or (
+            event_date.month == birth_date.month and event_date.day < birth_date.day
+        ):
+            age -= 1
+
+        if age < 12:
+            return AgeCohort.LESS_THAN_12
+        elif age < 30:
+            return AgeCohort.BETWEEN_12_AND_30
+        elif age < 50:
+            return AgeCohort.BETWEEN_30_AND_50
+        elif age < 60:
+            return AgeCohort.BETWEEN_50_AND_60
+        else:
+            return AgeCohort.MORE_THAN_60
+
+
+# --- max_vax_analysis.ipynb --------------------------------------------------
+
+
+def is_injection(form: str) -> bool:
+    return form in {"Injekční suspenze", "Injekční/infuzní roztok"}
+
+
+def skip_person_for_novax(p, start_date: date, end_date: date) -> bool:
+    return (
+        (p.zahajeni_pojisteni > start_date)
+        or (p.ukonceni_pojisteni is not None and p.ukonceni_pojisteni < end_date)
+        or p.died_at
+        or bool(p.vaccines)
+        or not p.prescriptions
+    )
+
+
+def skip_person_for_vax(p, start_date: date, end_date: date) -> bool:
+    return (
+        (p.zahajeni_pojisteni > start_date)
+        or (p.ukonceni_pojisteni is not None and p.ukonceni_pojisteni < end_date)
+        or p.died_at
+        or (not p.vaccines)
+        or (not p.prescriptions)
+    )
+
+
+def collapse_injections(prescriptions):
+    """Yield prescriptions but ignore additional injections within 14 days."""
+    last_inj_date = date.min
+    for pr in prescriptions:
+        if is_injection(pr.lekova_forma):
+            if abs((last_inj_date - pr.date).days) < 14:
+                continue
+            last_inj_date = pr.date
+        yield pr
+
+
+def safe_div(a: float, b: float) -> float:
+    return np.nan if b == 0 else a / b
+
+
+def pvalue_from_df(df: pl.DataFrame) -> float:
+    """Fisher exact test on Polars df with rows očkovaní/neočkovaní, cols před/po"""
+    from scipy.stats import fisher_exact
+
+    table = [
+        [
+            int(df.filter(pl.col("group") == "očkovaní")["před"][0]),
+            int(df.filter(pl.col("group") == "očkovaní")["po"][0]),
+        ],
+        [
+            int(df.filter(pl.col("group") == "neočkovaní")["před"][0]),
+            int(df.filter(pl.col("group") == "neočkovaní")["po"][0]),
+        ],
+    ]
+    return fisher_exact(table, alternative="two-sided")[1]
+
+
+def before_after_df(
+    vax_map: dict[int, float], novax_map: dict[int, float], pivot: int = 0
+) -> pl.DataFrame:
+    def sums(m):
+        before = sum(v for d, v in m.items() if d < pivot)
+        after = sum(v for d, v in m.items() if d >= pivot)
+        return before, after
+
+    vb, va = sums(vax_map)
+    nb, na = sums(novax_map)
+    return pl.DataFrame(
+        {
+            "group": ["očkovaní", "neočkovaní"],
+            "před": [float(vb), float(nb)],
+            "po": [float(va), float(na)],
+        }
+    )
+
+
+def notebook_maps(
+    persons: list[Person],
+    start_date: date,
+    end_date: date,
+    vax_period_in_days: int,
+    onset_threshold: float = 0.5,
+) -> dict[str, defaultdict]:
+    """The maps of the notebook's metrics cell, by their variable names."""
+    vax_dates_map = defaultdict(lambda: defaultdict(list))
+    start_vax_date_map = defaultdict(dict)
+
+    novax_ppl_predpisy_map = defaultdict(lambda: defaultdict(int))
+    novax_ppl_prvopredpisy_map = defaultdict(lambda: defaultdict(int))
+    novax_ppl_prednison_equivs_map = defaultdict(lambda: defaultdict(float))
+    novax_ppl_imunosupresivy_map = defaultdict(lambda: defaultdict(int))
+
+    vax_ppl_prvopredpisy_map = defaultdict(
+        lambda: defaultdict(lambda: defaultdict(int))
+    )
+    vax_ppl_predpisy_map = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+    vax_ppl_prednison_equivs_map = defaultdict(
+        lambda: defaultdict(lambda: defaultdict(int))
+    )
+    vax_ppl_imunosupresivy_map = defaultdict(
+        lambda: defaultdict(lambda: defaultdict(int))
+    )
+
+    # --- Max vaccination dates by cohort ------------------------------------
+    for person in persons:
+        if person.died_at or not person.vaccines:
+            continue
+        for v in person.vaccines:
+            vax_dates_map[v.age_cohort][v.dose_number].append(v.date)
+
+    for cohort, doses in vax_dates_map.items():
+        for dose, dates in doses.items():
+            if not dates:
+                continue
+
+            # Spočítat denní počty
+            counts = Counter(dates)
+            sorted_counts = sorted(counts.items())  # [(date, count), ...]
+
+            # Najít maximum (peak)
+            max_day, max_count = max(counts.items(), key=lambda x: x[1])
+
+            # Najít první den, kdy to překročilo třeba 5 % maxima
+            threshold = max_count * onset_threshold
+            start_day = next(day for day, cnt in sorted_counts if cnt >= threshold)
+
+            start_vax_date_map[cohort][dose] = start_day
+
+    # --- NOVAX metrics -------------------------------------------------------
+    for p in persons:
+        if skip_person_for_novax(p, start_date, end_date):
+            continue
+
+        for pr in collapse_injections(p.prescriptions):
+            cohort = pr.age_cohort_at_prescription
+            if pr.prescription_type == PrescriptionType.IMUNOSUPRESSIVE:
+                novax_ppl_imunosupresivy_map[cohort][pr.date] += 1
+
+            novax_ppl_predpisy_map[cohort][pr.date] += 1
+            novax_ppl_prednison_equivs_map[cohort][pr.date] += pr.prednison_equiv
+
+        first = min(p.prescriptions, key=lambda x: x.date)
+        novax_ppl_prvopredpisy_map[first.age_cohort_at_prescription][first.date] += 1
+
+    # --- VAX metrics ---------------------------------------------------------
+    for p in persons:
+        if skip_person_for_vax(p, start_date, end_date):
+            continue
+
+        for v in p.vaccines:
+            max_int_date = start_vax_date_map[v.age_cohort][v.dose_number]
+            relative_date = (v.date - max_int_date).days
+            if relative_date > 2 * vax_period_in_days or relative_date < 0:
+                continue
+
+            # prescriptions relative to this vax
+            for pr in collapse_injections(p.prescriptions):
+                rel_day = (pr.date - v.date).days
+                if pr.prescription_type == PrescriptionType.IMUNOSUPRESSIVE:
+                    vax_ppl_imunosupresivy_map[v.age_cohort][v.dose_number][
+                        rel_day
+                    ] += 1
+
+                vax_ppl_predpisy_map[v.age_cohort][v.dose_number][rel_day] += 1
+                vax_ppl_prednison_equivs_map[v.age_cohort][v.dose_number][
+                    rel_day
+                ] += pr.prednison_equiv
+
+            first = min(p.prescriptions, key=lambda x: x.date)
+            rel_first = (first.date - v.date).days
+            vax_ppl_prvopredpisy_map[v.age_cohort][v.dose_number][rel_first] += 1
+
+    return {
+        "start_vax_date_map": start_vax_date_map,
+        "novax_ppl_predpisy_map": novax_ppl_predpisy_map,
+        "novax_ppl_prvopredpisy_map": novax_ppl_prvopredpisy_map,
+        "novax_ppl_prednison_equivs_map": novax_ppl_prednison_equivs_map,
+        "novax_ppl_imunosupresivy_map": novax_ppl_imunosupresivy_map,
+        "vax_ppl_predpisy_map": vax_ppl_predpisy_map,
+        "vax_ppl_prvopredpisy_map": vax_ppl_prvopredpisy_map,
+        "vax_ppl_prednison_equivs_map": vax_ppl_prednison_equivs_map,
+        "vax_ppl_imunosupresivy_map": vax_ppl_imunosupresivy_map,
+    }
+
+
+def notebook_results(
+    maps: dict[str, defaultdict],
+    vax_period_in_days: int,
+    periods: list[int] = [30, 60, 90, 180, 365],
+    doses: list[int] = [1, 2, 3],
+) -> pl.DataFrame:
+    """huge_df of the notebook's results cell, from notebook_maps."""
+    start_vax_date_map = maps["start_vax_date_map"]
+    rows = []
+
+    for PERIOD in periods:
+        for dose in doses:
+            for cohort in AgeCohort:
+                rozhodne = start_vax_date_map[cohort][dose] + timedelta(
+                    days=vax_period_in_days
+                )
+
+                start, end = rozhodne - timedelta(days=PERIOD), rozhodne + timedelta(
+                    days=PERIOD
+                )
+                rel_days = [
+                    (start + timedelta(days=i)) for i in range((end - start).days + 1)
+                ]
+
+                def novax_window(src_map):
+                    return {
+                        (d - rozhodne).days: src_map[cohort].get(d, 0) for d in rel_days
+                    }
+
+                def vax_window(src_map):
+                    return {
+                        day: src_map[cohort][dose].get(day, 0)
+                        for day in range(-PERIOD, PERIOD)
+                    }
+
+                metrics = {
+                    name: (
+                        vax_window(maps[f"vax_ppl_{source}_map"]),
+                        novax_window(maps[f"novax_ppl_{source}_map"]),
+                    )
+                    for name, source in [
+                        ("predpisy", "predpisy"),
+                        ("prvopredpisy", "prvopredpisy"),
+                        ("kortikoidy", "prednison_equivs"),
+                        ("imunosupresivy", "imunosupresivy"),
+                    ]
+                }
+
+                for metric_name, (vax_map, novax_map) in metrics.items():
+                    df = before_after_df(vax_map, novax_map)
+
+                    vax_b, vax_a = (
+                        df.filter(pl.col("group") == "očkovaní")
+                        .select(["před", "po"])
+                        .row(0)
+                    )
+                    nov_b, nov_a = (
+                        df.filter(pl.col("group") == "neočkovaní")
+                        .select(["před", "po"])
+                        .row(0)
+                    )
+
+                    vax_inc = safe_div(vax_a, vax_b) * 100 if vax_b else np.nan
+                    novax_inc = safe_div(nov_a, nov_b) * 100 if nov_b else np.nan
+                    diff = (
+                        (vax_inc - novax_inc)
+                        if (np.isfinite(vax_inc) and np.isfinite(novax_inc))
+                        else np.nan
+                    )
+                    p_val = pvalue_from_df(df)
+
+                    ratio = np.nan
+                    if (
+                        vax_b
+                        and nov_b
+                        and np.isfinite(vax_inc)
+                        and np.isfinite(novax_inc)
+                    ):
+                        ratio = safe_div(vax_a / vax_b, nov_a / nov_b)
+
+                    rows.append(
+                        {
+                            "period_days": PERIOD,
+                            "age_cohort": str(cohort),
+                            "vax_dose": int(dose),
+                            "metric": metric_name,
+                            "vax_increase": vax_inc,
+                            "novax_increase": novax_inc,
+                            "diff": diff,
+                            "p_value": p_val,
+                            "vax_before": vax_b,
+                            "vax_after": vax_a,
+                            "novax_before": nov_b,
+                            "novax_after": nov_a,
+                            "vax_vs_novax_ratio": ratio,
+                        }
+                    )
+
+    return pl.DataFrame(rows).sort(["age_cohort"])
@@ -0,0 +1,308 @@
+"""Timings and peak memory of the pipeline stages on synthetic extracts, and
+checks that the fast paths give the same results as the original code frozen
+in common.baseline.
+
+Every stage runs in a fresh spawned process, so its peak RSS is its own and
+not what earlier stages left behind.
+"""
+
+import math
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from multiprocessing import get_context
+
+import polars as pl
+
+from common.constants.column_names import SHARED_COLUMNS
+from common.constants.objects import Person
+
+STAGES = ["read", "convert", "convert_to_store", "ingest", "aggregate", "render"]
+# the analysis every stage after ingest runs, the CLI defaults
+START_DATE = date(2015, 1, 1)
+END_DATE = date(2025, 1, 1)
+VAX_PERIOD_IN_DAYS = 30
+ONSET_THRESHOLD = 0.5
+# the keys of a results grid row
+RESULT_KEYS = ["period_days", "age_cohort", "vax_dose", "metric"]
+
+
+def _memory_mb(field: str) -> float:
+    """VmRSS (now) or VmHWM (peak) of this process, from /proc/self/status.
+
+    ru_maxrss would carry over the peak of the process that spawned us, since
+    Linux keeps it across fork and exec.
+    """
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+    raise KeyError(field)
+
+
+def _reset_peak_memory() -> None:
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux >= 4.0)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _study(store):
+    from common.event_study import run_event_study
+
+    return run_event_study(
+        store, START_DATE, END_DATE, VAX_PERIOD_IN_DAYS, ONSET_THRESHOLD
+    )
+
+
+def _run_stage(
+    stage: str,
+    sources: dict[str, tuple[str, pl.Schema]],
+    store_directory: str,
+    output_directory: str,
+) -> dict:
+    """Set the stage up, then time it; runs in its own process."""
+    from common.converter import DataframeToPersonsClassConverter, read_preskladane_data
+
+    frames = {}
+    if stage in ("convert", "convert_to_store"):
+        frames = {
+            insurer: read_preskladane_data(file_path, schema)
+            for insurer, (file_path, schema) in sources.items()
+        }
+    if stage in ("aggregate", "render"):
+        from common.storage import read_store
+
+        store = read_store(store_directory, list(sources))
+    if stage == "render":
+        study = _study(store)
+    setup_rss = _memory_mb("VmRSS")
+    _reset_peak_memory()
+
+    start = time.perf_counter()
+    if stage == "read":
+        rows = sum(
+            read_preskladane_data(file_path, schema).height
+            for file_path, schema in sources.values()
+        )
+    elif stage == "convert":
+        rows = sum(
+            len(DataframeToPersonsClassConverter().convert(df))
+            for df in frames.values()
+        )
+    elif stage == "convert_to_store":
+        rows = sum(
+            len(DataframeToPersonsClassConverter().convert_to_store(df))
+            for df in frames.values()
+        )
+    elif stage == "ingest":
+        from common.converter import convert
+
+        convert(store_directory, sources=sources)
+        rows = None
+    elif stage == "aggregate":
+        rows = _study(store).results().height
+    elif stage == "render":
+        from common.onsets import daily_vaccinations
+        from common.render import render_charts, sums_charts, vax_timeline_charts
+
+        charts = vax_timeline_charts(
+            daily_vaccinations(store),
+            study.onset_map(),
+            output_directory,
+            VAX_PERIOD_IN_DAYS,
+        ) + sums_charts(study, "synthetic", output_directory)
+        rows = render_charts(charts, force=True)["rendered"]
+    seconds = time.perf_counter() - start
+
+    return {
+        "stage": stage,
+        "seconds": seconds,
+        "items": rows,
+        "setup_rss_mb": setup_rss,
+        "peak_rss_mb": _memory_mb("VmHWM"),
+        # process pools of ingest and render; ru_maxrss is in kilobytes and
+        # includes what the workers inherited from this process
+        "workers_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        / 1024,
+    }
+
+
+def run_benchmark(
+    sources: dict[str, tuple[str, pl.Schema]],
+    directory: str,
+    stages: list[str] = STAGES,
+) -> pl.DataFrame:
+    """Time every stage on the given extracts; the store and the charts are
+    written under directory. items: rows read, persons converted, result rows
+    or charts rendered."""
+    if unknown := set(stages) - set(STAGES):
+        raise ValueError(f"unknown stages {sorted(unknown)}, expected any of {STAGES}")
+    store_directory = os.path.join(directory, "persons")
+    output_directory = os.path.join(directory, "out")
+    if "ingest" not in stages and {"aggregate", "render"} & set(stages):
+        from common.converter import convert
+
+        convert(store_directory, sources=sources)
+
+    timings = []
+    for stage in sorted(stages, key=STAGES.index):
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=get_context("spawn")
+        ) as pool:
+            timings.append(
+                pool.submit(
+                    _run_stage, stage, sources, store_directory, output_directory
+                ).result()
+            )
+    return pl.DataFrame(timings)
+
+
+def _difference(expected, actual, path: str = "") -> str | None:
+    """Where two nested dicts of numbers differ (ignoring empty branches)."""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        keys = {k for k, v in expected.items() if v != {}}
+        other = {k for k, v in actual.items() if v != {}}
+        if keys != other:
+            return f"{path}: keys {sorted(map(str, keys ^ other))[:5]}"
+        for key in keys:
+            if found := _difference(expected[key], actual[key], f"{path}/{key}"):
+                return found
+        return None
+    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)):
+        if math.isclose(expected, actual, rel_tol=1e-9, abs_tol=1e-9):
+            return None
+    elif expected == actual:
+        return None
+    return f"{path}: {expected!r} != {actual!r}"
+
+
+def _person_key(person: Person) -> tuple:
+    # Stores keep prescriptions by date; compare them as a multiset
+    return (
+        str(person.id),
+        person.gender,
+        person.born_at,
+        person.zahajeni_pojisteni,
+        person.ukonceni_pojisteni,
+        person.age_cohort,
+        person.died_at,
+        [(v.date, v.dose_number, v.age_cohort, v.nazev) for v in person.vaccines],
+        sorted(
+            (
+                (
+                    p.date,
+                    p.latka,
+                    p.age_cohort_at_prescription,
+                    p.prescription_type,
+                    round(p.prednison_equiv, 6),
+                    p.equiv_sloucenina,
+                    p.specializace_lekare,
+                    p.atc_skupina,
+                    p.lekova_forma,
+                )
+                for p in person.prescriptions
+            ),
+            key=repr,
+        ),
+    )
+
+
+def _persons_difference(expected: list[Person], actual: list[Person]) -> str | None:
+    expected_keys = sorted(map(_person_key, expected), key=repr)
+    actual_keys = sorted(map(_person_key, actual), key=repr)
+    if len(expected_keys) != len(actual_keys):
+        return f"{len(expected_keys)} persons != {len(actual_keys)}"
+    for a, b in zip(expected_keys, actual_keys):
+        if a != b:
+            return f"person {a[0]}: {a} != {b}"
+    return None
+
+
+def _results_difference(expected: pl.DataFrame, actual: pl.DataFrame) -> str | None:
+    """How many cells of two results grids agree, None if all of them do."""
+    joined = expected.join(
+        actual, on=RESULT_KEYS, how="full", suffix="_actual", coalesce=True
+    )
+    values = [column for column in expected.columns if column not in RESULT_KEYS]
+    same = pl.all_horizontal(
+        (
+            pl.col(column).is_nan() & pl.col(f"{column}_actual").is_nan()
+            | ((pl.col(column) - pl.col(f"{column}_actual")).abs() <= 1e-9)
+            | (
+                (pl.col(column) - pl.col(f"{column}_actual")).abs()
+                <= 1e-9 * pl.col(column).abs()
+            )
+        ).fill_null(False)
+        for column in values
+    )
+    matching = joined.select(same.sum()).item()
+    if matching == expected.height == actual.height:
+        return None
+    first = joined.filter(~same.fill_null(False)).head(1).to_dicts()
+    return f"{matching}/{expected.height} rows match, first: {first}"
+
+
+def chronological(df: pl.DataFrame) -> pl.DataFrame:
+    """An extract's rows by person and date, same-day rows in file order."""
+    return df.sort(
+        SHARED_COLUMNS.ID_POJISTENCE.value,
+        SHARED_COLUMNS.DATUM_UDALOSTI.value,
+        nulls_last=True,
+        maintain_order=True,
+    )
+
+
+def verify(
+    sources: dict[str, tuple[str, pl.Schema]], rows: int = 50_000
+) -> dict[str, str | None]:
+    """Compare the fast paths with the original code frozen in common.baseline
+    on the first rows rows of every extract: persons, the notebook's maps and
+    its results grid. Returns check -> None if equal, else the first
+    difference.
+
+    Holds for chronological extracts only (rows sorted by person and date, as
+    the real ones and common.synthetic's are). The baseline numbers doses and
+    collapses injections in file order; the fast paths do both in date order,
+    whatever the row order, so on any extract they give what the baseline
+    gives on chronological(extract).
+    """
+    from common import baseline
+    from common.converter import DataframeToPersonsClassConverter, convert_parallel
+
+    frames = {
+        insurer: baseline.read_preskladane_data(file_path, schema).head(rows)
+        for insurer, (file_path, schema) in sources.items()
+    }
+    converter = DataframeToPersonsClassConverter()
+    stores = {insurer: converter.convert_to_store(df) for insurer, df in frames.items()}
+    parallel = convert_parallel(frames)
+
+    checks = {}
+    for insurer, df in frames.items():
+        persons = baseline.DataframeToPersonsClassConverter().convert(df)
+        for name, actual in [
+            ("convert", converter.convert(df)),
+            ("convert_to_store", stores[insurer].to_persons()),
+            ("convert_parallel", parallel[insurer].to_persons()),
+        ]:
+            checks[f"{insurer}: {name} == baseline"] = _persons_difference(
+                persons, actual
+            )
+
+        study = _study(stores[insurer])
+        maps = baseline.notebook_maps(
+            persons, START_DATE, END_DATE, VAX_PERIOD_IN_DAYS, ONSET_THRESHOLD
+        )
+        for name, actual in study.to_maps().items():
+            checks[f"{insurer}: event study {name} == baseline"] = _difference(
+                maps[name], actual, name
+            )
+        checks[f"{insurer}: results grid == baseline"] = _results_difference(
+            baseline.notebook_results(maps, VAX_PERIOD_IN_DAYS), study.results()
+        )
+    return checks
@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import MISSING, dataclass, fields
 from enum import StrEnum
 from datetime import datetime
 
@@ -16,7 +16,20 @@ class PrescriptionType(StrEnum):
     IMUNOSUPRESSIVE = "imunosupressive"
 
 
-@dataclass
+def _set_state(self, state) -> None:
+    """Unpickle both slotted state and the __dict__ of pickles written before
+    the classes had slots (e.g. old *_persons.pkl); fields added since then
+    get their defaults."""
+    if isinstance(state, tuple):
+        state = {**(state[0] or {}), **state[1]}
+    for field in fields(self):
+        if field.name in state:
+            setattr(self, field.name, state[field.name])
+        elif field.default is not MISSING:
+            setattr(self, field.name, field.default)
+
+
+@dataclass(slots=True)
 class Prescription:
     date: datetime
     latka: str
@@ -28,21 +41,25 @@ class Prescription:
     atc_skupina: str | None
     lekova_forma: str | None
 
+    __setstate__ = _set_state
+
 
-@dataclass
+@dataclass(slots=True)
 class Vaccine:
     date: datetime
     dose_number: int
     age_cohort: AgeCohort
     nazev: str | None
 
+    __setstate__ = _set_state
+
 
 class Gender(StrEnum):
     MALE = "male"
     FEMALE = "female"
 
 
-@dataclass
+@dataclass(slots=True)
 class Person:
     id: int | str
     gender: Gender
@@ -53,3 +70,6 @@ class Person:
     vaccines: list[Vaccine]
     prescriptions: list[Prescription]
     died_at: datetime | None = None
+    insurer: str | None = None
+
+    __setstate__ = _set_state
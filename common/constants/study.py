@@ -0,0 +1,10 @@
+# Stores behind each POJISTOVNA label of max_vax_analysis.ipynb
+INSURERS = {
+    "cpzp": ["cpzp"],
+    "ozp": ["ozp"],
+    "both_companies": ["cpzp", "ozp"],
+}
+
+# Before/after window lengths in days and the doses compared
+PERIODS = [30, 60, 90, 180, 365]
+DOSES = [1, 2, 3]
@@ -0,0 +1,538 @@
+import glob
+import os
+import polars as pl
+from functools import partial
+from common.constants.column_types import (
+    CPZP_SCHEMA,
+    OZP_SCHEMA,
+    TYP_UDALOSTI,
+)
+from common.constants.column_names import SHARED_COLUMNS, OZP_COLUMNS, CPZP_COLUMNS
+from common.constants.objects import (
+    AgeCohort,
+    Gender,
+    PrescriptionType,
+    Prescription,
+    Person,
+    Vaccine,
+)
+from common.drugs import DRUG_KEYS, drug_dimension
+from common.incremental import ingest_incremental
+from common.memory import string_pool
+from common.person_store import PersonStore, dose_numbers
+from common.storage import write_store
+from common.trace import rows, stage, traced
+from common.workers import process_pool
+from datetime import datetime
+
+# Columns the converter actually reads; the rest of the extract is never touched.
+INGEST_COLUMNS = [
+    SHARED_COLUMNS.ID_POJISTENCE.value,
+    SHARED_COLUMNS.POHLAVI.value,
+    SHARED_COLUMNS.ROK_NAROZENI.value,
+    CPZP_COLUMNS.MESIC_NAROZENI.value,
+    SHARED_COLUMNS.DATUM_UMRTI.value,
+    SHARED_COLUMNS.POSLEDNI_ZAHAJENI_POJISTENI.value,
+    SHARED_COLUMNS.POSLEDNI_UKONCENI_POJISTENI.value,
+    SHARED_COLUMNS.TYP_UDALOSTI.value,
+    SHARED_COLUMNS.DATUM_UDALOSTI.value,
+    CPZP_COLUMNS.KOD_UDALOSTI.value,
+    SHARED_COLUMNS.LECIVE_LATKY.value,
+    SHARED_COLUMNS.EQUIV_SLOUCENINA.value,
+    SHARED_COLUMNS.PREDNISON_EQUIV.value,
+    SHARED_COLUMNS.POCET_BALENI.value,
+    SHARED_COLUMNS.POCET_V_BALENI.value,
+    SHARED_COLUMNS.SILA.value,
+    CPZP_COLUMNS.SPECIALIZACE.value,
+    SHARED_COLUMNS.ATC_SKUPINA.value,
+    SHARED_COLUMNS.LEKOVA_FORMA.value,
+]
+
+
+@traced()
+def read_preskladane_data(
+    file_path: str, schema: pl.Schema, lazy: bool = False
+) -> pl.DataFrame | pl.LazyFrame:
+    if lazy:
+        return scan_preskladane_data(file_path, schema)
+
+    return pl.read_csv(
+        file_path,
+        null_values=["NA", ""],
+        schema=schema,
+    )
+
+
+def scan_preskladane_data(file_path: str, schema: pl.Schema) -> pl.LazyFrame:
+    # Nothing is read until the converter collects, so only INGEST_COLUMNS are
+    # parsed and the event filters end up inside the scan.
+    return pl.scan_csv(
+        file_path,
+        null_values=["NA", ""],
+        schema=schema,
+    ).select([column for column in INGEST_COLUMNS if column in schema])
+
+
+class DataframeToPersonsClassConverter:
+    def __init__(
+        self, streaming: bool = False, compact: bool = False, insurer: str | None = None
+    ):
+        self.streaming = streaming
+        self.compact = compact
+        self.insurer = insurer
+
+    def __column(self, columns: list[str], name: str) -> pl.Expr:
+        # Columns only one insurer has become typed nulls in the other's
+        # extracts, so both schemas go through the same plan
+        if name in columns:
+            return pl.col(name)
+        return pl.lit(None, dtype=CPZP_SCHEMA[name]).alias(name)
+
+    def __person_aggregations(self, columns: list[str]) -> list[pl.Expr]:
+        return [
+            pl.first(SHARED_COLUMNS.POHLAVI.value).alias("gender"),
+            pl.first(SHARED_COLUMNS.ROK_NAROZENI.value).alias("birth_year"),
+            self.__column(columns, CPZP_COLUMNS.MESIC_NAROZENI.value)
+            .first()
+            .alias("birth_month"),
+            pl.first(SHARED_COLUMNS.DATUM_UMRTI.value).alias("death_date"),
+            pl.first(SHARED_COLUMNS.POSLEDNI_ZAHAJENI_POJISTENI.value).alias(
+                "Posledni_zahajeni_pojisteni"
+            ),
+            pl.first(SHARED_COLUMNS.POSLEDNI_UKONCENI_POJISTENI.value).alias(
+                "Posledni_ukonceni_pojisteni"
+            ),
+        ]
+
+    def __is_event(self, event_type: TYP_UDALOSTI) -> pl.Expr:
+        return (pl.col(SHARED_COLUMNS.TYP_UDALOSTI.value) == event_type) & pl.col(
+            SHARED_COLUMNS.DATUM_UDALOSTI.value
+        ).is_not_null()
+
+    def __drug_keys(self) -> list[pl.Expr]:
+        """The DRUG_KEYS of every event row."""
+        return [
+            pl.col(SHARED_COLUMNS.LECIVE_LATKY.value)
+            .cast(pl.Categorical)
+            .alias("latka"),
+            pl.col(SHARED_COLUMNS.SILA.value).cast(pl.Categorical).alias("sila"),
+            pl.col(SHARED_COLUMNS.EQUIV_SLOUCENINA.value)
+            .cast(pl.String)
+            .cast(pl.Categorical)
+            .alias("equiv_sloucenina"),
+            pl.col(SHARED_COLUMNS.LEKOVA_FORMA.value)
+            .cast(pl.Categorical)
+            .alias("lekova_forma"),
+            pl.col(SHARED_COLUMNS.ATC_SKUPINA.value)
+            .cast(pl.Categorical)
+            .alias("atc_skupina"),
+            pl.col(SHARED_COLUMNS.POCET_V_BALENI.value).alias("pocet_v_baleni"),
+            pl.col(SHARED_COLUMNS.PREDNISON_EQUIV.value).alias("equiv_factor"),
+        ]
+
+    def __extract_persons(self, lf: pl.LazyFrame, drugs: pl.DataFrame) -> pl.LazyFrame:
+        """One row per person with its attributes, prescriptions and vaccines
+        (as lists), all from a single group_by over the events. Prescriptions
+        take their type and prednison equivalent from drugs."""
+        columns = lf.collect_schema().names()
+        is_prescription = self.__is_event(TYP_UDALOSTI.PREDPIS)
+        is_vaccine = self.__is_event(TYP_UDALOSTI.VAKCINACE)
+        prednison_equiv = (
+            pl.col("prednison_per_pack") * pl.col(SHARED_COLUMNS.POCET_BALENI.value)
+        ).fill_null(0.0)
+
+        prescription_columns = {
+            "prescription_dates": pl.col(SHARED_COLUMNS.DATUM_UDALOSTI.value),
+            "latka": pl.col("latka"),
+            "equiv_sloucenina": pl.col("equiv_sloucenina"),
+            "prednison_equiv": prednison_equiv,
+            "prescription_type": pl.col("prescription_type"),
+            "Specializace": self.__column(columns, CPZP_COLUMNS.SPECIALIZACE.value),
+            "ATC_skupina": pl.col("atc_skupina"),
+            "léková_forma": pl.col("lekova_forma"),
+        }
+        vaccine_date = pl.col(SHARED_COLUMNS.DATUM_UDALOSTI.value)
+        vaccine_columns = {
+            "vaccine_dates": vaccine_date,
+            "nazev": self.__column(columns, CPZP_COLUMNS.KOD_UDALOSTI.value),
+        }
+        return (
+            lf.with_columns(self.__drug_keys())
+            .join(
+                drugs.lazy().select(
+                    *DRUG_KEYS, "prednison_per_pack", "prescription_type"
+                ),
+                on=DRUG_KEYS,
+                how="left",
+                nulls_equal=True,
+                maintain_order="left",
+            )
+            .group_by(SHARED_COLUMNS.ID_POJISTENCE.value)
+            .agg(
+                *self.__person_aggregations(columns),
+                *(
+                    column.filter(is_prescription).alias(alias)
+                    for alias, column in prescription_columns.items()
+                ),
+                # in dose order, as numbered by person_store.dose_numbers
+                *(
+                    column.filter(is_vaccine)
+                    .sort_by(vaccine_date.filter(is_vaccine), maintain_order=True)
+                    .alias(alias)
+                    for alias, column in vaccine_columns.items()
+                ),
+            )
+        )
+
+    def drug_dimension(self, df: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame:
+        """The drugs (common.drugs.drug_dimension) prescribed in an extract."""
+        return drug_dimension(
+            df.lazy()
+            .filter(self.__is_event(TYP_UDALOSTI.PREDPIS))
+            .select(self.__drug_keys())
+            .unique()
+            .collect(engine="streaming" if self.streaming else "auto")
+        )
+
+    @traced("DataframeToPersonsClassConverter.convert")
+    def convert(self, df: pl.DataFrame | pl.LazyFrame) -> list[Person]:
+        persons = []
+        intern = string_pool() if self.compact else lambda value: value
+        prescription_types = {kind.value: kind for kind in PrescriptionType}
+
+        # A scanned CSV only ever materializes the projected rows, and the
+        # person attributes and event lists come out of one grouped pass.
+        # Strengths are parsed once per distinct pack, not per prescription.
+        with stage("drugs", rows(df)) as record:
+            drugs = self.drug_dimension(df)
+            record.rows_out = drugs.height
+        with stage("extract", rows(df)) as extract:
+            combined = self.__extract_persons(df.lazy(), drugs).collect(
+                engine="streaming" if self.streaming else "auto"
+            )
+            extract.rows_out = combined.height
+
+        # Convert to Person objects
+        with stage("build_persons", combined.height) as build:
+            for row in combined.iter_rows(named=True):
+                person_id = row[SHARED_COLUMNS.ID_POJISTENCE.value]
+
+                # Convert gender
+                gender_code = row["gender"]
+                gender = Gender.MALE if gender_code == "M" else Gender.FEMALE
+
+                # Create birth date
+                birth_year = row["birth_year"]
+                birth_month = row["birth_month"]
+                born_at = self.__create_birth_date(birth_year, birth_month)
+
+                # Death date
+                died_at = row["death_date"]
+
+                # Process prescriptions
+                prescriptions = []
+                prescription_dates = row["prescription_dates"]
+                latka = row["latka"]
+                equiv_sloucenina = row["equiv_sloucenina"]
+                prednison_equiv = row["prednison_equiv"]
+                specializace_lekare = row["Specializace"]
+                atc_skupina = row["ATC_skupina"]
+                lekova_forma = row["léková_forma"]
+                prescription_type = row["prescription_type"]
+
+                for i, date in enumerate(prescription_dates):
+                    age_cohort = self.__calculate_age_cohort(born_at, date)
+                    prescriptions.append(
+                        Prescription(
+                            date=date,
+                            latka=intern(latka[i]),
+                            equiv_sloucenina=intern(equiv_sloucenina[i]),
+                            prednison_equiv=prednison_equiv[i],
+                            specializace_lekare=intern(specializace_lekare[i]),
+                            atc_skupina=intern(atc_skupina[i]),
+                            age_cohort_at_prescription=age_cohort,
+                            prescription_type=prescription_types[prescription_type[i]],
+                            lekova_forma=intern(lekova_forma[i]),
+                        )
+                    )
+
+                # Process vaccines
+                vaccine_dates = row["vaccine_dates"]
+                nazev = row["nazev"]
+                vaccines = []
+                for i, vaccine_date in enumerate(vaccine_dates):
+                    age_cohort_at_vaccination = self.__calculate_age_cohort(
+                        born_at, vaccine_date
+                    )
+                    vaccines.append(
+                        Vaccine(
+                            date=vaccine_date,
+                            dose_number=i + 1,  # Dose number starts from 1
+                            age_cohort=age_cohort_at_vaccination,
+                            nazev=intern(nazev[i]),
+                        )
+                    )
+
+                # Create Person object
+                person_age_cohort = (
+                    self.__calculate_age_cohort(born_at, died_at)
+                    if died_at is not None
+                    else self.__calculate_age_cohort(born_at, datetime.now())
+                )
+                person = Person(
+                    id=person_id,
+                    gender=gender,
+                    born_at=born_at,
+                    zahajeni_pojisteni=row["Posledni_zahajeni_pojisteni"],
+                    ukonceni_pojisteni=row["Posledni_ukonceni_pojisteni"],
+                    vaccines=vaccines,
+                    prescriptions=prescriptions,
+                    died_at=died_at,
+                    age_cohort=person_age_cohort,
+                    insurer=self.insurer,
+                )
+
+                persons.append(person)
+            build.rows_out = len(persons)
+
+        return persons
+
+    def convert_vectorized(self, df: pl.DataFrame | pl.LazyFrame) -> list[Person]:
+        return self.convert_to_store(df).to_persons(self.compact)
+
+    def convert_to_store(self, df: pl.DataFrame | pl.LazyFrame) -> PersonStore:
+        return PersonStore.from_frames(*self.to_frames(df))
+
+    def to_frames(
+        self, df: pl.DataFrame | pl.LazyFrame
+    ) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame]:
+        """Columnar equivalent of convert: persons, prescriptions and vaccines
+        tables keyed by "id", with column names matching the dataclass fields.
+        Prescriptions carry their pack count and DRUG_KEYS instead of the drug
+        attributes, which PersonStore.from_frames derives per drug."""
+        lf = df.lazy()
+        columns = lf.collect_schema().names()
+        person_id = SHARED_COLUMNS.ID_POJISTENCE.value
+        event_date = pl.col(SHARED_COLUMNS.DATUM_UDALOSTI.value)
+
+        person_info = (
+            lf.group_by(person_id)
+            .agg(self.__person_aggregations(columns))
+            .with_columns(pl.col("birth_month").fill_null(1))
+        )
+        birth = person_info.select(person_id, "birth_year", "birth_month")
+
+        persons = person_info.select(
+            pl.col(person_id).alias("id"),
+            pl.when(pl.col("gender") == "M")
+            .then(pl.lit(Gender.MALE.value))
+            .otherwise(pl.lit(Gender.FEMALE.value))
+            .cast(pl.Enum(Gender))
+            .alias("gender"),
+            pl.datetime(pl.col("birth_year"), pl.col("birth_month"), 1).alias(
+                "born_at"
+            ),
+            pl.col("Posledni_zahajeni_pojisteni").alias("zahajeni_pojisteni"),
+            pl.col("Posledni_ukonceni_pojisteni").alias("ukonceni_pojisteni"),
+            self.__age_cohort_expr(
+                pl.coalesce(pl.col("death_date"), pl.lit(datetime.now().date()))
+            ).alias("age_cohort"),
+            pl.col("death_date").alias("died_at"),
+            pl.lit(self.insurer, dtype=pl.Categorical).alias("insurer"),
+        )
+
+        # Drug attributes are derived per distinct pack when the store is built
+        prescriptions = (
+            lf.filter(self.__is_event(TYP_UDALOSTI.PREDPIS))
+            .join(birth, on=person_id, how="left", maintain_order="left")
+            .select(
+                pl.col(person_id).alias("id"),
+                event_date.alias("date"),
+                self.__age_cohort_expr(event_date).alias("age_cohort_at_prescription"),
+                self.__column(columns, CPZP_COLUMNS.SPECIALIZACE.value)
+                .cast(pl.Categorical)
+                .alias("specializace_lekare"),
+                pl.col(SHARED_COLUMNS.POCET_BALENI.value).alias("pocet_baleni"),
+                *self.__drug_keys(),
+            )
+        )
+
+        vaccines = (
+            lf.filter(self.__is_event(TYP_UDALOSTI.VAKCINACE))
+            .with_columns(
+                dose_numbers(person_id, SHARED_COLUMNS.DATUM_UDALOSTI.value).alias(
+                    "dose_number"
+                )
+            )
+            .join(birth, on=person_id, how="left", maintain_order="left")
+            .select(
+                pl.col(person_id).alias("id"),
+                event_date.alias("date"),
+                pl.col("dose_number").cast(pl.Int64),
+                self.__age_cohort_expr(event_date).alias("age_cohort"),
+                self.__column(columns, CPZP_COLUMNS.KOD_UDALOSTI.value)
+                .cast(pl.Categorical)
+                .alias("nazev"),
+            )
+        )
+
+        with stage("DataframeToPersonsClassConverter.to_frames", rows(df)) as record:
+            persons_df, prescriptions_df, vaccines_df = pl.collect_all(
+                [persons, prescriptions, vaccines],
+                engine="streaming" if self.streaming else "auto",
+            )
+            record.rows_out = persons_df.height
+        return persons_df, prescriptions_df, vaccines_df
+
+    def __age_cohort_expr(self, event_date: pl.Expr) -> pl.Expr:
+        # Same rule as __calculate_age_cohort; births are on the 1st of the
+        # month, so only the month decides whether the birthday has passed
+        age = (
+            event_date.dt.year().cast(pl.Int64)
+            - pl.col("birth_year")
+            - (event_date.dt.month() < pl.col("birth_month")).cast(pl.Int64)
+        )
+        return (
+            pl.when(age < 12)
+            .then(pl.lit(AgeCohort.LESS_THAN_12.value))
+            .when(age < 30)
+            .then(pl.lit(AgeCohort.BETWEEN_12_AND_30.value))
+            .when(age < 50)
+            .then(pl.lit(AgeCohort.BETWEEN_30_AND_50.value))
+            .when(age < 60)
+            .then(pl.lit(AgeCohort.BETWEEN_50_AND_60.value))
+            .otherwise(pl.lit(AgeCohort.MORE_THAN_60.value))
+            .cast(pl.Enum(AgeCohort))
+        )
+
+    def __create_birth_date(self, year: int, month: int | None) -> datetime:
+        month = month if month is not None else 1
+        return datetime(year, month, 1)
+
+    def __calculate_age_cohort(
+        self, birth_date: datetime, event_date: datetime
+    ) -> AgeCohort:
+        age = event_date.year - birth_date.year
+
+        if event_date.month < birth_date.month or (
+            event_date.month == birth_date.month and event_date.day < birth_date.day
+        ):
+            age -= 1
+
+        if age < 12:
+            return AgeCohort.LESS_THAN_12
+        elif age < 30:
+            return AgeCohort.BETWEEN_12_AND_30
+        elif age < 50:
+            return AgeCohort.BETWEEN_30_AND_50
+        elif age < 60:
+            return AgeCohort.BETWEEN_50_AND_60
+        else:
+            return AgeCohort.MORE_THAN_60
+
+
+SOURCES = {
+    "cpzp": ("./DATACON_data/CPZP_preskladane.csv", CPZP_SCHEMA),
+    "ozp": ("./DATACON_data/OZP_preskladane.csv", OZP_SCHEMA),
+}
+
+
+def _convert_partition(
+    partition: pl.DataFrame | pl.LazyFrame, insurer: str, streaming: bool
+) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame]:
+    return DataframeToPersonsClassConverter(
+        streaming=streaming, insurer=insurer
+    ).to_frames(partition)
+
+
+@traced()
+def convert_parallel(
+    frames: dict[str, pl.DataFrame | pl.LazyFrame],
+    partitions: int | None = None,
+    max_workers: int | None = None,
+    streaming: bool = False,
+) -> dict[str, PersonStore]:
+    """Convert several insurers at once in one process pool.
+
+    Every insurer's events are hash-partitioned by Id_pojistence, so all rows
+    of a person land in the same partition and the result is the same person
+    set as the serial convert_to_store. Lazy frames are never collected here:
+    each worker gets the scan with the filter of its hash bucket and reads
+    only its share of the extract.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    partitions = partitions or max_workers
+    person_id = SHARED_COLUMNS.ID_POJISTENCE.value
+
+    jobs = [
+        (
+            insurer,
+            df.filter(pl.col(person_id).hash(seed=0) % partitions == partition),
+        )
+        for insurer, df in frames.items()
+        for partition in range(partitions)
+    ]
+
+    with (
+        stage("convert_partitions", len(jobs)),
+        process_pool(max_workers) as pool,
+    ):
+        results = list(
+            pool.map(
+                _convert_partition,
+                [part for _, part in jobs],
+                [insurer for insurer, _ in jobs],
+                [streaming] * len(jobs),
+            )
+        )
+
+    stores = {}
+    for insurer in frames:
+        converted = [
+            result for (owner, _), result in zip(jobs, results) if owner == insurer
+        ]
+        with stage("merge_partitions") as record:
+            stores[insurer] = PersonStore.from_frames(
+                *(pl.concat([tables[i] for tables in converted]) for i in range(3))
+            )
+            record.rows_out = len(stores[insurer])
+    return stores
+
+
+@traced()
+def convert(
+    directory: str = "DATACON_data/persons",
+    incremental: bool = False,
+    sources: dict[str, tuple[str, pl.Schema]] = SOURCES,
+    max_workers: int | None = None,
+) -> None:
+    """Convert the preskladane extracts of every insurer to the persons store.
+
+    With incremental=True only new or changed extracts
+    (<INSURER>_preskladane*.csv) are converted and merged into the store.
+    """
+    if incremental:
+        for insurer, (file_path, schema) in sources.items():
+            files = sorted(glob.glob(file_path.replace(".csv", "*.csv")))
+            summary = ingest_incremental(
+                files,
+                partial(scan_preskladane_data, schema=schema),
+                DataframeToPersonsClassConverter(streaming=True, insurer=insurer),
+                directory,
+                insurer,
+            )
+            print(
+                f"✓ {insurer}: {len(summary['changed_partitions'])} partitions updated"
+            )
+        return
+
+    stores = convert_parallel(
+        {
+            insurer: read_preskladane_data(file_path, schema, lazy=True)
+            for insurer, (file_path, schema) in sources.items()
+        },
+        max_workers=max_workers,
+        streaming=True,
+    )
+    for insurer, store in stores.items():
+        write_store(store, directory, insurer, source=sources[insurer][0])
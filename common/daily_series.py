@@ -0,0 +1,108 @@
+from dataclasses import dataclass
+from datetime import date
+
+import numpy as np
+import polars as pl
+
+from common.constants.objects import AgeCohort
+
+COHORTS = list(AgeCohort)
+COHORT_INDEX = {cohort: i for i, cohort in enumerate(COHORTS)}
+EPOCH = date(1970, 1, 1)
+
+
+def day_number(day: date) -> int:
+    """Days since 1970-01-01, the physical value of a Polars Date."""
+    return (day - EPOCH).days
+
+
+def cohort_index(cohort) -> np.ndarray:
+    if isinstance(cohort, str):
+        return np.int64(COHORT_INDEX[AgeCohort(cohort)])
+    return np.array([COHORT_INDEX[AgeCohort(c)] for c in cohort], dtype=np.int64)
+
+
+@dataclass
+class DailySeries:
+    """Dense daily values indexed by [cohort, dose, day - first_day].
+
+    Days are integers: relative days for the VAX arm, day_number() of the
+    calendar date for the NOVAX arm (which has a single dose slot). The
+    prefix sums make any window total two lookups, and the whole thing is
+    plain NumPy, so it pickles for caching.
+    """
+
+    values: np.ndarray
+    cumsum: np.ndarray
+    first_day: int
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pl.DataFrame,
+        metric: str,
+        day_column: str,
+        dose_column: str | None = None,
+        n_doses: int | None = None,
+    ) -> "DailySeries":
+        days = df[day_column].to_physical().to_numpy().astype(np.int64)
+        cohorts = df["age_cohort"].cast(pl.Enum(AgeCohort)).to_physical().to_numpy()
+        doses = (
+            df[dose_column].to_numpy().astype(np.int64) - 1
+            if dose_column is not None
+            else np.zeros(df.height, dtype=np.int64)
+        )
+        first_day = int(days.min()) if df.height else 0
+        n_days = int(days.max()) - first_day + 1 if df.height else 0
+        if n_doses is None:
+            n_doses = int(doses.max()) + 1 if df.height else 1
+
+        metric_values = df[metric].to_numpy()
+        dtype = (
+            np.int64 if np.issubdtype(metric_values.dtype, np.integer) else np.float64
+        )
+        values = np.zeros((len(COHORTS), n_doses, n_days), dtype=dtype)
+        np.add.at(values, (cohorts, doses, days - first_day), metric_values)
+        return cls.from_values(values, first_day)
+
+    @classmethod
+    def from_values(cls, values: np.ndarray, first_day: int) -> "DailySeries":
+        cumsum = np.zeros(values.shape[:2] + (values.shape[2] + 1,), dtype=values.dtype)
+        np.cumsum(values, axis=2, out=cumsum[:, :, 1:])
+        return cls(values=values, cumsum=cumsum, first_day=first_day)
+
+    def __index(self, cohort, dose) -> tuple[np.ndarray, np.ndarray]:
+        doses = np.asarray(dose if dose is not None else 1, dtype=np.int64) - 1
+        return cohort_index(cohort), doses
+
+    def window_sum(self, cohort, dose, start, stop):
+        """Total over days [start, stop); cohort, dose, start and stop may be
+        scalars or broadcastable arrays. dose is None for single-dose series."""
+        cohorts, doses = self.__index(cohort, dose)
+        n_days = self.values.shape[2]
+        start_i = np.clip(np.asarray(start) - self.first_day, 0, n_days)
+        stop_i = np.clip(np.asarray(stop) - self.first_day, 0, n_days)
+        stop_i = np.maximum(stop_i, start_i)
+        return (
+            self.cumsum[cohorts, doses, stop_i] - self.cumsum[cohorts, doses, start_i]
+        )
+
+    def before_after(self, cohort, dose, pivot, before_days, after_days):
+        """Totals over [pivot - before_days, pivot) and [pivot, pivot + after_days)."""
+        pivot = np.asarray(pivot)
+        return (
+            self.window_sum(cohort, dose, pivot - before_days, pivot),
+            self.window_sum(cohort, dose, pivot, pivot + after_days),
+        )
+
+    def window(self, cohort, dose: int | None, start: int, stop: int) -> np.ndarray:
+        """Daily values over [start, stop), zero outside the recorded range."""
+        cohorts, doses = self.__index(cohort, dose)
+        out = np.zeros(stop - start, dtype=self.values.dtype)
+        lo = max(start, self.first_day)
+        hi = min(stop, self.first_day + self.values.shape[2])
+        if lo < hi:
+            out[lo - start : hi - start] = self.values[
+                cohorts, doses, lo - self.first_day : hi - self.first_day
+            ]
+        return out
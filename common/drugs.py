@@ -0,0 +1,110 @@
+import polars as pl
+
+from common.constants.objects import PrescriptionType
+
+DRUG_ID = "drug_id"
+# A drug is one distinct pack; prescriptions keep its drug_id and how many
+# packs were prescribed (pocet_baleni)
+DRUG_KEYS = [
+    "latka",
+    "sila",
+    "equiv_sloucenina",
+    "lekova_forma",
+    "atc_skupina",
+    "pocet_v_baleni",
+    "equiv_factor",
+]
+INJECTION_FORMS = ["Injekční suspenze", "Injekční/infuzní roztok"]
+
+
+def parse_strength(sila: pl.Expr) -> pl.Expr:
+    """Strength in mg (per ml) of a síla string: "5MG" -> 5.0, "2,5MG/ML" -> 2.5."""
+    return (
+        sila.cast(pl.String)
+        .str.replace_all("MG", "", literal=True)
+        .str.replace_all(",", ".", literal=True)
+        .str.replace_all("/ML", "", literal=True)
+        .cast(pl.Float64, strict=False)
+    )
+
+
+def drug_dimension(prescriptions: pl.DataFrame) -> pl.DataFrame:
+    """One row per distinct DRUG_KEYS of the prescriptions, drug_id being the
+    row number, with what every prescription of it shares: the parsed
+    strength, the prednison equivalent of one pack (0 where the extract lacks
+    a factor), whether it is an injection and its prescription type."""
+    strength = parse_strength(pl.col("sila"))
+    factors = [pl.col("equiv_factor"), pl.col("pocet_v_baleni"), pl.col("sila")]
+    return (
+        prescriptions.select(DRUG_KEYS)
+        .unique(maintain_order=True)
+        .with_row_index(DRUG_ID)
+        .with_columns(
+            strength.alias("strength"),
+            pl.when(
+                pl.all_horizontal([c.is_not_null() for c in factors])
+                & (pl.col("sila").cast(pl.String) != "")
+            )
+            .then(pl.col("equiv_factor") * pl.col("pocet_v_baleni") * strength)
+            .otherwise(0.0)
+            .alias("prednison_per_pack"),
+            pl.col("lekova_forma")
+            .cast(pl.String)
+            .is_in(INJECTION_FORMS)
+            .fill_null(False)
+            .alias("is_injection"),
+            pl.when(pl.col("atc_skupina").cast(pl.String).str.starts_with("L04"))
+            .then(pl.lit(PrescriptionType.IMUNOSUPRESSIVE.value))
+            .otherwise(pl.lit(PrescriptionType.KORTIKOID.value))
+            .cast(pl.Enum(PrescriptionType))
+            .alias("prescription_type"),
+        )
+    )
+
+
+def normalize(
+    prescriptions: pl.DataFrame, drugs: pl.DataFrame | None = None
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """Replace the DRUG_KEYS of prescriptions by a drug_id into drugs, which
+    is built from them unless given (it must then hold every drug)."""
+    if drugs is None:
+        drugs = drug_dimension(prescriptions)
+    prescriptions = prescriptions.join(
+        drugs.select(DRUG_ID, *DRUG_KEYS),
+        on=DRUG_KEYS,
+        how="left",
+        nulls_equal=True,
+        maintain_order="left",
+    ).drop(DRUG_KEYS)
+    return drugs, prescriptions
+
+
+def merge_dimensions(dimensions: list[pl.DataFrame]) -> tuple[pl.DataFrame, list]:
+    """One drug dimension for several, and for each of them the new drug_id of
+    its drugs (indexed by their old drug_id)."""
+    merged = drug_dimension(pl.concat([d.select(DRUG_KEYS) for d in dimensions]))
+    remaps = [
+        normalize(dimension.select(DRUG_KEYS), merged)[1][DRUG_ID].to_numpy()
+        for dimension in dimensions
+    ]
+    return merged, remaps
+
+
+def drug_columns(
+    prescriptions: pl.DataFrame, drugs: pl.DataFrame, columns: list[str]
+) -> list[pl.Series]:
+    """The given drug columns for every prescription. "prednison_equiv" is the
+    prescription's total, prednison_per_pack * pocet_baleni (0 without packs)."""
+    ids = prescriptions[DRUG_ID]
+    series = []
+    for column in columns:
+        if column == "prednison_equiv":
+            per_pack = drugs["prednison_per_pack"].gather(ids)
+            series.append(
+                (per_pack * prescriptions["pocet_baleni"])
+                .fill_null(0.0)
+                .alias("prednison_equiv")
+            )
+        else:
+            series.append(drugs[column].gather(ids))
+    return series
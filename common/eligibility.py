@@ -0,0 +1,125 @@
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import numpy as np
+import polars as pl
+
+from common.daily_series import day_number
+
+# coverage without an end date lasts past any study window
+OPEN_END = np.iinfo(np.int64).max
+
+
+def sliding_windows(
+    first_start: date, last_start: date, length_in_days: int, step_in_days: int
+) -> list[tuple[date, date]]:
+    """(start_date, end_date) windows of the given length, their starts
+    step_in_days apart from first_start up to last_start."""
+    return [
+        (start, start + timedelta(days=length_in_days))
+        for start in (
+            first_start + timedelta(days=offset)
+            for offset in range(0, (last_start - first_start).days + 1, step_in_days)
+        )
+    ]
+
+
+@dataclass
+class CoverageIndex:
+    """The study eligibility rules of the notebook's skip_person_for_novax and
+    skip_person_for_vax, for any (start_date, end_date) window.
+
+    A person is eligible if insured from start_date (or earlier) to end_date
+    (or later), never died and has some prescription; the vax study wants
+    persons with vaccines, the novax study persons without. Only the coverage
+    interval depends on the window, so persons failing the other rules are
+    dropped once and the rest sorted by coverage start: a window's candidates
+    are then a prefix of them, found by binary search, whose coverage end is
+    checked in one vectorized comparison.
+    """
+
+    # person rows, sorted by start_days
+    persons: np.ndarray
+    start_days: np.ndarray
+    end_days: np.ndarray
+    vaccinated: np.ndarray
+    n_persons: int
+
+    @classmethod
+    def build(
+        cls,
+        persons: pl.DataFrame,
+        prescription_counts: np.ndarray,
+        vaccine_counts: np.ndarray,
+    ) -> "CoverageIndex":
+        """From a PersonStore's persons and event counts (row i = person i)."""
+        columns = persons.select(
+            pl.col("zahajeni_pojisteni").to_physical().cast(pl.Int64).alias("start"),
+            pl.col("ukonceni_pojisteni")
+            .to_physical()
+            .cast(pl.Int64)
+            .fill_null(OPEN_END)
+            .alias("end"),
+            (
+                pl.col("died_at").is_null()
+                & pl.col("zahajeni_pojisteni").is_not_null()
+                & pl.Series(prescription_counts > 0)
+            ).alias("candidate"),
+        )
+        candidates = np.flatnonzero(columns["candidate"].to_numpy())
+        start_days = columns["start"].to_numpy()[candidates]
+        order = np.argsort(start_days, kind="stable")
+        candidates = candidates[order]
+        return cls(
+            persons=candidates,
+            start_days=start_days[order],
+            end_days=columns["end"].to_numpy()[candidates],
+            vaccinated=vaccine_counts[candidates] > 0,
+            n_persons=persons.height,
+        )
+
+    def __selected(
+        self, start_date: date, end_date: date, vaccinated: bool | None
+    ) -> np.ndarray:
+        # positions among the candidates, in coverage start order
+        covered = np.searchsorted(self.start_days, day_number(start_date), "right")
+        keep = self.end_days[:covered] >= day_number(end_date)
+        if vaccinated is not None:
+            keep &= self.vaccinated[:covered] == vaccinated
+        return self.persons[:covered][keep]
+
+    def eligible(
+        self, start_date: date, end_date: date, vaccinated: bool | None = None
+    ) -> np.ndarray:
+        """Sorted rows of the persons eligible for the window; vaccinated=None
+        ignores vaccines."""
+        return np.sort(self.__selected(start_date, end_date, vaccinated))
+
+    def eligible_many(
+        self, windows: list[tuple[date, date]], vaccinated: bool | None = None
+    ) -> list[np.ndarray]:
+        return [
+            self.eligible(start_date, end_date, vaccinated)
+            for start_date, end_date in windows
+        ]
+
+    def masks(
+        self, windows: list[tuple[date, date]], vaccinated: bool | None = None
+    ) -> np.ndarray:
+        """(window, person) boolean matrix of eligibility."""
+        masks = np.zeros((len(windows), self.n_persons), dtype=bool)
+        for i, (start_date, end_date) in enumerate(windows):
+            masks[i, self.__selected(start_date, end_date, vaccinated)] = True
+        return masks
+
+    def counts(
+        self, windows: list[tuple[date, date]], vaccinated: bool | None = None
+    ) -> np.ndarray:
+        """Number of eligible persons per window."""
+        return np.array(
+            [
+                len(self.__selected(start_date, end_date, vaccinated))
+                for start_date, end_date in windows
+            ],
+            dtype=np.int64,
+        )
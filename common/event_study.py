@@ -0,0 +1,424 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date
+
+import numpy as np
+import polars as pl
+
+from common.constants.objects import AgeCohort, PrescriptionType
+from common.constants.study import DOSES, PERIODS
+from common.daily_series import DailySeries, day_number
+from common.drugs import drug_columns
+from common.person_time import at_risk, at_risk_around, daily_rates
+from common.onsets import WAVE_KEYS, daily_vaccinations, wave_onsets
+from common.stats import before_after_stats
+from common.person_store import PERSON_INDEX, PersonStore, collapse_injections_mask
+from common.trace import stage, traced
+
+METRICS = ["predpisy", "prvopredpisy", "kortikoidy", "imunosupresivy"]
+
+
+@traced()
+def vaccination_onsets(store: PersonStore, threshold: float = 0.5) -> pl.DataFrame:
+    """First day per (age_cohort, dose_number) on which the daily number of
+    vaccinations of living persons reached threshold * its peak."""
+    return wave_onsets(daily_vaccinations(store), [threshold]).select(
+        *WAVE_KEYS, "onset"
+    )
+
+
+def eligible_persons(
+    store: PersonStore, start_date: date, end_date: date, vaccinated: bool
+) -> pl.DataFrame:
+    """person_idx of persons insured over the whole study, alive, with some
+    prescription and with (vaccinated=True) or without vaccines."""
+    return pl.DataFrame(
+        {
+            PERSON_INDEX: pl.Series(
+                store.coverage_index.eligible(start_date, end_date, vaccinated),
+                dtype=store.persons.schema[PERSON_INDEX],
+            )
+        }
+    )
+
+
+def study_prescriptions(
+    store: PersonStore, outcome: str | list[str] | None = None
+) -> tuple[pl.DataFrame, np.ndarray | None]:
+    """Prescriptions with the columns the metrics need, only those of the
+    outcome ATC prefixes if given, and their rows in store.prescriptions
+    (None for all).
+
+    Injections are collapsed among the outcome's prescriptions only, so an
+    outcome injection is not dropped for following an unrelated one.
+    """
+    rows = None if outcome is None else store.atc_index.rows_of(outcome)
+    prescriptions = store.prescriptions
+    if rows is not None:
+        # still sorted by person and date
+        prescriptions = store.prescriptions[rows]
+        (is_injection,) = drug_columns(prescriptions, store.drugs, ["is_injection"])
+        prescriptions = prescriptions.with_columns(
+            pl.Series(
+                "kept",
+                collapse_injections_mask(prescriptions, is_injection.to_numpy()),
+            )
+        )
+    prescriptions = prescriptions.with_columns(
+        drug_columns(
+            prescriptions, store.drugs, ["prescription_type", "prednison_equiv"]
+        )
+    ).select(
+        PERSON_INDEX,
+        "date",
+        "age_cohort_at_prescription",
+        "prescription_type",
+        "prednison_equiv",
+        "kept",
+    )
+    return prescriptions, rows
+
+
+def first_prescriptions(
+    store: PersonStore, persons: pl.DataFrame, rows: np.ndarray | None = None
+) -> pl.DataFrame:
+    """Date and age cohort of the first prescription of the given persons,
+    among the prescription rows given (sorted) or all of them."""
+    if rows is None:
+        return store.persons.join(persons, on=PERSON_INDEX, how="semi").select(
+            PERSON_INDEX,
+            pl.col("first_prescription_date").alias("date"),
+            pl.col("first_prescription_cohort").alias("age_cohort_at_prescription"),
+        )
+    return (
+        store.prescriptions[rows]
+        .join(persons, on=PERSON_INDEX, how="semi")
+        .group_by(PERSON_INDEX, maintain_order=True)
+        .agg(pl.col("date", "age_cohort_at_prescription").first())
+    )
+
+
+def daily_metrics(events: pl.DataFrame, keys: list[str]) -> pl.DataFrame:
+    return events.group_by(keys).agg(
+        pl.len().alias("predpisy"),
+        pl.col("prednison_equiv").sum().alias("kortikoidy"),
+        (pl.col("prescription_type") == PrescriptionType.IMUNOSUPRESSIVE.value)
+        .sum()
+        .alias("imunosupresivy"),
+    )
+
+
+def with_first_prescriptions(
+    metrics: pl.DataFrame, first: pl.DataFrame, keys: list[str]
+) -> pl.DataFrame:
+    first = first.group_by(keys).agg(pl.len().alias("prvopredpisy"))
+    return (
+        metrics.join(first, on=keys, how="full", coalesce=True)
+        .with_columns(
+            pl.col("predpisy", "prvopredpisy", "imunosupresivy").fill_null(0),
+            pl.col("kortikoidy").fill_null(0.0),
+        )
+        .select(keys + METRICS)
+        .sort(keys)
+    )
+
+
+def relative_metrics(
+    store: PersonStore,
+    prescriptions: pl.DataFrame,
+    rows: np.ndarray | None,
+    anchors: pl.DataFrame,
+    keys: list[str],
+) -> pl.DataFrame:
+    """METRICS per keys and rel_day, the days from each anchor (person_idx,
+    "anchor" date and keys) to its person's prescriptions, of
+    study_prescriptions and their rows."""
+    rel_day = (pl.col("date") - pl.col("anchor")).dt.total_days().alias("rel_day")
+    keys = [*keys, "rel_day"]
+    persons = anchors.select(PERSON_INDEX).unique()
+    return with_first_prescriptions(
+        daily_metrics(
+            anchors.join(prescriptions.filter("kept"), on=PERSON_INDEX).with_columns(
+                rel_day
+            ),
+            keys,
+        ),
+        anchors.join(
+            first_prescriptions(store, persons, rows), on=PERSON_INDEX
+        ).with_columns(rel_day),
+        keys,
+    )
+
+
+@dataclass
+class EventStudy:
+    """Daily prescription metrics around vaccination.
+
+    novax: unvaccinated persons per (age_cohort, date), the cohort being the
+    one at prescription. vax: vaccinated persons per (age_cohort, dose_number,
+    rel_day), relative to every vaccine given within 2 * vax_period_in_days
+    after the onset of its cohort's wave.
+
+    Rates (run_event_study(rates=True)) are only the at_risk and
+    "<metric>_rate" columns of novax and vax; series, results and to_maps
+    work on the METRICS counts alone.
+    """
+
+    onsets: pl.DataFrame
+    novax: pl.DataFrame
+    vax: pl.DataFrame
+    vax_period_in_days: int
+
+    def onset_map(self) -> defaultdict:
+        """age_cohort -> dose_number -> onset date."""
+        onset_map = defaultdict(dict)
+        for cohort, dose, onset in self.onsets.iter_rows():
+            onset_map[AgeCohort(cohort)][dose] = onset
+        return onset_map
+
+    @traced("EventStudy.series")
+    def series(self) -> dict[str, tuple[DailySeries, DailySeries]]:
+        """metric -> (vax, novax) dense daily series; vax days are rel_day,
+        novax days are day_number(date) and the novax dose is None."""
+        n_doses = max(
+            self.vax["dose_number"].max() or 0, self.onsets["dose_number"].max() or 0
+        )
+        return {
+            metric: (
+                DailySeries.from_frame(
+                    self.vax, metric, "rel_day", "dose_number", n_doses=n_doses
+                ),
+                DailySeries.from_frame(self.novax, metric, "date"),
+            )
+            for metric in METRICS
+        }
+
+    @traced("EventStudy.results")
+    def results(
+        self,
+        periods: list[int] = PERIODS,
+        doses: list[int] = DOSES,
+        approximate_above: float | None = None,
+    ) -> pl.DataFrame:
+        """Before/after statistics per (period, dose, age_cohort, metric).
+
+        The pivot is onset + vax_period_in_days; the VAX window is
+        [-period, period) around the vaccination, the NOVAX window
+        [-period, period] around the pivot date. Doses without an onset in
+        a cohort are left out.
+        """
+        onset_map = self.onset_map()
+        grid = pl.DataFrame(
+            [
+                (
+                    period,
+                    dose,
+                    cohort.value,
+                    day_number(onset_map[cohort][dose]) + self.vax_period_in_days,
+                )
+                for period in periods
+                for dose in doses
+                for cohort in AgeCohort
+                if dose in onset_map[cohort]
+            ],
+            schema={
+                "period_days": pl.Int64,
+                "vax_dose": pl.Int64,
+                "age_cohort": pl.String,
+                "pivot": pl.Int64,
+            },
+            orient="row",
+        )
+        grid_periods = grid["period_days"].to_numpy()
+        grid_doses = grid["vax_dose"].to_numpy()
+        cohorts = grid["age_cohort"].to_list()
+        pivots = grid["pivot"].to_numpy()
+        series = self.series()
+
+        # one row per (grid row, metric), metric varying fastest
+        counts = {
+            name: np.zeros((grid.height, len(series)))
+            for name in ["vax_before", "vax_after", "novax_before", "novax_after"]
+        }
+        for j, (vax_series, novax_series) in enumerate(series.values()):
+            counts["vax_before"][:, j], counts["vax_after"][:, j] = (
+                vax_series.before_after(
+                    cohorts, grid_doses, 0, grid_periods, grid_periods
+                )
+            )
+            counts["novax_before"][:, j], counts["novax_after"][:, j] = (
+                novax_series.before_after(
+                    cohorts, None, pivots, grid_periods, grid_periods + 1
+                )
+            )
+
+        metric = pl.Series("metric", list(series) * grid.height, dtype=pl.String)
+        return (
+            grid.select("period_days", "age_cohort", "vax_dose")
+            .select(pl.all().repeat_by(len(series)).explode())
+            .with_columns(metric)
+            .hstack(
+                before_after_stats(
+                    *(values.ravel() for values in counts.values()),
+                    approximate_above=approximate_above,
+                )
+            )
+        )
+
+    def to_maps(self) -> dict[str, defaultdict]:
+        """The nested dicts built by the loops of max_vax_analysis.ipynb."""
+        maps: dict[str, defaultdict] = {"start_vax_date_map": self.onset_map()}
+
+        for metric in METRICS:
+            novax_map = defaultdict(lambda: defaultdict(int))
+            for cohort, day, value, count in self.novax.select(
+                "age_cohort",
+                "date",
+                metric,
+                pl.col(self.__count_column(metric)).alias("count"),
+            ).iter_rows():
+                if count:
+                    novax_map[AgeCohort(cohort)][day] += value
+            maps[f"novax_ppl_{self.__map_name(metric)}_map"] = novax_map
+
+            vax_map = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+            for cohort, dose, day, value, count in self.vax.select(
+                "age_cohort",
+                "dose_number",
+                "rel_day",
+                metric,
+                pl.col(self.__count_column(metric)).alias("count"),
+            ).iter_rows():
+                if count:
+                    vax_map[AgeCohort(cohort)][dose][day] += value
+            maps[f"vax_ppl_{self.__map_name(metric)}_map"] = vax_map
+
+        return maps
+
+    def __count_column(self, metric: str) -> str:
+        # kortikoidy entries exist for every counted prescription, even at 0
+        return "predpisy" if metric == "kortikoidy" else metric
+
+    def __map_name(self, metric: str) -> str:
+        return "prednison_equivs" if metric == "kortikoidy" else metric
+
+
+def _nobody_at_risk(metrics: pl.DataFrame, keys: list[str]) -> pl.DataFrame:
+    # at-risk frame of an arm without metrics, so it still gets rate columns
+    return pl.DataFrame(
+        schema={**{key: metrics.schema[key] for key in keys}, "at_risk": pl.Int64}
+    )
+
+
+@traced()
+def run_event_study(
+    store: PersonStore,
+    start_date: date,
+    end_date: date,
+    vax_period_in_days: int,
+    onset_threshold: float = 0.5,
+    outcome: str | list[str] | None = None,
+    rates: bool = False,
+) -> EventStudy:
+    """Event study of the prescriptions of eligible persons. outcome, an ATC
+    prefix of any level or a list of them, restricts the metrics (first
+    prescriptions included) to prescriptions of those groups. With rates,
+    novax and vax get the persons (vaccines for vax) at risk on each day as
+    "at_risk" and every metric per 100 000 of them as "<metric>_rate"
+    (common.person_time), null where nobody was at risk or the arm is empty.
+
+    Doses are numbered and injections collapsed in date order, so the results
+    are those of the notebook on chronological extracts (rows sorted by
+    person and date); on others the notebook's loops follow file order and
+    differ (see common.benchmark.verify).
+    """
+    prescriptions, rows = study_prescriptions(store, outcome)
+    onsets = vaccination_onsets(store, onset_threshold)
+
+    # --- NOVAX -------------------------------------------------------------
+    with stage("novax") as record:
+        novax_persons = eligible_persons(store, start_date, end_date, vaccinated=False)
+        novax_prescriptions = prescriptions.join(
+            novax_persons, on=PERSON_INDEX, how="semi"
+        )
+        record.rows_in = novax_prescriptions.height
+        novax_keys = ["age_cohort", "date"]
+        novax = with_first_prescriptions(
+            daily_metrics(
+                novax_prescriptions.filter("kept").rename(
+                    {"age_cohort_at_prescription": "age_cohort"}
+                ),
+                novax_keys,
+            ),
+            first_prescriptions(store, novax_persons, rows).rename(
+                {"age_cohort_at_prescription": "age_cohort"}
+            ),
+            novax_keys,
+        )
+        record.rows_out = novax.height
+
+    # --- VAX ---------------------------------------------------------------
+    with stage("vax") as record:
+        vax_persons = eligible_persons(store, start_date, end_date, vaccinated=True)
+        vaccines = (
+            store.vaccines.join(vax_persons, on=PERSON_INDEX, how="semi")
+            .join(onsets, on=["age_cohort", "dose_number"], how="inner")
+            .filter(
+                ((pl.col("date") - pl.col("onset")).dt.total_days() >= 0)
+                & (
+                    (pl.col("date") - pl.col("onset")).dt.total_days()
+                    <= 2 * vax_period_in_days
+                )
+            )
+            .select(
+                PERSON_INDEX,
+                "age_cohort",
+                "dose_number",
+                pl.col("date").alias("anchor"),
+            )
+        )
+        vax_prescriptions = prescriptions.join(vax_persons, on=PERSON_INDEX, how="semi")
+        record.rows_in = vax_prescriptions.height
+        vax_keys = ["age_cohort", "dose_number", "rel_day"]
+        vax = relative_metrics(
+            store, vax_prescriptions, rows, vaccines, ["age_cohort", "dose_number"]
+        )
+        record.rows_out = vax.height
+
+    if rates:
+        with stage("rates"):
+            novax = daily_rates(
+                novax,
+                (
+                    at_risk(
+                        store,
+                        novax["date"].min(),
+                        novax["date"].max(),
+                        novax_persons[PERSON_INDEX].to_numpy(),
+                    )
+                    if novax.height
+                    else _nobody_at_risk(novax, novax_keys)
+                ),
+                novax_keys,
+                METRICS,
+            )
+            vax = daily_rates(
+                vax,
+                (
+                    at_risk_around(
+                        store,
+                        vaccines,
+                        ["age_cohort", "dose_number"],
+                        vax["rel_day"].min(),
+                        vax["rel_day"].max(),
+                    )
+                    if vax.height
+                    else _nobody_at_risk(vax, vax_keys)
+                ),
+                vax_keys,
+                METRICS,
+            )
+
+    return EventStudy(
+        onsets=onsets, novax=novax, vax=vax, vax_period_in_days=vax_period_in_days
+    )
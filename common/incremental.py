@@ -0,0 +1,250 @@
+import json
+import os
+from typing import Callable, Protocol
+
+import polars as pl
+
+from common.constants.column_names import SHARED_COLUMNS
+from common.drugs import DRUG_ID, DRUG_KEYS
+from common.person_store import (
+    DERIVED_COLUMNS,
+    PERSON_INDEX,
+    PersonStore,
+    dose_numbers,
+)
+from common.storage import METADATA_FILE, read_store, scan_table, write_store
+from common.trace import traced
+
+MANIFEST_FILE = "manifest.json"
+PARTITION = "partition"
+
+
+class FramesConverter(Protocol):
+    def to_frames(
+        self, df: pl.DataFrame | pl.LazyFrame
+    ) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame]: ...
+
+
+def partition_expr(file_path: str) -> pl.Expr:
+    """ "<file>#<year>H<half>" of the event date; person-only rows go to "<file>#-"."""
+    name = os.path.basename(file_path)
+    event_date = pl.col(SHARED_COLUMNS.DATUM_UDALOSTI.value)
+    return pl.concat_str(
+        [
+            pl.lit(f"{name}#"),
+            event_date.dt.year().cast(pl.String),
+            pl.when(event_date.dt.month() <= 6)
+            .then(pl.lit("H1"))
+            .otherwise(pl.lit("H2")),
+        ]
+    ).fill_null(pl.lit(f"{name}#-"))
+
+
+def file_fingerprint(file_path: str) -> dict:
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def partition_fingerprints(lf: pl.LazyFrame) -> dict[str, str]:
+    # Split the 64-bit row hashes so their sums cannot overflow; the result
+    # does not depend on row order inside the partition
+    row_hash = pl.struct(pl.exclude(PARTITION)).hash(seed=0)
+    fingerprints = (
+        lf.group_by(PARTITION)
+        .agg(
+            pl.len().alias("rows"),
+            (row_hash % (1 << 32)).sum().alias("low"),
+            (row_hash // (1 << 32)).sum().alias("high"),
+        )
+        .collect()
+    )
+    return {
+        row[PARTITION]: f"{row['rows']}:{row['low']}:{row['high']}"
+        for row in fingerprints.iter_rows(named=True)
+    }
+
+
+def read_manifest(directory: str, insurer: str) -> dict:
+    path = os.path.join(directory, insurer, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"files": {}, "partitions": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(directory: str, insurer: str, manifest: dict) -> None:
+    with open(os.path.join(directory, insurer, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+
+def is_tagged(directory: str, insurer: str) -> bool:
+    """Whether the insurer's store exists and its rows carry their partition,
+    i.e. it was written by ingest_incremental and not by a full conversion."""
+    if not os.path.exists(os.path.join(directory, insurer, METADATA_FILE)):
+        return False
+    schema = scan_table(directory, insurer, "persons").collect_schema()
+    return PARTITION in schema.names()
+
+
+@traced()
+def ingest_incremental(
+    files: list[str],
+    scan: Callable[[str], pl.LazyFrame],
+    converter: FramesConverter,
+    directory: str,
+    insurer: str,
+) -> dict:
+    """Bring the insurer's store in directory up to date with the given extracts.
+
+    Only files whose size or mtime changed are scanned, and only the
+    (file, half-year) partitions whose content changed are converted. Their
+    prescriptions and vaccines replace the old rows of the same partitions,
+    persons seen in them are upserted. Merged events are kept in date order
+    and doses renumbered by person_store.dose_numbers, as in a full
+    conversion. Every stored row carries its partition so a later refresh
+    knows what to replace; a store without them (written by a full
+    conversion since the last refresh) is rebuilt from the extracts. Returns a
+    summary of what was done.
+    """
+    manifest = read_manifest(directory, insurer)
+    if not is_tagged(directory, insurer):
+        manifest = {"files": {}, "partitions": {}}
+    known_files = manifest["files"]
+    names = {os.path.basename(file_path): file_path for file_path in files}
+
+    changed_files = [
+        file_path
+        for file_path in files
+        if known_files.get(os.path.basename(file_path)) != file_fingerprint(file_path)
+    ]
+    removed_files = [name for name in known_files if name not in names]
+    summary = {
+        "changed_files": changed_files,
+        "removed_files": removed_files,
+        "changed_partitions": [],
+    }
+    if not changed_files and not removed_files:
+        return summary
+
+    scans = {
+        file_path: scan(file_path).with_columns(
+            partition_expr(file_path).alias(PARTITION)
+        )
+        for file_path in changed_files
+    }
+    fingerprints = {}
+    for lf in scans.values():
+        fingerprints.update(partition_fingerprints(lf))
+
+    touched = {os.path.basename(file_path) for file_path in changed_files}
+    touched.update(removed_files)
+    stale = {
+        partition
+        for partition in manifest["partitions"]
+        if partition.split("#")[0] in touched and partition not in fingerprints
+    }
+    changed = {
+        partition
+        for partition, fingerprint in fingerprints.items()
+        if manifest["partitions"].get(partition) != fingerprint
+    }
+    summary["changed_partitions"] = sorted(changed | stale)
+
+    # The changed rows of every file are read in one pass, then split
+    changed_rows = {
+        file_path: lf.filter(
+            pl.col(PARTITION).is_in(
+                [p for p in changed if p.startswith(f"{os.path.basename(file_path)}#")]
+            )
+        )
+        for file_path, lf in scans.items()
+    }
+    persons, memberships, prescriptions, vaccines = [], [], [], []
+    for df in pl.collect_all(list(changed_rows.values())):
+        parts = df.partition_by(PARTITION, as_dict=True, include_key=False)
+        for (partition,), rows in sorted(parts.items()):
+            person_df, prescription_df, vaccine_df = converter.to_frames(rows)
+            persons.append(person_df)
+            memberships.append(
+                person_df.select("id", pl.lit(partition).alias(PARTITION))
+            )
+            prescriptions.append(
+                prescription_df.with_columns(pl.lit(partition).alias(PARTITION))
+            )
+            vaccines.append(vaccine_df.with_columns(pl.lit(partition).alias(PARTITION)))
+
+    replaced = changed | stale
+    if manifest["partitions"]:
+        existing = read_store(directory, [insurer])
+        ids = existing.persons.select(PERSON_INDEX, "id")
+
+        # derived columns are rebuilt for the merged store
+        def with_ids(events: pl.DataFrame, table: str) -> pl.DataFrame:
+            return (
+                events.filter(~pl.col(PARTITION).is_in(list(replaced)))
+                .drop(DERIVED_COLUMNS[table])
+                .join(ids, on=PERSON_INDEX, how="left", maintain_order="left")
+                .drop(PERSON_INDEX)
+                .select("id", pl.exclude("id", PARTITION), PARTITION)
+            )
+
+        # drug_ids are local to a store; the merged one gets a new dimension
+        prescriptions.insert(
+            0,
+            with_ids(
+                existing.prescriptions_with(*DRUG_KEYS).drop(DRUG_ID), "prescriptions"
+            ),
+        )
+        vaccines.insert(0, with_ids(existing.vaccines, "vaccines"))
+        persons.insert(
+            0,
+            existing.persons.drop(PERSON_INDEX, PARTITION, *DERIVED_COLUMNS["persons"]),
+        )
+        memberships.insert(
+            0,
+            existing.persons.select("id", PARTITION)
+            .explode(PARTITION)
+            .filter(~pl.col(PARTITION).is_in(list(replaced))),
+        )
+
+    # Later partitions win for person attributes; persons left without any
+    # partition (their rows were all removed) are dropped
+    persons_df = (
+        pl.concat(persons)
+        .unique("id", keep="last", maintain_order=True)
+        .join(
+            pl.concat(memberships).group_by("id", maintain_order=True).agg(PARTITION),
+            on="id",
+            how="inner",
+            maintain_order="left",
+        )
+    )
+    prescriptions_df = pl.concat(prescriptions).sort(
+        ["id", "date"], maintain_order=True
+    )
+    vaccines_df = (
+        pl.concat(vaccines)
+        .sort(["id", "date"], maintain_order=True)
+        .with_columns(dose_numbers("id", "date").alias("dose_number"))
+    )
+
+    write_store(
+        PersonStore.from_frames(persons_df, prescriptions_df, vaccines_df),
+        directory,
+        insurer,
+        source=", ".join(sorted(names)),
+    )
+
+    manifest["partitions"] = {
+        partition: fingerprint
+        for partition, fingerprint in manifest["partitions"].items()
+        if partition not in replaced
+    }
+    manifest["partitions"].update(
+        {partition: fingerprints[partition] for partition in changed}
+    )
+    manifest["files"] = {
+        name: file_fingerprint(file_path) for name, file_path in names.items()
+    }
+    write_manifest(directory, insurer, manifest)
+    return summary
@@ -0,0 +1,245 @@
+from dataclasses import dataclass
+
+import numpy as np
+import polars as pl
+
+from common.event_study import relative_metrics, study_prescriptions
+from common.person_store import PERSON_INDEX, PersonStore
+from common.trace import traced
+
+MATCH_KEYS = ["birth_year", "birth_month", "gender", "insurer"]
+# the vaccinated case and the controls matched to it
+ARMS = ["vax", "control"]
+
+
+def vaccination_cases(store: PersonStore, dose_number: int = 1) -> pl.DataFrame:
+    """One case per person vaccinated with dose_number: person_idx, the
+    vaccination date as "index_date", dose_number and age_cohort."""
+    return store.vaccines.filter(pl.col("dose_number") == dose_number).select(
+        PERSON_INDEX,
+        pl.col("date").alias("index_date"),
+        "dose_number",
+        "age_cohort",
+    )
+
+
+def _strata(persons: pl.DataFrame) -> np.ndarray:
+    # dense stratum id of every person, by hash join on the MATCH_KEYS
+    keys = persons.select(
+        pl.col("born_at").dt.year().alias("birth_year"),
+        pl.col("born_at").dt.month().alias("birth_month"),
+        "gender",
+        "insurer",
+    )
+    strata = keys.unique(maintain_order=True).with_row_index("stratum")
+    return (
+        keys.join(
+            strata, on=MATCH_KEYS, how="left", nulls_equal=True, maintain_order="left"
+        )["stratum"]
+        .cast(pl.Int64)
+        .to_numpy()
+    )
+
+
+@dataclass
+class ControlIndex:
+    """Potential controls by stratum for index days from first_day to
+    last_day.
+
+    A control may be taken on the days from its coverage start through its
+    "end": the day before its first dose, its coverage end or its death,
+    whichever comes first. So everyone, later vaccinees included, is a control
+    until vaccinated; a pool of never vaccinated persons would only hold those
+    who survived unvaccinated to the end of the data, and that immortal time
+    would bias the control arm.
+
+    Controls insured since before first_day ("early", nearly all) qualify on a
+    day exactly when their end is on or after it: sorted by (stratum, end),
+    those a case may take are one run of early_rows, found by binary search.
+    The others ("late") are sorted by (stratum, start) and those of a case's
+    run are checked against late_end.
+    """
+
+    early_rows: np.ndarray
+    early_keys: np.ndarray
+    late_rows: np.ndarray
+    late_keys: np.ndarray
+    late_end: np.ndarray
+    strata: np.ndarray
+    first_day: int
+    span: int
+
+    @classmethod
+    def build(
+        cls,
+        store: PersonStore,
+        first_day: int,
+        last_day: int,
+        controls: np.ndarray | None = None,
+    ) -> "ControlIndex":
+        """Index controls (person rows), by default every person, for index
+        days (day numbers) from first_day to last_day."""
+        if controls is None:
+            controls = np.arange(len(store))
+        never = np.iinfo(np.int64).max
+        coverage = store.persons.select(
+            pl.col("zahajeni_pojisteni").to_physical().cast(pl.Int64).alias("start"),
+            pl.min_horizontal("ukonceni_pojisteni", "died_at")
+            .to_physical()
+            .cast(pl.Int64)
+            .alias("end"),
+        )
+        start = coverage["start"].fill_null(never).to_numpy()
+        end = coverage["end"].fill_null(never).to_numpy()
+        first_dose = store.dose_rows(1)
+        vaccinated = first_dose >= 0
+        end[vaccinated] = np.minimum(
+            end[vaccinated],
+            store.vaccines["date"].to_physical().to_numpy()[first_dose[vaccinated]] - 1,
+        )
+        # never insured, or gone before the first index day
+        controls = controls[(start[controls] != never) & (end[controls] >= first_day)]
+
+        index = cls(
+            *([np.empty(0, dtype=np.int64)] * 5),
+            strata=_strata(store.persons),
+            first_day=first_day,
+            span=last_day - first_day + 3,
+        )
+        early = controls[start[controls] <= first_day]
+        keys = index.__keys(early, end[early])
+        order = np.argsort(keys, kind="stable")
+        index.early_rows, index.early_keys = early[order], keys[order]
+
+        late = controls[start[controls] > first_day]
+        keys = index.__keys(late, start[late])
+        order = np.argsort(keys, kind="stable")
+        index.late_rows, index.late_keys = late[order], keys[order]
+        index.late_end = end[index.late_rows]
+        return index
+
+    def __keys(self, persons: np.ndarray, days: np.ndarray) -> np.ndarray:
+        # (stratum, day) as one sortable integer; days outside the index days
+        # all sort before or after them
+        position = np.clip(days - self.first_day, -1, self.span - 2) + 1
+        return self.strata[persons] * self.span + position
+
+    def candidates(
+        self, persons: np.ndarray, days: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """For each case (person, index day): the [lo, hi) run of early_rows
+        it may take, then every late control it may take as (case, row)
+        pairs sorted by case."""
+        # binary searches run faster on sorted queries
+        keys = self.__keys(persons, days)
+        order = np.argsort(keys, kind="stable")
+        keys, base = keys[order], self.strata[persons[order]] * self.span
+        lo, hi = np.empty_like(keys), np.empty_like(keys)
+        lo[order] = np.searchsorted(self.early_keys, keys, "left")
+        hi[order] = np.searchsorted(self.early_keys, base + self.span, "left")
+
+        late_lo, lengths = np.empty_like(keys), np.empty_like(keys)
+        late_lo[order] = np.searchsorted(self.late_keys, base, "left")
+        lengths[order] = np.searchsorted(self.late_keys, keys, "right")
+        lengths = lengths - late_lo
+
+        case = np.repeat(np.arange(len(persons)), lengths)
+        position = np.repeat(late_lo - np.cumsum(lengths) + lengths, lengths)
+        position += np.arange(len(case))
+        eligible = self.late_end[position] >= days[case]
+        return lo, hi, case[eligible], self.late_rows[position[eligible]]
+
+
+def _choose(sizes: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    """(case, n) distinct indices into [0, size) per case, uniformly, by
+    Floyd's algorithm run for all cases at once; every index (then -1) where
+    size <= n."""
+    chosen = np.full((len(sizes), n), -1, dtype=np.int64)
+    for j in range(n):
+        top = sizes - n + j
+        drawn = (rng.random(len(sizes)) * (top + 1)).astype(np.int64)
+        seen = (chosen[:, :j] == drawn[:, None]).any(axis=1)
+        chosen[:, j] = np.where(seen, top, drawn)
+    few = sizes <= n
+    chosen[few] = np.where(np.arange(n) < sizes[few, None], np.arange(n), -1)
+    return chosen
+
+
+@traced()
+def match_controls(
+    store: PersonStore,
+    cases: pl.DataFrame,
+    n_controls: int = 1,
+    seed: int = 0,
+    controls: np.ndarray | None = None,
+) -> pl.DataFrame:
+    """Sample n_controls distinct controls per case among persons of the same
+    birth year and month, gender and insurer who are insured, alive and not
+    yet vaccinated on the case's index_date (see ControlIndex); by default
+    any person may be a control. A control's follow-up is not cut at its own
+    later vaccination.
+
+    cases has person_idx and "index_date" (see vaccination_cases); any other
+    columns are kept. Returns one row per case ("vax" arm) and per control
+    ("control" arm, index_date being its pseudo-index date) with the case's
+    row as match_id. A control may serve several cases; cases with fewer
+    eligible controls get all of them, and a case drawn as its own control
+    (controls given by the caller) goes without it. The same inputs and seed
+    always give the same matches.
+    """
+    persons = cases[PERSON_INDEX].to_numpy().astype(np.int64)
+    days = cases["index_date"].to_physical().to_numpy().astype(np.int64)
+    first_day, last_day = (int(days.min()), int(days.max())) if len(days) else (0, 0)
+    index = ControlIndex.build(store, first_day, last_day, controls)
+    lo, hi, late_case, late_rows = index.candidates(persons, days)
+
+    # candidates of a case: its early run, then its late controls
+    n_early = hi - lo
+    n_late = np.bincount(late_case, minlength=len(persons))
+    late_first = np.cumsum(n_late) - n_late
+    chosen = _choose(n_early + n_late, n_controls, np.random.default_rng(seed))
+
+    match_id = np.repeat(np.arange(len(persons)), n_controls)
+    chosen = chosen.ravel()
+    match_id, chosen = match_id[chosen >= 0], chosen[chosen >= 0]
+    is_early = chosen < n_early[match_id]
+    control = np.empty(len(chosen), dtype=np.int64)
+    control[is_early] = index.early_rows[lo[match_id[is_early]] + chosen[is_early]]
+    late = match_id[~is_early]
+    control[~is_early] = late_rows[late_first[late] + chosen[~is_early] - n_early[late]]
+    itself = control == persons[match_id]
+    match_id, control = match_id[~itself], control[~itself]
+
+    matched = cases.with_row_index("match_id").with_columns(
+        pl.lit(ARMS[0]).cast(pl.Enum(ARMS)).alias("arm")
+    )
+    control_rows = matched[match_id].with_columns(
+        pl.Series(PERSON_INDEX, control).cast(matched.schema[PERSON_INDEX]),
+        pl.lit(ARMS[1]).cast(pl.Enum(ARMS)).alias("arm"),
+    )
+    return (
+        pl.concat([matched, control_rows])
+        .sort("match_id", "arm", maintain_order=True)
+        .select(
+            "match_id", "arm", PERSON_INDEX, pl.exclude("match_id", "arm", PERSON_INDEX)
+        )
+    )
+
+
+@traced()
+def matched_metrics(
+    store: PersonStore,
+    matched: pl.DataFrame,
+    keys: list[str] = ["age_cohort", "dose_number"],
+    outcome: str | list[str] | None = None,
+) -> pl.DataFrame:
+    """The event study's METRICS per arm, keys and rel_day, days counted from
+    each person's (pseudo-)index date; controls take the keys of their case."""
+    prescriptions, rows = study_prescriptions(store, outcome)
+    return relative_metrics(
+        store,
+        prescriptions,
+        rows,
+        matched.rename({"index_date": "anchor"}),
+        ["arm", *keys],
+    )
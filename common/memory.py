@@ -0,0 +1,78 @@
+import random
+import sys
+from typing import Callable, Iterable
+
+from common.constants.objects import Person
+
+
+def string_pool() -> Callable[[str | None], str | None]:
+    """Return an interning function: equal strings come back as one object."""
+    strings: dict[str | None, str | None] = {}
+
+    def intern(value: str | None) -> str | None:
+        return strings.setdefault(value, value)
+
+    return intern
+
+
+def deep_sizeof(obj: object, seen: set[int]) -> int:
+    """Size of obj and everything it references that is not in seen yet."""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (list, tuple, set)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif isinstance(obj, dict):
+        size += sum(
+            deep_sizeof(key, seen) + deep_sizeof(value, seen)
+            for key, value in obj.items()
+        )
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    if hasattr(type(obj), "__slots__"):
+        size += sum(
+            deep_sizeof(getattr(obj, name), seen)
+            for name in type(obj).__slots__
+            if hasattr(obj, name)
+        )
+    return size
+
+
+def bytes_per_person(persons: list[Person], sample: int | None = None) -> float:
+    """Average deep size of a person, counting shared objects (enums, interned
+    strings) once. Pass sample to estimate from a random subset."""
+    if sample is not None and sample < len(persons):
+        persons = random.Random(0).sample(persons, sample)
+    if not persons:
+        return 0.0
+
+    # Enum members are module singletons, not per-person memory
+    seen: set[int] = set()
+    return sum(deep_sizeof(person, seen) for person in persons) / len(persons)
+
+
+def intern_person_strings(persons: Iterable[Person]) -> None:
+    intern = string_pool()
+    for person in persons:
+        for prescription in person.prescriptions:
+            prescription.latka = intern(prescription.latka)
+            prescription.atc_skupina = intern(prescription.atc_skupina)
+            prescription.lekova_forma = intern(prescription.lekova_forma)
+            prescription.specializace_lekare = intern(prescription.specializace_lekare)
+            prescription.equiv_sloucenina = intern(prescription.equiv_sloucenina)
+        for vaccine in person.vaccines:
+            vaccine.nazev = intern(vaccine.nazev)
+
+
+def compact_persons(
+    persons: list[Person], sample: int | None = 100_000
+) -> tuple[float, float]:
+    """Intern the repeated strings of already loaded persons in place and
+    report bytes per person before and after."""
+    before = bytes_per_person(persons, sample)
+    intern_person_strings(persons)
+    after = bytes_per_person(persons, sample)
+    print(f"✓ Bytes per person: {before:,.0f} -> {after:,.0f}")
+    return before, after
@@ -0,0 +1,72 @@
+import polars as pl
+
+from common.person_store import PERSON_INDEX, PersonStore
+
+WAVE_KEYS = ["age_cohort", "dose_number"]
+MOVING_AVERAGE_DAYS = 7
+
+
+def daily_counts(vaccines: pl.DataFrame, keys: list[str]) -> pl.DataFrame:
+    """Vaccinations per day and keys, one row for every day from a group's
+    first to its last vaccination (0 on days without any), with the 7-day
+    moving average in "ma"."""
+    counts = vaccines.group_by(*keys, "date").len().rename({"len": "count"})
+    days = (
+        counts.group_by(keys)
+        .agg(pl.date_range(pl.col("date").min(), pl.col("date").max(), "1d"))
+        .explode("date")
+        if keys
+        else pl.DataFrame(
+            {
+                "date": pl.date_range(
+                    counts["date"].min(), counts["date"].max(), "1d", eager=True
+                )
+            }
+        )
+    )
+    moving_average = pl.col("count").rolling_mean(MOVING_AVERAGE_DAYS)
+    return (
+        days.join(counts, on=[*keys, "date"], how="left")
+        .with_columns(pl.col("count").fill_null(0).cast(pl.UInt32))
+        .sort(*keys, "date")
+        .with_columns(
+            (moving_average.over(keys) if keys else moving_average).alias("ma")
+        )
+    )
+
+
+def daily_vaccinations(store: PersonStore, by_vaccine: bool = False) -> pl.DataFrame:
+    """Daily vaccinations of living persons per age_cohort and dose_number,
+    and per vaccine nazev with by_vaccine."""
+    alive = store.persons.filter(pl.col("died_at").is_null()).select(PERSON_INDEX)
+    keys = [*WAVE_KEYS, "nazev"] if by_vaccine else WAVE_KEYS
+    return daily_counts(store.vaccines.join(alive, on=PERSON_INDEX, how="semi"), keys)
+
+
+def wave_onsets(
+    daily: pl.DataFrame, thresholds: list[float], keys: list[str] = WAVE_KEYS
+) -> pl.DataFrame:
+    """Peak of every wave of a daily_counts frame and, per threshold, its onset:
+    the first day whose count reached threshold * the peak count."""
+    peaks = daily.group_by(keys).agg(
+        pl.col("count").max().alias("peak"),
+        pl.col("date")
+        .filter(pl.col("count") == pl.col("count").max())
+        .min()
+        .alias("peak_date"),
+    )
+    return (
+        daily.join(peaks, on=keys)
+        .join(
+            pl.DataFrame({"threshold": thresholds}, schema={"threshold": pl.Float64}),
+            how="cross",
+        )
+        .filter(pl.col("count") >= pl.col("peak") * pl.col("threshold"))
+        .group_by(*keys, "threshold")
+        .agg(
+            pl.col("peak").first(),
+            pl.col("peak_date").first(),
+            pl.col("date").min().alias("onset"),
+        )
+        .sort(*keys, "threshold")
+    )
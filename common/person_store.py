@@ -0,0 +1,464 @@
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Iterator
+
+import numpy as np
+import polars as pl
+
+from common.atc import AtcIndex
+from common.drugs import (
+    DRUG_ID,
+    INJECTION_FORMS,
+    drug_columns,
+    merge_dimensions,
+    normalize,
+)
+from common.eligibility import CoverageIndex
+from common.memory import string_pool
+from common.constants.objects import (
+    AgeCohort,
+    Gender,
+    Person,
+    Prescription,
+    PrescriptionType,
+    Vaccine,
+)
+
+PERSON_INDEX = "person_idx"
+INJECTION_GAP_IN_DAYS = 14
+
+# Derived at ingest by with_derived_columns, rebuilt whenever a store is built
+# from frames
+DERIVED_COLUMNS = {
+    "persons": ["first_prescription_date", "first_prescription_cohort"],
+    "prescriptions": ["kept"],
+    "vaccines": [],
+}
+
+
+def dose_numbers(person: str, date: str) -> pl.Expr:
+    """Dose number of every vaccination row: its position among the person's
+    vaccinations by date, those of the same day in row order. Both the full
+    and the incremental conversion number doses with it."""
+    return pl.col(date).rank("ordinal").over(person).cast(pl.Int64)
+
+
+def collapse_injections_mask(
+    prescriptions: pl.DataFrame, is_injection: np.ndarray
+) -> np.ndarray:
+    """Mask of prescriptions kept by the notebook's collapse_injections: an
+    injection within 14 days of the person's last kept injection is dropped.
+
+    The rule is sequential, so this walks the injection rows only, in the
+    (person, date) order of the store.
+    """
+    keep = np.ones(prescriptions.height, dtype=bool)
+    injections = np.flatnonzero(is_injection)
+    person_idx = prescriptions[PERSON_INDEX].to_numpy()[injections].tolist()
+    days = prescriptions["date"].to_physical().to_numpy()[injections].tolist()
+
+    current_person, last_day = -1, 0
+    for row, person, day in zip(injections.tolist(), person_idx, days):
+        if person != current_person:
+            current_person, last_day = person, None
+        if last_day is not None and abs(last_day - day) < INJECTION_GAP_IN_DAYS:
+            keep[row] = False
+            continue
+        last_day = day
+    return keep
+
+
+def with_derived_columns(
+    persons: pl.DataFrame, prescriptions: pl.DataFrame, drugs: pl.DataFrame
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """Add the per-person facts the analyses need over and over: the
+    injection-collapse mask of every prescription and the date and age cohort
+    of each person's first prescription (null without prescriptions).
+
+    prescriptions must be sorted by (person_idx, date).
+    """
+    prescriptions = prescriptions.drop(
+        DERIVED_COLUMNS["prescriptions"], strict=False
+    ).with_columns(
+        pl.Series(
+            "kept",
+            collapse_injections_mask(
+                prescriptions,
+                drug_columns(prescriptions, drugs, ["is_injection"])[0].to_numpy(),
+            ),
+        )
+    )
+    first = prescriptions.group_by(PERSON_INDEX).agg(
+        pl.col("date").first().alias("first_prescription_date"),
+        pl.col("age_cohort_at_prescription").first().alias("first_prescription_cohort"),
+    )
+    persons = persons.drop(DERIVED_COLUMNS["persons"], strict=False).join(
+        first, on=PERSON_INDEX, how="left", maintain_order="left"
+    )
+    return persons, prescriptions
+
+
+def _offsets(person_idx: np.ndarray, n_persons: int) -> np.ndarray:
+    counts = np.bincount(person_idx, minlength=n_persons)
+    offsets = np.zeros(n_persons + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+@dataclass
+class PersonStore:
+    """Struct-of-arrays replacement for list[Person].
+
+    Person attributes are columns of `persons`. Prescriptions and vaccines are
+    flat tables sorted by person; the rows of person i are
+    `offsets[i]:offsets[i + 1]` (CSR layout). A person's prescriptions are in
+    date order, vaccines in dose order. DERIVED_COLUMNS are added at ingest.
+    Prescriptions keep a drug_id into `drugs` (see common.drugs) and their
+    pack count; prescriptions_with adds the drug's columns.
+    Low-cardinality text (drug, ATC group, form, specialization, vaccine,
+    insurer) is Categorical.
+    """
+
+    persons: pl.DataFrame
+    prescriptions: pl.DataFrame
+    vaccines: pl.DataFrame
+    drugs: pl.DataFrame
+    prescription_offsets: np.ndarray
+    vaccine_offsets: np.ndarray
+
+    @classmethod
+    def from_frames(
+        cls,
+        persons: pl.DataFrame,
+        prescriptions: pl.DataFrame,
+        vaccines: pl.DataFrame,
+    ) -> "PersonStore":
+        """Build a store from the tables returned by the converter's to_frames;
+        their prescriptions still carry the DRUG_KEYS."""
+        persons = persons.with_row_index(PERSON_INDEX)
+        person_idx = persons.select("id", PERSON_INDEX)
+
+        def attach(events: pl.DataFrame, order: list[str]) -> pl.DataFrame:
+            return (
+                events.join(person_idx, on="id", how="inner", maintain_order="left")
+                .drop("id")
+                .sort(order, maintain_order=True)
+                .select(PERSON_INDEX, pl.exclude(PERSON_INDEX))
+            )
+
+        drugs, prescriptions = normalize(attach(prescriptions, [PERSON_INDEX, "date"]))
+        persons, prescriptions = with_derived_columns(persons, prescriptions, drugs)
+        return cls.from_tables(
+            persons,
+            prescriptions,
+            attach(vaccines, [PERSON_INDEX, "dose_number"]),
+            drugs,
+        )
+
+    @classmethod
+    def from_tables(
+        cls,
+        persons: pl.DataFrame,
+        prescriptions: pl.DataFrame,
+        vaccines: pl.DataFrame,
+        drugs: pl.DataFrame,
+    ) -> "PersonStore":
+        """Rebuild the offsets of tables that already carry sorted person_idx."""
+        return cls(
+            persons=persons,
+            prescriptions=prescriptions,
+            vaccines=vaccines,
+            drugs=drugs,
+            prescription_offsets=_offsets(
+                prescriptions[PERSON_INDEX].to_numpy(), persons.height
+            ),
+            vaccine_offsets=_offsets(vaccines[PERSON_INDEX].to_numpy(), persons.height),
+        )
+
+    @classmethod
+    def from_persons(cls, persons: list[Person]) -> "PersonStore":
+        """Build a store from already materialized Person objects, e.g. those of
+        old *_persons.pkl pickles (see Person.__setstate__)."""
+        persons_df = pl.DataFrame(
+            {
+                "id": [p.id for p in persons],
+                "gender": [p.gender.value for p in persons],
+                "born_at": [p.born_at for p in persons],
+                "zahajeni_pojisteni": [p.zahajeni_pojisteni for p in persons],
+                "ukonceni_pojisteni": [p.ukonceni_pojisteni for p in persons],
+                "age_cohort": [p.age_cohort.value for p in persons],
+                "died_at": [p.died_at for p in persons],
+                "insurer": [p.insurer for p in persons],
+            },
+            schema_overrides={
+                "gender": pl.Enum(Gender),
+                "age_cohort": pl.Enum(AgeCohort),
+                "born_at": pl.Datetime("us"),
+                "zahajeni_pojisteni": pl.Date,
+                "ukonceni_pojisteni": pl.Date,
+                "died_at": pl.Date,
+                "insurer": pl.Categorical,
+            },
+        )
+        prescriptions_df = pl.DataFrame(
+            {
+                "id": [p.id for p in persons for _ in p.prescriptions],
+                "date": [pr.date for p in persons for pr in p.prescriptions],
+                "latka": [pr.latka for p in persons for pr in p.prescriptions],
+                "age_cohort_at_prescription": [
+                    pr.age_cohort_at_prescription.value
+                    for p in persons
+                    for pr in p.prescriptions
+                ],
+                # Objects only keep each prescription's prednison total, which
+                # becomes the factor of a single pack of strength 1
+                "sila": ["1" for p in persons for _ in p.prescriptions],
+                "pocet_v_baleni": [1.0 for p in persons for _ in p.prescriptions],
+                "pocet_baleni": [1.0 for p in persons for _ in p.prescriptions],
+                "equiv_factor": [
+                    float(pr.prednison_equiv) for p in persons for pr in p.prescriptions
+                ],
+                "equiv_sloucenina": [
+                    pr.equiv_sloucenina for p in persons for pr in p.prescriptions
+                ],
+                "specializace_lekare": [
+                    pr.specializace_lekare for p in persons for pr in p.prescriptions
+                ],
+                "atc_skupina": [
+                    pr.atc_skupina for p in persons for pr in p.prescriptions
+                ],
+                "lekova_forma": [
+                    pr.lekova_forma for p in persons for pr in p.prescriptions
+                ],
+            },
+            schema_overrides={
+                "id": persons_df.schema["id"],
+                "date": pl.Date,
+                "latka": pl.Categorical,
+                "age_cohort_at_prescription": pl.Enum(AgeCohort),
+                "sila": pl.Categorical,
+                "pocet_v_baleni": pl.Float64,
+                "pocet_baleni": pl.Float64,
+                "equiv_factor": pl.Float64,
+                "equiv_sloucenina": pl.Categorical,
+                "specializace_lekare": pl.Categorical,
+                "atc_skupina": pl.Categorical,
+                "lekova_forma": pl.Categorical,
+            },
+        )
+        vaccines_df = pl.DataFrame(
+            {
+                "id": [p.id for p in persons for _ in p.vaccines],
+                "date": [v.date for p in persons for v in p.vaccines],
+                "dose_number": [v.dose_number for p in persons for v in p.vaccines],
+                "age_cohort": [v.age_cohort.value for p in persons for v in p.vaccines],
+                "nazev": [v.nazev for p in persons for v in p.vaccines],
+            },
+            schema_overrides={
+                "id": persons_df.schema["id"],
+                "date": pl.Date,
+                "dose_number": pl.Int64,
+                "age_cohort": pl.Enum(AgeCohort),
+                "nazev": pl.Categorical,
+            },
+        )
+        return cls.from_frames(persons_df, prescriptions_df, vaccines_df)
+
+    @classmethod
+    def concat(cls, stores: list["PersonStore"]) -> "PersonStore":
+        """Stack several stores (e.g. both insurers) into one; the insurer
+        column tells their persons apart."""
+        persons, prescriptions, vaccines = [], [], []
+        prescription_offsets = [np.zeros(1, dtype=np.int64)]
+        vaccine_offsets = [np.zeros(1, dtype=np.int64)]
+        n_persons = n_prescriptions = n_vaccines = 0
+        drugs, drug_ids = merge_dimensions([store.drugs for store in stores])
+        for store, new_ids in zip(stores, drug_ids):
+            persons.append(store.persons.with_columns(pl.col(PERSON_INDEX) + n_persons))
+            prescriptions.append(
+                store.prescriptions.with_columns(
+                    pl.col(PERSON_INDEX) + n_persons,
+                    *(
+                        [pl.Series(DRUG_ID, new_ids[store.prescriptions[DRUG_ID]])]
+                        if DRUG_ID in store.prescriptions.columns
+                        else []
+                    ),
+                )
+            )
+            vaccines.append(
+                store.vaccines.with_columns(pl.col(PERSON_INDEX) + n_persons)
+            )
+            prescription_offsets.append(
+                store.prescription_offsets[1:] + n_prescriptions
+            )
+            vaccine_offsets.append(store.vaccine_offsets[1:] + n_vaccines)
+            n_persons += len(store)
+            n_prescriptions += store.prescriptions.height
+            n_vaccines += store.vaccines.height
+
+        # CPZP ids are floats and OZP ids are strings; relaxing makes both strings
+        return cls(
+            persons=pl.concat(persons, how="vertical_relaxed"),
+            prescriptions=pl.concat(prescriptions, how="vertical_relaxed"),
+            vaccines=pl.concat(vaccines, how="vertical_relaxed"),
+            drugs=drugs,
+            prescription_offsets=np.concatenate(prescription_offsets),
+            vaccine_offsets=np.concatenate(vaccine_offsets),
+        )
+
+    def prescriptions_with(self, *columns: str) -> pl.DataFrame:
+        """prescriptions with the given columns of their drugs, e.g.
+        "prescription_type" or "prednison_equiv" (the prescription's total)."""
+        return self.prescriptions.with_columns(
+            drug_columns(self.prescriptions, self.drugs, list(columns))
+        )
+
+    @cached_property
+    def atc_index(self) -> AtcIndex:
+        """Prescription rows by ATC code (common.atc), built on first use."""
+        return AtcIndex.build(self.prescriptions[DRUG_ID].to_numpy(), self.drugs)
+
+    @cached_property
+    def coverage_index(self) -> CoverageIndex:
+        """Study eligibility for any window (common.eligibility), built on
+        first use."""
+        return CoverageIndex.build(
+            self.persons, self.prescription_counts(), self.vaccine_counts()
+        )
+
+    def index_of(self, ids: list | pl.Series) -> np.ndarray:
+        """person_idx of every id, -1 for ids not in the store. Events refer to
+        persons by this dense index only; persons maps it back to the id."""
+        lookup = self.persons.select("id", PERSON_INDEX)
+        return (
+            pl.DataFrame({"id": pl.Series(ids).cast(lookup.schema["id"])})
+            .join(lookup, on="id", how="left", maintain_order="left")
+            .get_column(PERSON_INDEX)
+            .cast(pl.Int64)
+            .fill_null(-1)
+            .to_numpy()
+        )
+
+    def __len__(self) -> int:
+        return self.persons.height
+
+    def __iter__(self) -> Iterator[Person]:
+        return self.iter_persons()
+
+    def column(self, name: str) -> np.ndarray:
+        return self.persons.get_column(name).to_numpy()
+
+    def prescription_counts(self) -> np.ndarray:
+        return np.diff(self.prescription_offsets)
+
+    def vaccine_counts(self) -> np.ndarray:
+        return np.diff(self.vaccine_offsets)
+
+    def dose_rows(self, dose_number: int) -> np.ndarray:
+        """Row of every person's vaccine with this dose number in `vaccines`,
+        -1 for persons with fewer vaccines."""
+        rows = self.vaccine_offsets[:-1] + dose_number - 1
+        return np.where(rows < self.vaccine_offsets[1:], rows, -1)
+
+    def prescriptions_of(self, i: int) -> pl.DataFrame:
+        start, end = self.prescription_offsets[i], self.prescription_offsets[i + 1]
+        return self.prescriptions.slice(start, end - start)
+
+    def vaccines_of(self, i: int) -> pl.DataFrame:
+        start, end = self.vaccine_offsets[i], self.vaccine_offsets[i + 1]
+        return self.vaccines.slice(start, end - start)
+
+    def person(self, i: int) -> Person:
+        return next(self.__build_persons(self.persons.slice(i, 1), i, False))
+
+    def iter_persons(self, compact: bool = False) -> Iterator[Person]:
+        """Object view for code that still expects Person instances.
+
+        With compact=True the low-cardinality strings (latka, ATC group, form,
+        specialization, ...) are interned, so every prescription of the same
+        drug shares one string object."""
+        return self.__build_persons(self.persons, 0, compact)
+
+    def to_persons(self, compact: bool = False) -> list[Person]:
+        return list(self.iter_persons(compact))
+
+    def __build_persons(
+        self, persons: pl.DataFrame, first: int, compact: bool
+    ) -> Iterator[Person]:
+        intern = string_pool() if compact else lambda value: value
+        age_cohorts = {cohort.value: cohort for cohort in AgeCohort}
+        genders = {gender.value: gender for gender in Gender}
+        prescription_types = {kind.value: kind for kind in PrescriptionType}
+
+        start, end = first, first + persons.height
+        prescription_slice = self.prescriptions.slice(
+            self.prescription_offsets[start],
+            self.prescription_offsets[end] - self.prescription_offsets[start],
+        )
+        prescription_rows = prescription_slice.with_columns(
+            drug_columns(
+                prescription_slice,
+                self.drugs,
+                [
+                    "latka",
+                    "prescription_type",
+                    "prednison_equiv",
+                    "equiv_sloucenina",
+                    "atc_skupina",
+                    "lekova_forma",
+                ],
+            )
+        ).iter_rows(named=True)
+        vaccine_rows = self.vaccines.slice(
+            self.vaccine_offsets[start],
+            self.vaccine_offsets[end] - self.vaccine_offsets[start],
+        ).iter_rows(named=True)
+
+        for i, row in enumerate(persons.iter_rows(named=True), start=start):
+            prescriptions = []
+            for _ in range(
+                self.prescription_offsets[i + 1] - self.prescription_offsets[i]
+            ):
+                fields = next(prescription_rows)
+                prescriptions.append(
+                    Prescription(
+                        date=fields["date"],
+                        latka=intern(fields["latka"]),
+                        age_cohort_at_prescription=age_cohorts[
+                            fields["age_cohort_at_prescription"]
+                        ],
+                        prescription_type=prescription_types[
+                            fields["prescription_type"]
+                        ],
+                        prednison_equiv=fields["prednison_equiv"],
+                        equiv_sloucenina=intern(fields["equiv_sloucenina"]),
+                        specializace_lekare=intern(fields["specializace_lekare"]),
+                        atc_skupina=intern(fields["atc_skupina"]),
+                        lekova_forma=intern(fields["lekova_forma"]),
+                    )
+                )
+
+            vaccines = []
+            for _ in range(self.vaccine_offsets[i + 1] - self.vaccine_offsets[i]):
+                fields = next(vaccine_rows)
+                vaccines.append(
+                    Vaccine(
+                        date=fields["date"],
+                        dose_number=fields["dose_number"],
+                        age_cohort=age_cohorts[fields["age_cohort"]],
+                        nazev=intern(fields["nazev"]),
+                    )
+                )
+
+            yield Person(
+                id=row["id"],
+                gender=genders[row["gender"]],
+                born_at=row["born_at"],
+                zahajeni_pojisteni=row["zahajeni_pojisteni"],
+                ukonceni_pojisteni=row["ukonceni_pojisteni"],
+                age_cohort=age_cohorts[row["age_cohort"]],
+                vaccines=vaccines,
+                prescriptions=prescriptions,
+                died_at=row["died_at"],
+                insurer=row["insurer"],
+            )
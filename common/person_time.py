@@ -0,0 +1,207 @@
+from datetime import date
+
+import numpy as np
+import polars as pl
+
+from common.constants.objects import AgeCohort
+from common.daily_series import COHORTS, day_number
+from common.person_store import PERSON_INDEX, PersonStore
+
+AT_RISK_KEYS = ["age_cohort", "gender", "insurer", "vaccinated"]
+# ages at which a person moves on to the next AgeCohort
+COHORT_AGES = [12, 30, 50, 60]
+RATE_PER = 100_000
+
+_NEVER = np.iinfo(np.int32).max
+_ALWAYS = np.iinfo(np.int32).min
+
+
+def _sweep(
+    lo: np.ndarray, hi: np.ndarray, keys: np.ndarray, n_keys: int, n_days: int
+) -> np.ndarray:
+    """(key, day) counts of the half-open day intervals [lo, hi), days counted
+    from 0: +1 where an interval starts, -1 after it ends, then one running
+    sum per key."""
+    lo, hi = np.clip(lo, 0, n_days), np.clip(hi, 0, n_days)
+    keep = lo < hi
+    width = n_days + 1
+    diff = np.bincount(
+        np.concatenate([keys[keep] * width + lo[keep], keys[keep] * width + hi[keep]]),
+        weights=np.repeat([1.0, -1.0], keep.sum()),
+        minlength=n_keys * width,
+    ).reshape(n_keys, width)
+    return np.cumsum(diff[:, :-1], axis=1).round().astype(np.int64)
+
+
+def _covered_days(
+    store: PersonStore, rows: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """[first, last + 1) day numbers of the persons' coverage, cut at death."""
+    persons = store.persons[rows]
+    start = persons["zahajeni_pojisteni"].to_physical().fill_null(_NEVER).to_numpy()
+    end = np.minimum(
+        persons["ukonceni_pojisteni"].to_physical().fill_null(_NEVER - 1).to_numpy(),
+        persons["died_at"].to_physical().fill_null(_NEVER - 1).to_numpy(),
+    )
+    return start.astype(np.int64), end.astype(np.int64) + 1
+
+
+def _cohort_starts(store: PersonStore, rows: np.ndarray) -> np.ndarray:
+    """(person, cohort) first day in each AgeCohort; births are on the 1st of
+    the month, as in the converter."""
+    born = store.persons[rows].select(
+        pl.col("born_at").dt.year().alias("year"),
+        pl.col("born_at").dt.month().alias("month"),
+    )
+    starts = [np.full(len(rows), _ALWAYS, dtype=np.int64)]
+    for age in COHORT_AGES:
+        birthday = born.select(
+            pl.date(pl.col("year") + age, pl.col("month"), 1).to_physical()
+        ).to_series()
+        starts.append(birthday.fill_null(_NEVER).to_numpy().astype(np.int64))
+    return np.stack(starts, axis=1)
+
+
+def _by_day(keys: pl.DataFrame, days: pl.Series, counts: np.ndarray) -> pl.DataFrame:
+    """Long frame of a (key, day) matrix, keys being the rows of keys."""
+    return keys[np.repeat(np.arange(keys.height), len(days))].with_columns(
+        days.gather(np.tile(np.arange(len(days)), keys.height)),
+        pl.Series("at_risk", counts.ravel()),
+    )
+
+
+def at_risk(
+    store: PersonStore,
+    first_day: date,
+    last_day: date,
+    persons: np.ndarray | None = None,
+) -> pl.DataFrame:
+    """Persons at risk per day and AT_RISK_KEYS, from first_day to last_day.
+
+    A person is at risk from the start of their coverage through its end or
+    their death, in the age cohort of that day and vaccinated from their first
+    vaccination on. persons (rows) restricts the population, e.g. to the
+    eligible persons of a study. Days where a key has nobody are left out.
+    """
+    rows = np.arange(len(store)) if persons is None else np.asarray(persons)
+    first, n_days = day_number(first_day), (last_day - first_day).days + 1
+    cover_lo, cover_hi = _covered_days(store, rows)
+
+    first_dose = store.dose_rows(1)[rows]
+    vaccinated_from = np.full(len(rows), _NEVER, dtype=np.int64)
+    has_dose = first_dose >= 0
+    vaccinated_from[has_dose] = (
+        store.vaccines["date"].to_physical().to_numpy()[first_dose[has_dose]]
+    )
+
+    groups = store.persons[rows].select("gender", "insurer")
+    group_keys = groups.unique(maintain_order=True).with_row_index("group")
+    group = groups.join(
+        group_keys,
+        on=["gender", "insurer"],
+        how="left",
+        nulls_equal=True,
+        maintain_order="left",
+    )["group"].to_numpy()
+
+    # one interval per (person, cohort, vaccinated), intersected with coverage
+    cohort_lo = _cohort_starts(store, rows)
+    cohort_hi = np.concatenate(
+        [cohort_lo[:, 1:], np.full((len(rows), 1), _NEVER, dtype=np.int64)], axis=1
+    )
+    lo, hi, keys = [], [], []
+    for cohort in range(len(COHORTS)):
+        for vaccinated in (0, 1):
+            lo.append(
+                np.maximum.reduce(
+                    [
+                        cover_lo,
+                        cohort_lo[:, cohort],
+                        vaccinated_from if vaccinated else cover_lo,
+                    ]
+                )
+            )
+            hi.append(
+                np.minimum.reduce(
+                    [
+                        cover_hi,
+                        cohort_hi[:, cohort],
+                        cover_hi if vaccinated else vaccinated_from,
+                    ]
+                )
+            )
+            keys.append((group * len(COHORTS) + cohort) * 2 + vaccinated)
+    n_keys = group_keys.height * len(COHORTS) * 2
+    counts = _sweep(
+        np.concatenate(lo) - first,
+        np.concatenate(hi) - first,
+        np.concatenate(keys),
+        n_keys,
+        n_days,
+    )
+
+    key_frame = (
+        group_keys.join(
+            pl.DataFrame({"age_cohort": pl.Series(COHORTS, dtype=pl.Enum(AgeCohort))}),
+            how="cross",
+        )
+        .join(pl.DataFrame({"vaccinated": [False, True]}), how="cross")
+        .drop("group")
+    )
+    days = pl.date_range(first_day, last_day, "1d", eager=True).alias("date")
+    return (
+        _by_day(key_frame.select(AT_RISK_KEYS), days, counts)
+        .filter(pl.col("at_risk") > 0)
+        .select("date", *AT_RISK_KEYS, "at_risk")
+    )
+
+
+def at_risk_around(
+    store: PersonStore,
+    anchors: pl.DataFrame,
+    keys: list[str],
+    first_day: int,
+    last_day: int,
+) -> pl.DataFrame:
+    """Anchors at risk per keys and rel_day, from first_day to last_day days
+    after the anchor date. anchors has person_idx, "anchor" (a date) and the
+    keys, e.g. one row per vaccine with its cohort and dose number; an anchor
+    is at risk on the days its person is covered and alive."""
+    rows = anchors[PERSON_INDEX].to_numpy()
+    anchor = anchors["anchor"].to_physical().to_numpy().astype(np.int64)
+    cover_lo, cover_hi = _covered_days(store, rows)
+    key_ids = anchors.select(pl.struct(keys).rank("dense") - 1).to_series()
+    key_frame = (
+        anchors.select(keys)
+        .with_columns(key_ids.alias("key"))
+        .unique("key")
+        .sort("key")
+    )
+    counts = _sweep(
+        cover_lo - anchor - first_day,
+        cover_hi - anchor - first_day,
+        key_ids.to_numpy().astype(np.int64),
+        key_frame.height,
+        last_day - first_day + 1,
+    )
+    days = pl.Series("rel_day", np.arange(first_day, last_day + 1, dtype=np.int64))
+    return _by_day(key_frame.drop("key"), days, counts).filter(pl.col("at_risk") > 0)
+
+
+def daily_rates(
+    metrics: pl.DataFrame,
+    at_risk: pl.DataFrame,
+    keys: list[str],
+    columns: list[str],
+    per: int = RATE_PER,
+) -> pl.DataFrame:
+    """metrics with the at_risk population of their keys (summed over the
+    other at-risk keys) and "<column>_rate" per `per` persons at risk for the
+    given columns; null where nobody was at risk."""
+    population = at_risk.group_by(keys).agg(pl.col("at_risk").sum())
+    return metrics.join(
+        population, on=keys, how="left", maintain_order="left"
+    ).with_columns(
+        (pl.col(column) / pl.col("at_risk") * per).alias(f"{column}_rate")
+        for column in columns
+    )
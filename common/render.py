@@ -0,0 +1,316 @@
+import hashlib
+import json
+import os
+import struct
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from enum import Enum
+
+import numpy as np
+import polars as pl
+
+from common.constants.study import DOSES, PERIODS
+from common.event_study import EventStudy
+from common.trace import traced
+from common.workers import process_pool
+
+# bump when a renderer changes its look, so every chart is drawn again
+RENDER_VERSION = 1
+HASH_KEY = "ChartHash"
+
+
+def _normalize(value):
+    """JSON-able, order-stable form of chart data for hashing."""
+    if isinstance(value, Enum):
+        return _normalize(value.value)
+    if isinstance(value, dict):
+        return [[_normalize(k), _normalize(v)] for k, v in value.items()]
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return _normalize(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+@dataclass(frozen=True)
+class Chart:
+    """One PNG: RENDERERS[renderer](figure, **data), saved with savefig."""
+
+    path: str
+    renderer: str
+    data: dict
+    savefig: dict = field(default_factory=dict)
+
+    def fingerprint(self) -> str:
+        payload = json.dumps(
+            _normalize([RENDER_VERSION, self.renderer, self.data, self.savefig]),
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def stored_fingerprint(path: str) -> str | None:
+    """The ChartHash text chunk of a PNG written by render_chart, if any."""
+    try:
+        with open(path, "rb") as f:
+            if f.read(8) != b"\x89PNG\r\n\x1a\n":
+                return None
+            while header := f.read(8):
+                length, kind = struct.unpack(">I4s", header)
+                if kind in (b"IDAT", b"IEND"):
+                    return None
+                chunk = f.read(length)
+                f.seek(4, os.SEEK_CUR)  # CRC
+                if kind == b"tEXt":
+                    key, _, text = chunk.partition(b"\0")
+                    if key == HASH_KEY.encode():
+                        return text.decode("latin-1")
+    except OSError:
+        return None
+    return None
+
+
+def sums_figure(fig, title: str, panels: list[tuple[str, dict, dict]]) -> None:
+    """max_vax_analysis sums chart: vax/novax before/after bars per metric."""
+    from common.utils import ChartDrawer
+
+    axes = fig.subplots(nrows=1, ncols=len(panels))
+    fig.tight_layout(pad=10.0)
+    fig.suptitle(title, fontsize=36)
+    drawer = ChartDrawer()
+    for ax, (panel_title, vax_map, novax_map) in zip(axes, panels):
+        drawer.draw_vax_vs_unvax_sums(
+            ax=ax,
+            vax_dates_map=vax_map,
+            novax_dates_map=novax_map,
+            rozhodne_datum=0,
+            title=panel_title,
+        )
+
+
+def block_2x2_figure(fig, title: str, panels: list[tuple[str, dict, dict]]) -> None:
+    """max_vax_analysis 2x2 chart: daily values and sums per metric."""
+    from common.utils import ChartDrawer
+
+    axes = fig.subplots(nrows=2, ncols=2 * len(panels))
+    fig.tight_layout(pad=10.0)
+    fig.suptitle(title, fontsize=36)
+    drawer = ChartDrawer()
+    for i, (panel_title, vax_map, novax_map) in enumerate(panels):
+        drawer.draw_2x2_block(
+            vax_dates_map=vax_map,
+            novax_dates_map=novax_map,
+            rozhodne_datum=0,
+            title=panel_title,
+            axes=axes,
+            row_offset=0,
+            col_offset=2 * i,
+        )
+
+
+def vax_timeline_figure(
+    fig,
+    title: str,
+    dates: list[date],
+    counts: list[int],
+    moving_average: list[float],
+    onset: date,
+    vax_period_in_days: int,
+) -> None:
+    """Daily vaccinations with the onset and the 2 * vax period window."""
+    ax = fig.add_subplot()
+    right = onset + 2 * timedelta(days=vax_period_in_days)
+
+    ax.plot(dates, counts, label="Original data", alpha=0.5)
+    ax.plot(dates, moving_average, label="7-day Moving Average", linewidth=2)
+    ax.axvline(
+        onset,
+        color="green",
+        linestyle="--",
+        linewidth=1.5,
+        label=f"Start of vaccination: {onset}",
+    )
+    ax.axvline(onset, color="green", linestyle="--", linewidth=1)
+    ax.axvline(right, color="green", linestyle="--", linewidth=1)
+    ax.axvspan(
+        onset, right, facecolor="green", alpha=0.08, hatch="//", edgecolor="green"
+    )
+
+    ax.set_title(title)
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Number of vaccinations")
+    ax.legend()
+    fig.tight_layout()
+
+
+def chart_figure(fig, **data) -> None:
+    from common.utils import plot_chart
+
+    plot_chart(fig, **data)
+
+
+def bar_chart_figure(fig, **data) -> None:
+    from common.utils import plot_bar_chart
+
+    plot_bar_chart(fig, **data)
+
+
+RENDERERS = {
+    "sums": (sums_figure, (40, 10)),
+    "2x2": (block_2x2_figure, (80, 20)),
+    "vax_timeline": (vax_timeline_figure, (14, 6)),
+    "chart": (chart_figure, (12, 6)),
+    "bar_chart": (bar_chart_figure, (10, 6)),
+}
+
+
+@traced()
+def render_chart(chart: Chart) -> str:
+    """Draw one chart on a pyplot-free Agg figure and save it with its hash."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    renderer, figsize = RENDERERS[chart.renderer]
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    renderer(fig, **chart.data)
+
+    os.makedirs(os.path.dirname(chart.path) or ".", exist_ok=True)
+    fig.savefig(chart.path, metadata={HASH_KEY: chart.fingerprint()}, **chart.savefig)
+    return chart.path
+
+
+@traced()
+def render_charts(
+    charts: list[Chart], max_workers: int | None = None, force: bool = False
+) -> dict[str, int]:
+    """Render the charts whose PNG is missing or was drawn from other data or
+    styling, in a process pool. Returns the rendered and skipped counts."""
+    stale = [
+        chart
+        for chart in charts
+        if force or stored_fingerprint(chart.path) != chart.fingerprint()
+    ]
+    if stale:
+        max_workers = min(max_workers or os.cpu_count() or 1, len(stale))
+        # spawned workers import matplotlib fresh; make sure it never picks a GUI
+        with process_pool(max_workers, MPLBACKEND="Agg") as pool:
+            list(
+                pool.map(
+                    render_chart,
+                    stale,
+                    chunksize=max(1, len(stale) // (4 * max_workers)),
+                )
+            )
+    return {"rendered": len(stale), "skipped": len(charts) - len(stale)}
+
+
+def vax_timeline_charts(
+    daily: pl.DataFrame,
+    onset_map: dict,
+    directory: str,
+    vax_period_in_days: int,
+    doses: list[int] = DOSES,
+) -> list[Chart]:
+    """Daily vaccinations per age cohort and dose (a daily_vaccinations frame),
+    as in max_vax_analysis."""
+    from common.constants.objects import AgeCohort
+
+    charts = []
+    for (cohort, dose_number), counts in daily.partition_by(
+        "age_cohort", "dose_number", as_dict=True, maintain_order=True
+    ).items():
+        age_cohort = AgeCohort(cohort)
+        if dose_number not in doses or dose_number not in onset_map[age_cohort]:
+            continue
+        charts.append(
+            Chart(
+                path=f"{directory}/vax_period/{age_cohort.value}-dose_{dose_number}.png",
+                renderer="vax_timeline",
+                data={
+                    "title": f"Vaccination Timeline - {age_cohort} - Dose {dose_number}",
+                    "dates": counts["date"].to_list(),
+                    "counts": counts["count"].to_list(),
+                    "moving_average": counts["ma"].fill_null(float("nan")).to_list(),
+                    "onset": onset_map[age_cohort][dose_number],
+                    "vax_period_in_days": vax_period_in_days,
+                },
+            )
+        )
+    return charts
+
+
+def sums_charts(
+    study: EventStudy,
+    insurer: str,
+    directory: str,
+    periods: list[int] = PERIODS,
+    doses: list[int] = DOSES,
+    block_2x2: bool = False,
+) -> list[Chart]:
+    """Before/after sums of every metric per period, age cohort and dose of an
+    EventStudy, as in max_vax_analysis; block_2x2 adds the daily-values charts."""
+    from common.constants.objects import AgeCohort
+    from common.daily_series import day_number
+
+    titles = {
+        "predpisy": "Předpisy",
+        "prvopredpisy": "Prvopředpisy",
+        "kortikoidy": "Kortikoidové ekvivalenty",
+        "imunosupresivy": "Imunosupresivní předpisy",
+    }
+    series = study.series()
+    onset_map = study.onset_map()
+    charts = []
+    for period in periods:
+        for age_cohort in AgeCohort:
+            for dose_number in doses:
+                if dose_number not in onset_map[age_cohort]:
+                    continue
+                rozhodne_datum = onset_map[age_cohort][dose_number] + timedelta(
+                    days=study.vax_period_in_days
+                )
+                pivot = day_number(rozhodne_datum)
+                # VAX days are [-period, period), NOVAX days [-period, period]
+                vax_days = range(-period, period)
+                novax_days = range(-period, period + 1)
+                panels = [
+                    (
+                        titles[metric],
+                        dict(
+                            zip(
+                                vax_days,
+                                vax_series.window(
+                                    age_cohort,
+                                    dose_number,
+                                    vax_days.start,
+                                    vax_days.stop,
+                                ).tolist(),
+                            )
+                        ),
+                        dict(
+                            zip(
+                                novax_days,
+                                novax_series.window(
+                                    age_cohort,
+                                    None,
+                                    pivot + novax_days.start,
+                                    pivot + novax_days.stop,
+                                ).tolist(),
+                            )
+                        ),
+                    )
+                    for metric, (vax_series, novax_series) in series.items()
+                ]
+                title = f" {insurer} - {period} Dnů od {rozhodne_datum.strftime('%d.%m.%Y')} - {age_cohort.value} - Dose {dose_number}"
+                name = f"{period}/{age_cohort.value}-dose_{dose_number}.png"
+                data = {"title": title, "panels": panels}
+
+                charts.append(Chart(f"{directory}/sums/{name}", "sums", data))
+                if block_2x2:
+                    charts.append(Chart(f"{directory}/2x2/{name}", "2x2", data))
+    return charts
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import polars as pl
+
+from common.person_store import PersonStore
+
+TABLES = ("persons", "prescriptions", "vaccines", "drugs")
+OFFSETS = ("prescription_offsets", "vaccine_offsets")
+
+
+def shared_path(name: str) -> str:
+    # /dev/shm is RAM-backed on Linux, so the files never touch the disk
+    root = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(root, f"datacon-{name}")
+
+
+def publish(store: PersonStore, name: str) -> str:
+    """Place the store in shared memory under name for workers to attach()."""
+    path = shared_path(name)
+    os.makedirs(path, exist_ok=True)
+    for table in TABLES:
+        getattr(store, table).write_ipc(
+            os.path.join(path, f"{table}.arrow"), compression="uncompressed"
+        )
+    for offsets in OFFSETS:
+        np.save(os.path.join(path, f"{offsets}.npy"), getattr(store, offsets))
+    return path
+
+
+def attach(name: str) -> PersonStore:
+    """Open a published store without copying it.
+
+    Tables are memory-mapped Arrow IPC files, so every worker reads the same
+    physical pages; the store must be treated as read-only.
+    """
+    import pyarrow as pa
+
+    path = shared_path(name)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"No shared person store named {name!r} at {path}")
+
+    tables = {}
+    for table in TABLES:
+        source = pa.memory_map(os.path.join(path, f"{table}.arrow"))
+        tables[table] = pl.from_arrow(pa.ipc.open_file(source).read_all())
+    offsets = {
+        offset: np.load(os.path.join(path, f"{offset}.npy"), mmap_mode="r")
+        for offset in OFFSETS
+    }
+    return PersonStore(**tables, **offsets)
+
+
+def unpublish(name: str) -> None:
+    shutil.rmtree(shared_path(name), ignore_errors=True)
@@ -0,0 +1,107 @@
+import numpy as np
+import polars as pl
+
+
+def increase(before: np.ndarray, after: np.ndarray) -> np.ndarray:
+    """after / before in percent, NaN where before is 0."""
+    before, after = np.asarray(before, dtype=float), np.asarray(after, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(before != 0, after / before * 100, np.nan)
+
+
+def fisher_pvalues(tables: np.ndarray) -> np.ndarray:
+    """Two-sided Fisher exact p-values of an (n, 2, 2) array of tables.
+
+    Counts are truncated to integers; every distinct table is tested once."""
+    from scipy.stats import fisher_exact
+
+    tables = np.trunc(np.asarray(tables, dtype=float)).astype(np.int64)
+    unique, inverse = np.unique(tables.reshape(-1, 4), axis=0, return_inverse=True)
+    pvalues = np.array(
+        [
+            fisher_exact(table.reshape(2, 2), alternative="two-sided")[1]
+            for table in unique
+        ]
+    )
+    return pvalues[inverse.reshape(-1)]
+
+
+def chi2_pvalues(tables: np.ndarray) -> np.ndarray:
+    """Yates-corrected chi-square p-values of an (n, 2, 2) array of tables,
+    a close approximation of the Fisher test once all counts are large."""
+    from scipy.special import erfc
+
+    tables = np.trunc(np.asarray(tables, dtype=float))
+    a, b, c, d = tables[:, 0, 0], tables[:, 0, 1], tables[:, 1, 0], tables[:, 1, 1]
+    n = a + b + c + d
+    margins = (a + b) * (c + d) * (a + c) * (b + d)
+    deviation = np.maximum(np.abs(a * d - b * c) - n / 2, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        statistic = np.where(margins > 0, n * deviation**2 / margins, 0.0)
+    # survival function of chi-square with one degree of freedom
+    return erfc(np.sqrt(statistic / 2))
+
+
+def pvalues(tables: np.ndarray, approximate_above: float | None = None) -> np.ndarray:
+    """Fisher exact p-values, using the chi-square approximation for tables
+    whose smallest cell is at least approximate_above (None: always exact)."""
+    tables = np.asarray(tables, dtype=float).reshape(-1, 2, 2)
+    result = np.empty(tables.shape[0])
+    approximate = np.zeros(tables.shape[0], dtype=bool)
+    if approximate_above is not None:
+        approximate = tables.reshape(-1, 4).min(axis=1) >= approximate_above
+    if approximate.any():
+        result[approximate] = chi2_pvalues(tables[approximate])
+    if (~approximate).any():
+        result[~approximate] = fisher_pvalues(tables[~approximate])
+    return result
+
+
+def before_after_stats(
+    vax_before: np.ndarray,
+    vax_after: np.ndarray,
+    novax_before: np.ndarray,
+    novax_after: np.ndarray,
+    approximate_above: float | None = None,
+) -> pl.DataFrame:
+    """Statistics of many vaccinated/unvaccinated before/after comparisons.
+
+    Row i compares the 2x2 table [[vax_before, vax_after], [novax_before,
+    novax_after]] at index i; the columns match the results grid of
+    max_vax_analysis.ipynb.
+    """
+    vax_before, vax_after, novax_before, novax_after = (
+        np.asarray(values, dtype=float)
+        for values in (vax_before, vax_after, novax_before, novax_after)
+    )
+    vax_increase = increase(vax_before, vax_after)
+    novax_increase = increase(novax_before, novax_after)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(
+            np.isfinite(vax_increase)
+            & np.isfinite(novax_increase)
+            & (novax_after != 0),
+            (vax_after / vax_before) / (novax_after / novax_before),
+            np.nan,
+        )
+    tables = np.stack(
+        [
+            np.stack([vax_before, vax_after], -1),
+            np.stack([novax_before, novax_after], -1),
+        ],
+        -2,
+    )
+    return pl.DataFrame(
+        {
+            "vax_increase": vax_increase,
+            "novax_increase": novax_increase,
+            "diff": vax_increase - novax_increase,
+            "p_value": pvalues(tables, approximate_above),
+            "vax_before": vax_before,
+            "vax_after": vax_after,
+            "novax_before": novax_before,
+            "novax_after": novax_after,
+            "vax_vs_novax_ratio": ratio,
+        },
+        nan_to_null=False,
+    )
@@ -0,0 +1,115 @@
+import json
+import os
+from datetime import datetime
+
+import polars as pl
+
+from common.person_store import PERSON_INDEX, PersonStore
+from common.trace import traced
+
+# Bump whenever the columns or dtypes of the stored tables change
+SCHEMA_VERSION = 5
+TABLES = ("persons", "prescriptions", "vaccines", "drugs")
+METADATA_FILE = "metadata.json"
+FORMATS = {"parquet": "parquet", "ipc": "arrow"}
+
+
+@traced()
+def write_store(
+    store: PersonStore,
+    directory: str,
+    insurer: str,
+    file_format: str = "parquet",
+    source: str | None = None,
+) -> str:
+    """Write one insurer's store as <directory>/<insurer>/{table}.<ext>."""
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown format {file_format!r}, expected one of {FORMATS}")
+
+    path = os.path.join(directory, insurer)
+    os.makedirs(path, exist_ok=True)
+
+    for table in TABLES:
+        df: pl.DataFrame = getattr(store, table)
+        file_path = os.path.join(path, f"{table}.{FORMATS[file_format]}")
+        if file_format == "parquet":
+            df.write_parquet(
+                file_path, metadata={"schema_version": str(SCHEMA_VERSION)}
+            )
+        else:
+            df.write_ipc(file_path, compression="uncompressed")
+
+    metadata = {
+        "schema_version": SCHEMA_VERSION,
+        "insurer": insurer,
+        "format": file_format,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "source": source,
+        "rows": {table: getattr(store, table).height for table in TABLES},
+        "columns": {
+            table: {
+                name: str(dtype) for name, dtype in getattr(store, table).schema.items()
+            }
+            for table in TABLES
+        },
+    }
+    with open(os.path.join(path, METADATA_FILE), "w") as f:
+        json.dump(metadata, f, indent=2, ensure_ascii=False)
+
+    return path
+
+
+def read_metadata(directory: str, insurer: str) -> dict:
+    with open(os.path.join(directory, insurer, METADATA_FILE)) as f:
+        metadata = json.load(f)
+
+    if metadata["schema_version"] != SCHEMA_VERSION:
+        raise ValueError(
+            f"{insurer} store in {directory} has schema version "
+            f"{metadata['schema_version']}, expected {SCHEMA_VERSION}; "
+            "re-run python -m common convert to rebuild it"
+        )
+    return metadata
+
+
+def scan_table(directory: str, insurer: str, table: str) -> pl.LazyFrame:
+    metadata = read_metadata(directory, insurer)
+    file_format = metadata["format"]
+    file_path = os.path.join(directory, insurer, f"{table}.{FORMATS[file_format]}")
+    if file_format == "parquet":
+        return pl.scan_parquet(file_path)
+    return pl.scan_ipc(file_path)
+
+
+@traced()
+def read_store(
+    directory: str,
+    insurers: list[str],
+    persons_columns: list[str] | None = None,
+    prescriptions_columns: list[str] | None = None,
+    vaccines_columns: list[str] | None = None,
+) -> PersonStore:
+    """Load the given insurers as one store, reading only the requested columns.
+
+    person_idx and the (small) drugs table are always read, the object view
+    needs every column.
+    """
+    selected = {
+        "persons": persons_columns,
+        "prescriptions": prescriptions_columns,
+        "vaccines": vaccines_columns,
+    }
+    stores = []
+    for insurer in insurers:
+        tables = {}
+        for table in TABLES:
+            lf = scan_table(directory, insurer, table)
+            if selected.get(table) is not None:
+                lf = lf.select(
+                    [PERSON_INDEX]
+                    + [column for column in selected[table] if column != PERSON_INDEX]
+                )
+            tables[table] = lf.collect()
+        stores.append(PersonStore.from_tables(**tables))
+
+    return stores[0] if len(stores) == 1 else PersonStore.concat(stores)
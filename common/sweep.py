@@ -0,0 +1,132 @@
+import itertools
+import os
+from dataclasses import dataclass
+from datetime import date
+
+import polars as pl
+
+from common.constants.study import DOSES, INSURERS, PERIODS
+from common.event_study import run_event_study
+from common.person_store import PersonStore
+from common.shared import attach, publish, unpublish
+from common.storage import read_store
+from common.trace import traced
+from common.workers import process_pool
+
+# stores loaded by this (worker) process, keyed by (directory, insurer)
+_stores: dict[tuple[str, str], PersonStore] = {}
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """Notebook globals of one analysis run."""
+
+    insurer: str
+    vax_period_in_days: int
+    start_date: date
+    end_date: date
+    onset_threshold: float
+    # comma-separated ATC prefixes the metrics count, None for all
+    outcome: str | None = None
+
+
+def scenarios(
+    insurers: list[str],
+    vax_periods: list[int],
+    start_dates: list[date],
+    end_dates: list[date],
+    onset_thresholds: list[float],
+    outcomes: list[str | None] = [None],
+) -> list[Scenario]:
+    """Cartesian product of the given values, grouped by insurer."""
+    return [
+        Scenario(*values)
+        for values in itertools.product(
+            insurers, vax_periods, start_dates, end_dates, onset_thresholds, outcomes
+        )
+    ]
+
+
+def _load_store(directory: str, insurer: str, shared: str | None = None) -> PersonStore:
+    # attached when the sweep published the store under the name shared
+    if (directory, insurer) not in _stores:
+        _stores[(directory, insurer)] = (
+            read_store(directory, INSURERS[insurer])
+            if shared is None
+            else attach(shared)
+        )
+    return _stores[(directory, insurer)]
+
+
+@traced()
+def run_scenario(
+    scenario: Scenario,
+    directory: str,
+    periods: list[int] = PERIODS,
+    doses: list[int] = DOSES,
+    approximate_above: float | None = None,
+    shared: str | None = None,
+) -> pl.DataFrame:
+    """Results grid of one scenario, prefixed with the scenario's values;
+    shared names the store published by run_sweep, if any."""
+    study = run_event_study(
+        _load_store(directory, scenario.insurer, shared),
+        start_date=scenario.start_date,
+        end_date=scenario.end_date,
+        vax_period_in_days=scenario.vax_period_in_days,
+        onset_threshold=scenario.onset_threshold,
+        outcome=None if scenario.outcome is None else scenario.outcome.split(","),
+    )
+    results = study.results(periods, doses, approximate_above)
+    return results.select(
+        pl.lit(scenario.insurer).alias("insurer"),
+        pl.lit(scenario.vax_period_in_days, pl.Int64).alias("vax_period_days"),
+        pl.lit(scenario.start_date, pl.Date).alias("start_date"),
+        pl.lit(scenario.end_date, pl.Date).alias("end_date"),
+        pl.lit(scenario.onset_threshold, pl.Float64).alias("onset_threshold"),
+        pl.lit(scenario.outcome, pl.String).alias("outcome"),
+        pl.all(),
+    )
+
+
+@traced()
+def run_sweep(
+    scenarios: list[Scenario],
+    directory: str,
+    periods: list[int] = PERIODS,
+    doses: list[int] = DOSES,
+    approximate_above: float | None = None,
+    max_workers: int | None = None,
+) -> pl.DataFrame:
+    """Run every scenario in a process pool and stack the results.
+
+    Every store is read once and published to shared memory (common.shared);
+    workers attach it the first time one of their scenarios needs it, so they
+    all map the same pages instead of holding a copy each.
+    """
+    max_workers = min(max_workers or os.cpu_count() or 1, max(len(scenarios), 1))
+    names = {
+        insurer: f"sweep-{os.getpid()}-{insurer}"
+        for insurer in dict.fromkeys(scenario.insurer for scenario in scenarios)
+    }
+
+    try:
+        for insurer, name in names.items():
+            publish(read_store(directory, INSURERS[insurer]), name)
+        with process_pool(max_workers) as pool:
+            results = list(
+                pool.map(
+                    run_scenario,
+                    scenarios,
+                    [directory] * len(scenarios),
+                    [periods] * len(scenarios),
+                    [doses] * len(scenarios),
+                    [approximate_above] * len(scenarios),
+                    [names[scenario.insurer] for scenario in scenarios],
+                )
+            )
+    finally:
+        for name in names.values():
+            unpublish(name)
+
+    return pl.concat(results)
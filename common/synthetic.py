@@ -0,0 +1,287 @@
+"""Synthetic preskladane extracts with the layout of the real ones.
+
+The real DATACON_data extracts never leave the secure environment; these files
+follow CPZP_SCHEMA/OZP_SCHEMA column for column so every reader, converter and
+chart can be run and timed on any machine, at any size.
+"""
+
+import os
+from datetime import date
+
+import numpy as np
+import polars as pl
+
+from common.constants.column_names import CPZP_COLUMNS, OZP_COLUMNS, SHARED_COLUMNS
+from common.constants.column_types import (
+    CPZP_SCHEMA,
+    OZP_SCHEMA,
+    POHLAVI_CPZP,
+    POHLAVI_OZP,
+    TYP_UDALOSTI,
+    VACCINE_STATUS,
+)
+
+SCHEMAS = {"cpzp": CPZP_SCHEMA, "ozp": OZP_SCHEMA}
+
+# léčivé_látky, ATC_skupina, síla, léková_forma, Prednison_equiv, Pocet_v_baleni
+# and the share of prescriptions; corticoids (H02) carry their Equiv_sloucenina
+DRUGS = [
+    ("PREDNISON", "H02AB07", "5MG", "Tableta", 1.0, 20, 20),
+    ("PREDNISON", "H02AB07", "20MG", "Tableta", 1.0, 20, 8),
+    ("METHYLPREDNISOLON", "H02AB04", "4MG", "Tableta", 1.25, 30, 12),
+    ("METHYLPREDNISOLON", "H02AB04", "16MG", "Tableta", 1.25, 30, 5),
+    ("DEXAMETHASON", "H02AB02", "4MG/ML", "Injekční/infuzní roztok", 6.67, 5, 10),
+    ("BETAMETHASON", "H02AB01", "7MG/ML", "Injekční suspenze", 8.33, 1, 8),
+    ("HYDROKORTISON", "H02AB09", "10MG", "Tableta", 0.25, 20, 5),
+    ("TRIAMCINOLON", "H02AB08", "40MG/ML", "Injekční suspenze", 1.25, 1, 4),
+    ("FLUDROKORTISON", "H02AA02", "0,1MG", "Tableta", 2.5, 100, 2),
+    ("METHOTREXAT", "L04AX03", "2,5MG", "Tableta", None, 50, 8),
+    ("AZATHIOPRIN", "L04AX01", "50MG", "Tableta", None, 50, 5),
+    ("CIKLOSPORIN", "L04AD01", "100MG", "Tobolka, měkká", None, 50, 3),
+    ("MYKOFENOLÁT MOFETIL", "L04AA06", "500MG", "Potahovaná tableta", None, 50, 3),
+    ("ADALIMUMAB", "L04AB04", "40MG", "Injekční roztok", None, 2, 2),
+]
+FORM_ABBREVIATIONS = {
+    "Tableta": "TBL NOB",
+    "Potahovaná tableta": "TBL FLM",
+    "Tobolka, měkká": "CPS MOL",
+    "Injekční roztok": "INJ SOL",
+    "Injekční/infuzní roztok": "INJ/INF SOL",
+    "Injekční suspenze": "INJ SUS",
+}
+# share of prescription rows without any drug information, as in the extracts
+MISSING_DRUG_SHARE = 0.03
+# (Nazev, Kod_udalosti, share of vaccinations)
+VACCINES = [
+    ("Comirnaty", "0250995", 70),
+    ("Spikevax", "0251009", 20),
+    ("Vaxzevria", "0250998", 7),
+    ("COVID-19 Vaccine Janssen", "0251014", 3),
+]
+DOSE_SHARES = [0.3, 0.07, 0.25, 0.28, 0.1]  # persons with 0, 1, 2, 3, 4 doses
+SPECIALIZATIONS = ["001", "002", "101", "105", "107", "108", "202", "305", "603", "702"]
+
+PRESCRIPTIONS_FROM = date(2018, 1, 1)
+PRESCRIPTIONS_TO = date(2024, 12, 31)
+# centre of each age group's wave: the oldest first, everyone else after them
+FIRST_WAVE = date(2021, 1, 15)
+BOOSTER_WAVE = date(2021, 10, 1)
+AUTUMN_WAVE = date(2022, 10, 15)
+
+
+def _days(value: date) -> int:
+    return (value - date(1970, 1, 1)).days
+
+
+def _dates(days: np.ndarray) -> pl.Series:
+    return pl.Series(days.astype("datetime64[D]"))
+
+
+def _persons(rng: np.random.Generator, n: int) -> dict[str, np.ndarray]:
+    birth_year = rng.integers(1925, 2021, n)
+    age = 2021 - birth_year
+    doses = rng.choice(len(DOSE_SHARES), n, p=DOSE_SHARES)
+    doses[(age < 12) & (rng.random(n) < 0.9)] = 0
+    prescriptions = np.where(rng.random(n) < 0.4, 0, rng.poisson(4, n))
+    start = rng.integers(_days(date(1995, 1, 1)), _days(date(2024, 1, 1)), n)
+    end = np.where(
+        rng.random(n) < 0.15,
+        rng.integers(_days(date(2015, 1, 1)), _days(date(2026, 1, 1)), n),
+        -1,
+    )
+    death = np.where(
+        rng.random(n) < 0.04 + 0.08 * (age > 75),
+        rng.integers(_days(date(2019, 1, 1)), _days(date(2025, 1, 1)), n),
+        -1,
+    )
+
+    # Older people come first in every wave, a few days per year of age
+    delay = np.clip(85 - age, 0, 70)
+    first = _days(FIRST_WAVE) + delay * 2.5 + rng.normal(0, 20, n)
+    second = first + rng.integers(21, 43, n)
+    third = np.maximum(
+        second + 90, _days(BOOSTER_WAVE) + delay * 1.5 + rng.normal(0, 25, n)
+    )
+    fourth = np.maximum(third + 90, _days(AUTUMN_WAVE) + rng.normal(0, 30, n))
+    return {
+        "birth_year": birth_year,
+        "birth_month": rng.integers(1, 13, n),
+        "female": rng.random(n) < 0.51,
+        "doses": doses,
+        "prescriptions": prescriptions,
+        "start": start,
+        "end": end,
+        "death": death,
+        "dose_days": np.stack([first, second, third, fourth], axis=1).astype(np.int64),
+        "vaccine": rng.choice(
+            len(VACCINES),
+            n,
+            p=np.array([share for *_, share in VACCINES]) / 100,
+        ),
+    }
+
+
+def _chunk(
+    rng: np.random.Generator, insurer: str, first_id: int, n: int, max_rows: int
+) -> pl.DataFrame:
+    """Rows of n persons (fewer if max_rows is reached), sorted by person and date."""
+    p = _persons(rng, n)
+    rows_per_person = np.maximum(p["doses"] + p["prescriptions"], 1)
+    n = max(1, int(np.searchsorted(np.cumsum(rows_per_person), max_rows, "right")))
+    p = {name: values[:n] for name, values in p.items()}
+    rows_per_person = rows_per_person[:n]
+
+    person = np.repeat(np.arange(n), rows_per_person)
+    offsets = np.concatenate([[0], np.cumsum(rows_per_person)[:-1]])
+    position = np.arange(len(person)) - offsets[person]
+    doses = p["doses"][person]
+    is_vaccine = position < doses
+    is_prescription = ~is_vaccine & (position < doses + p["prescriptions"][person])
+
+    event_day = np.full(len(person), -1)
+    dose = np.minimum(position, 3)
+    event_day[is_vaccine] = p["dose_days"][person, dose][is_vaccine]
+    event_day[is_prescription] = rng.integers(
+        _days(PRESCRIPTIONS_FROM), _days(PRESCRIPTIONS_TO) + 1, is_prescription.sum()
+    )
+    order = np.lexsort(
+        (np.where(event_day < 0, np.iinfo(np.int64).max, event_day), person)
+    )
+    person, is_vaccine, is_prescription, event_day = (
+        person[order],
+        is_vaccine[order],
+        is_prescription[order],
+        event_day[order],
+    )
+
+    weights = np.array([drug[-1] for drug in DRUGS], dtype=float)
+    drug = rng.choice(len(DRUGS), len(person), p=weights / weights.sum())
+    has_drug = is_prescription & (rng.random(len(person)) >= MISSING_DRUG_SHARE)
+
+    def drug_column(field: int) -> pl.Series:
+        values = pl.Series([d[field] for d in DRUGS])
+        return values.gather(drug).scatter(np.flatnonzero(~has_drug), None)
+
+    def person_dates(days: np.ndarray) -> pl.Series:
+        days = days[person]
+        return _dates(days).scatter(np.flatnonzero(days < 0), None)
+
+    vaccine = p["vaccine"][person]
+    form_abbreviation = drug_column(3).replace_strict(FORM_ABBREVIATIONS)
+    event_type = pl.Series(
+        [TYP_UDALOSTI.VAKCINACE.value, TYP_UDALOSTI.PREDPIS.value, None]
+    ).gather(np.where(is_vaccine, 0, np.where(is_prescription, 1, 2)))
+    death = person_dates(p["death"])
+    columns = {
+        SHARED_COLUMNS.POHLAVI.value: np.where(
+            p["female"][person],
+            (POHLAVI_CPZP if insurer == "cpzp" else POHLAVI_OZP).ZENA.value,
+            POHLAVI_CPZP.MUZ.value,
+        ),
+        SHARED_COLUMNS.ROK_NAROZENI.value: p["birth_year"][person],
+        CPZP_COLUMNS.MESIC_NAROZENI.value: p["birth_month"][person],
+        SHARED_COLUMNS.POSLEDNI_ZAHAJENI_POJISTENI.value: _dates(p["start"][person]),
+        SHARED_COLUMNS.POSLEDNI_UKONCENI_POJISTENI.value: person_dates(p["end"]),
+        SHARED_COLUMNS.DATUM_UMRTI.value: death,
+        CPZP_COLUMNS.ROK_UMRTI.value: death.dt.year(),
+        CPZP_COLUMNS.MESIC_UMRTI.value: death.dt.month(),
+        SHARED_COLUMNS.TYP_UDALOSTI.value: event_type,
+        CPZP_COLUMNS.KOD_UDALOSTI.value: pl.Series([code for _, code, _ in VACCINES])
+        .gather(vaccine)
+        .scatter(np.flatnonzero(~is_vaccine), None),
+        OZP_COLUMNS.NAZEV.value: pl.Series([name for name, _, _ in VACCINES])
+        .gather(vaccine)
+        .scatter(np.flatnonzero(~is_vaccine), None),
+        SHARED_COLUMNS.DETAIL_UDALOSTI.value: pl.Series(
+            rng.integers(1, 100_000, len(person))
+        ).scatter(np.flatnonzero(~is_prescription), None),
+        SHARED_COLUMNS.POCET_BALENI.value: pl.Series(
+            rng.choice([1.0, 1.0, 1.0, 2.0, 3.0], len(person))
+        ).scatter(np.flatnonzero(~is_prescription), None),
+        SHARED_COLUMNS.DATUM_UDALOSTI.value: _dates(event_day).scatter(
+            np.flatnonzero(event_day < 0), None
+        ),
+        CPZP_COLUMNS.SPECIALIZACE.value: pl.Series(SPECIALIZATIONS)
+        .gather(rng.integers(0, len(SPECIALIZATIONS), len(person)))
+        .scatter(
+            np.flatnonzero(~is_prescription | (rng.random(len(person)) < 0.2)), None
+        ),
+        SHARED_COLUMNS.LEKOVA_FORMA_ZKR.value: form_abbreviation,
+        SHARED_COLUMNS.ATC_SKUPINA.value: drug_column(1),
+        SHARED_COLUMNS.SILA.value: drug_column(2),
+        SHARED_COLUMNS.DOPLNEK_NAZVU.value: (
+            drug_column(2)
+            + " "
+            + form_abbreviation
+            + " "
+            + drug_column(5).cast(pl.String)
+        ),
+        SHARED_COLUMNS.LEKOVA_FORMA.value: drug_column(3),
+        SHARED_COLUMNS.LECIVE_LATKY.value: drug_column(0),
+        SHARED_COLUMNS.EQUIV_SLOUCENINA.value: pl.Series(
+            [latka if atc.startswith("H02") else None for latka, atc, *_ in DRUGS]
+        )
+        .gather(drug)
+        .scatter(np.flatnonzero(~has_drug), None),
+        SHARED_COLUMNS.PREDNISON_EQUIV.value: drug_column(4),
+        SHARED_COLUMNS.POCET_V_BALENI.value: drug_column(5).cast(pl.Float64),
+        SHARED_COLUMNS.POCET_VAKCINACI.value: p["doses"][person],
+        SHARED_COLUMNS.OCKOVANY.value: np.where(
+            p["doses"][person] > 0,
+            VACCINE_STATUS.OCKOVANY.value,
+            VACCINE_STATUS.NEOCKOVANY.value,
+        ),
+        SHARED_COLUMNS.POCET_PREDPISU.value: p["prescriptions"][person],
+    }
+    ids = pl.Series(first_id + person)
+    columns[SHARED_COLUMNS.ID_POJISTENCE.value] = (
+        ids.cast(pl.Float64)
+        if insurer == "cpzp"
+        else "P" + ids.cast(pl.String).str.zfill(9)
+    )
+
+    schema = SCHEMAS[insurer]
+    return pl.DataFrame(
+        {name: columns.get(name, pl.Series([None] * len(person))) for name in schema}
+    ).cast(dict(schema))
+
+
+def generate(
+    file_path: str,
+    insurer: str,
+    rows: int,
+    seed: int = 0,
+    chunk_rows: int = 1_000_000,
+    shuffle: bool = False,
+) -> int:
+    """Write a synthetic <INSURER>_preskladane.csv of about rows rows (whole
+    persons only) in chunks of chunk_rows, and return the number of persons.
+    Rows are sorted by person and date, like the real extracts; shuffle mixes
+    them within each chunk instead."""
+    rng = np.random.default_rng([seed, list(SCHEMAS).index(insurer)])
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    written = persons = 0
+    with open(file_path, "wb") as f:
+        while written < rows:
+            target = min(chunk_rows, rows - written)
+            # ~3.7 rows per person on average, so ask for enough persons
+            chunk = _chunk(rng, insurer, persons, target // 3 + 1, target)
+            if shuffle:
+                chunk = chunk[rng.permutation(chunk.height)]
+            chunk.write_csv(f, include_header=written == 0, null_value="NA")
+            written += chunk.height
+            persons += chunk[SHARED_COLUMNS.ID_POJISTENCE.value].n_unique()
+    return persons
+
+
+def generate_sources(
+    directory: str, rows: int, seed: int = 0, shuffle: bool = False
+) -> dict[str, tuple[str, pl.Schema]]:
+    """Synthetic extracts of every insurer, rows rows each, in the SOURCES
+    layout the converter takes."""
+    sources = {}
+    for insurer, schema in SCHEMAS.items():
+        file_path = os.path.join(directory, f"{insurer.upper()}_preskladane.csv")
+        generate(file_path, insurer, rows, seed, shuffle=shuffle)
+        sources[insurer] = (file_path, schema)
+    return sources
@@ -0,0 +1,209 @@
+"""Opt-in per-stage timings, row counts and memory high-water marks.
+
+Set DATACON_TRACE=<path> (or pass --trace <path> to python -m common) and every
+stage() block and @traced function records its wall time, CPU time, rows in and
+out and peak RSS. At exit the process writes a JSON trace to <path>, with the
+records of spawned workers merged in, and prints a summary table to stderr.
+Without the variable both are no-ops.
+"""
+
+import atexit
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from functools import wraps
+
+TRACE_ENV = "DATACON_TRACE"
+
+
+@dataclass
+class Stage:
+    name: str
+    path: str
+    started_s: float
+    rows_in: int | None = None
+    rows_out: int | None = None
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    peak_rss_mb: float = 0.0
+    pid: int = field(default_factory=os.getpid)
+
+
+_records: list[Stage] = []
+_open: list[Stage] = []
+_origin = time.perf_counter()
+_registered = False
+
+
+def trace_path() -> str | None:
+    return os.environ.get(TRACE_ENV) or None
+
+
+def _peak_rss_mb() -> float:
+    """Peak RSS since the last _reset_peak; ru_maxrss where there is no /proc."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _reset_peak() -> None:
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux >= 4.0)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _update_peaks() -> None:
+    # The high-water mark since the last boundary belongs to every open stage
+    peak = _peak_rss_mb()
+    for record in _open:
+        record.peak_rss_mb = max(record.peak_rss_mb, peak)
+    _reset_peak()
+
+
+def rows(value) -> int | None:
+    """Row count of a DataFrame, or length of a list; None for anything else."""
+    if hasattr(value, "height"):
+        return value.height
+    if isinstance(value, list):
+        return len(value)
+    return None
+
+
+@contextmanager
+def stage(name: str, rows_in: int | None = None):
+    """Record the enclosed block; set .rows_out on the yielded Stage."""
+    if trace_path() is None:
+        yield Stage(name, name, 0.0, rows_in)
+        return
+
+    _register()
+    _update_peaks()
+    record = Stage(
+        name,
+        "/".join([*(parent.name for parent in _open), name]),
+        time.perf_counter() - _origin,
+        rows_in,
+    )
+    _open.append(record)
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        record.wall_s = time.perf_counter() - wall
+        record.cpu_s = time.process_time() - cpu
+        _update_peaks()
+        _open.remove(record)
+        _records.append(record)
+
+
+def traced(name: str | None = None):
+    """Decorator form of stage(); rows_out is the returned frame's or list's size."""
+
+    def decorate(function):
+        label = name or function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if trace_path() is None:
+                return function(*args, **kwargs)
+            with stage(label) as record:
+                result = function(*args, **kwargs)
+                record.rows_out = rows(result)
+                return result
+
+        return wrapper
+
+    return decorate
+
+
+def summary(records: list[dict]) -> str:
+    """Per stage path: calls, total wall and CPU seconds, rows and peak RSS."""
+    totals: dict[str, dict] = {}
+    for record in records:
+        total = totals.setdefault(
+            record["path"],
+            {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": 0.0},
+        )
+        total["calls"] += 1
+        total["wall_s"] += record["wall_s"]
+        total["cpu_s"] += record["cpu_s"]
+        total["peak_rss_mb"] = max(total["peak_rss_mb"], record["peak_rss_mb"])
+        for key in ("rows_in", "rows_out"):
+            if record[key] is not None:
+                total[key] = total.get(key, 0) + record[key]
+
+    width = max([len(path) for path in totals] + [5])
+    lines = [
+        f"{'stage':<{width}} {'calls':>6} {'wall s':>9} {'cpu s':>9} "
+        f"{'rows in':>12} {'rows out':>12} {'peak MB':>9}"
+    ]
+    for path, total in sorted(totals.items()):
+        lines.append(
+            f"{path:<{width}} {total['calls']:>6} {total['wall_s']:>9.3f} "
+            f"{total['cpu_s']:>9.3f} {total.get('rows_in', ''):>12} "
+            f"{total.get('rows_out', ''):>12} {total['peak_rss_mb']:>9.1f}"
+        )
+    return "\n".join(lines)
+
+
+def _worker_file(path: str, pid: int) -> str:
+    return f"{path}.{pid}.part"
+
+
+def _worker_files(path: str) -> list[str]:
+    """The <path>.<pid>.part files workers left next to the trace; nothing
+    else that shares its prefix, e.g. trace.json next to trace."""
+    return [
+        file
+        for file in glob.glob(f"{glob.escape(path)}.*.part")
+        if file[len(path) + 1 : -len(".part")].isdigit()
+    ]
+
+
+def _write() -> None:
+    path = trace_path()
+    if path is None or not _records:
+        return
+    records = [asdict(record) for record in _records]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    if multiprocessing.parent_process() is not None:
+        # A worker: leave its records next to the trace for the main process
+        with open(_worker_file(path, os.getpid()), "w") as f:
+            json.dump(records, f)
+        return
+
+    for worker_file in _worker_files(path):
+        with open(worker_file) as f:
+            records.extend(json.load(f))
+        os.remove(worker_file)
+    with open(path, "w") as f:
+        json.dump(
+            {"argv": sys.argv, "pid": os.getpid(), "stages": records}, f, indent=1
+        )
+    print(summary(records), file=sys.stderr)
+
+
+def _register() -> None:
+    global _registered
+    if not _registered:
+        if multiprocessing.parent_process() is None:
+            # leftovers of an earlier run that did not get to merge them
+            for worker_file in _worker_files(trace_path()):
+                os.remove(worker_file)
+        atexit.register(_write)
+        _registered = True
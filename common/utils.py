@@ -1,14 +1,12 @@
 from typing import Any
-import matplotlib.pyplot as plt
 import numpy as np
 import os
 from collections import defaultdict
 
-import polars as pl
-from datetime import timedelta, datetime
+from datetime import date, timedelta, datetime
 
-import matplotlib.dates as mdates
-from matplotlib.patches import Patch
+# matplotlib and polars are imported by the functions that draw, so importing
+# this module (e.g. in workers that never plot) stays cheap
 
 
 def draw_bar_chart(
@@ -18,22 +16,35 @@ def draw_bar_chart(
     title,
     save_location: str | None = None,
 ):
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(10, 6))
+    plot_bar_chart(fig, mapp, x_label, y_label, title)
+
+    if save_location:
+        plt.savefig(save_location)
+    else:
+        plt.show()
+
+
+def plot_bar_chart(fig, mapp, x_label, y_label, title):
+    ax = fig.add_subplot()
+
     # Convert enum keys to their value for display
     x_data = [str(k.value) if hasattr(k, "value") else str(k) for k in mapp.keys()]
     y_data = list(mapp.values())
 
-    plt.figure(figsize=(10, 6))
-    bars = plt.bar(x_data, y_data, color="skyblue", edgecolor="black")
+    bars = ax.bar(x_data, y_data, color="skyblue", edgecolor="black")
 
-    plt.xlabel(x_label)
-    plt.xticks(rotation=90)
-    plt.ylabel(y_label)
-    plt.title(title)
-    plt.tight_layout()
+    ax.set_xlabel(x_label)
+    ax.tick_params(axis="x", labelrotation=90)
+    ax.set_ylabel(y_label)
+    ax.set_title(title)
+    fig.tight_layout()
 
     # Optionally annotate bars with their values
     for bar, value in zip(bars, y_data):
-        plt.text(
+        ax.text(
             bar.get_x() + bar.get_width() / 2,
             bar.get_height(),
             f"{value:,}",
@@ -42,22 +53,41 @@ def draw_bar_chart(
             fontsize=10,
         )
 
+
+def draw_chart(
+    mapp,
+    x_label,
+    y_label,
+    title,
+    average: int | None = None,
+    save_location: str | None = None,
+    vertical_line: Any = None,
+):
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(12, 6))
+    plot_chart(fig, mapp, x_label, y_label, title, average, vertical_line)
+
     if save_location:
-        plt.savefig(save_location)
+        os.makedirs(os.path.dirname(save_location), exist_ok=True)
+        plt.savefig(save_location, dpi=300, bbox_inches="tight")
+        plt.close()
+        print(f"✓ Chart saved: {save_location}")
     else:
         plt.show()
+        plt.close()
 
 
-def draw_chart(
+def plot_chart(
+    fig,
     mapp,
     x_label,
     y_label,
     title,
     average: int | None = None,
-    save_location: str | None = None,
     vertical_line: Any = None,
 ):
-    plt.figure(figsize=(12, 6))
+    ax = fig.add_subplot()
 
     x_data = list(mapp.keys())
     y_data = list(mapp.values())
@@ -66,7 +96,7 @@ def draw_chart(
         *sorted(zip(x_data, y_data))
     )
 
-    plt.plot(
+    ax.plot(
         sorted_days_after_last_vax,
         sorted_first_prescription_counts,
         label="Original data",
@@ -80,7 +110,7 @@ def draw_chart(
         smoothed_counts = moving_average(sorted_first_prescription_counts, window_size)
         smoothed_days = sorted_days_after_last_vax[window_size - 1 :]
 
-        plt.plot(
+        ax.plot(
             smoothed_days,
             smoothed_counts,
             color="red",
@@ -95,7 +125,7 @@ def draw_chart(
         )
         closest_x = sorted_days_after_last_vax[closest_index]
 
-        plt.axvline(
+        ax.axvline(
             x=vertical_line,
             color="green",
             linestyle="--",
@@ -103,21 +133,12 @@ def draw_chart(
             label=f"Day {closest_x}",
         )
 
-    plt.xlabel(x_label)
-    plt.ylabel(y_label)
-    plt.title(title)
-    plt.legend()
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-
-    if save_location:
-        os.makedirs(os.path.dirname(save_location), exist_ok=True)
-        plt.savefig(save_location, dpi=300, bbox_inches="tight")
-        plt.close()
-        print(f"✓ Chart saved: {save_location}")
-    else:
-        plt.show()
-        plt.close()
+    ax.set_xlabel(x_label)
+    ax.set_ylabel(y_label)
+    ax.set_title(title)
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
 
 
 def moving_average(data, window_size=7):
@@ -175,6 +196,20 @@ class ChartDrawer:
         )
 
     def __draw_scatter_plot(self, ax, x_data, y_data, title, rozhodne_datum, total_sum):
+        if isinstance(rozhodne_datum, date):
+            self.__draw_date_scatter_plot(
+                ax, x_data, y_data, title, rozhodne_datum, total_sum
+            )
+        else:
+            self.__draw_day_scatter_plot(
+                ax, x_data, y_data, title, rozhodne_datum, total_sum
+            )
+
+    def __draw_date_scatter_plot(
+        self, ax, x_data, y_data, title, rozhodne_datum, total_sum
+    ):
+        import matplotlib.dates as mdates
+
         ax.plot(x_data, y_data, label="Data", alpha=0.7, marker="o", linestyle="None")
 
         ax.axvline(
@@ -233,6 +268,65 @@ class ChartDrawer:
             bbox=dict(boxstyle="round,pad=0.3", fc="white", ec="gray", alpha=0.5),
         )
 
+    def __draw_day_scatter_plot(
+        self, ax, x_data, y_data, title, rozhodne_datum, total_sum
+    ):
+        """Same chart over days relative to the vaccination (ints)."""
+        ax.plot(x_data, y_data, label="Data", alpha=0.7, marker="o", linestyle="None")
+
+        # --- Bucket by weeks (7-day bins) ---
+        weekly_buckets = defaultdict(list)
+        for x, y in zip(x_data, y_data):
+            # integer division to assign week bin
+            week_start = (x // 7) * 7
+            weekly_buckets[week_start].append(y)
+
+        # Compute weekly averages
+        weekly_avg_points = sorted(
+            (week_start, sum(vals) / len(vals))
+            for week_start, vals in weekly_buckets.items()
+        )
+        avg_x, avg_y = zip(*weekly_avg_points)
+
+        # --- Draw line for weekly averages ---
+        ax.plot(avg_x, avg_y, linewidth=2, marker="o", label="Týdenní průměr")
+
+        # rozhodné datum (vypadá jako int, takže taky použijeme přímku)
+        ax.axvline(
+            x=rozhodne_datum,
+            color="green",
+            linestyle="--",
+            linewidth=2,
+        )
+
+        # průměry před/po
+        before_values = [y for x, y in zip(x_data, y_data) if x < rozhodne_datum]
+        if before_values:
+            before_avg = sum(before_values) / len(before_values)
+            ax.axhline(before_avg, color="blue", linestyle="--", label="Průměr před")
+
+        after_values = [y for x, y in zip(x_data, y_data) if x >= rozhodne_datum]
+        if after_values:
+            after_avg = sum(after_values) / len(after_values)
+            ax.axhline(after_avg, color="purple", linestyle="--", label="Průměr po")
+
+        ax.tick_params(axis="x", rotation=45)
+        ax.set_xlabel("Dny kolem data očkování")
+        ax.set_ylabel("Počet předpisů (týdenní průměr)")
+        ax.set_title(title)
+        ax.legend()
+        ax.grid(True, alpha=0.3)
+        ax.text(
+            0.99,
+            0.95,
+            f"Celkem: {total_sum:,}",
+            transform=ax.transAxes,
+            ha="right",
+            va="top",
+            fontsize=10,
+            bbox=dict(boxstyle="round,pad=0.3", fc="white", ec="gray", alpha=0.5),
+        )
+
     def __draw_bar_chart(self, ax, x_data, y_data, title):
         bars = ax.bar(
             x_data,
@@ -269,6 +363,8 @@ class ChartDrawer:
     def draw_vax_vs_unvax_sums(
         self, ax, vax_dates_map, novax_dates_map, rozhodne_datum, title
     ):
+        from matplotlib.patches import Patch
+
         vax = self.__get_before_after_sums(vax_dates_map, rozhodne_datum)
         novax = self.__get_before_after_sums(novax_dates_map, rozhodne_datum)
 
@@ -332,14 +428,13 @@ class ChartDrawer:
 
 
 def plot_vax_timeline(vax_dates_map, age_cohort, dose_number):
-    df = pl.DataFrame({"date": vax_dates_map[age_cohort][dose_number]})
-    counts = df.group_by("date").len().rename({"len": "count"}).sort("date")
-    start, end = counts["date"].min(), counts["date"].max()
-    counts = (
-        pl.DataFrame({"date": pl.date_range(start, end, "1d", eager=True)})
-        .join(counts, on="date", how="left")
-        .fill_null(0)
-        .with_columns(pl.col("count").rolling_mean(7).alias("ma"))
+    import matplotlib.pyplot as plt
+    import polars as pl
+
+    from common.onsets import daily_counts
+
+    counts = daily_counts(
+        pl.DataFrame({"date": vax_dates_map[age_cohort][dose_number]}), []
     )
 
     # peak den
@@ -0,0 +1,32 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import get_context
+from typing import Iterator
+
+
+@contextmanager
+def process_pool(max_workers: int, **environ: str) -> Iterator[ProcessPoolExecutor]:
+    """Pool of spawned workers that split the cores between their Polars
+    thread pools, with environ set for them too.
+
+    Spawned processes inherit the environment at creation time, so it is set
+    around the pool's lifetime and restored afterwards.
+    """
+    environ = {
+        "POLARS_MAX_THREADS": str(max(1, (os.cpu_count() or 1) // max_workers)),
+        **environ,
+    }
+    previous = {name: os.environ.get(name) for name in environ}
+    os.environ.update(environ)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=get_context("spawn")
+        ) as pool:
+            yield pool
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
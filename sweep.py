@@ -0,0 +1,7 @@
+import sys
+
+from common.__main__ import main
+
+if __name__ == "__main__":
+    # same as python -m common sweep ...
+    main(["sweep", *sys.argv[1:]])
@@ -0,0 +1,31 @@
+import pytest
+
+from common.converter import convert
+from common.synthetic import generate_sources
+
+# rows per insurer: enough for every age cohort to have a wave of each dose
+ROWS = 10_000
+
+
+@pytest.fixture(scope="session")
+def sources(tmp_path_factory) -> dict:
+    """Synthetic preskladane extracts (common.synthetic), in the shape of
+    converter.SOURCES."""
+    return generate_sources(str(tmp_path_factory.mktemp("data")), ROWS, seed=0)
+
+
+@pytest.fixture(scope="session")
+def shuffled_sources(tmp_path_factory) -> dict:
+    """Extracts like sources, with every file's rows out of person and date
+    order."""
+    return generate_sources(
+        str(tmp_path_factory.mktemp("shuffled")), ROWS, seed=0, shuffle=True
+    )
+
+
+@pytest.fixture(scope="session")
+def store_directory(sources, tmp_path_factory) -> str:
+    """The persons store of the extracts, converted once per session."""
+    directory = str(tmp_path_factory.mktemp("persons"))
+    convert(directory, sources=sources, max_workers=1)
+    return directory
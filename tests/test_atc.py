@@ -0,0 +1,62 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from common.atc import ATC_LEVELS, AtcIndex
+from common.storage import read_store
+
+CODES = ["L04AX03", "L04AX01", "H02AB07", "L04AB04", None, "L04", "H02AB02"]
+PREFIXES = ["L04", "L04AX", "L04AX03", "H", "Z", ["L04", "L04AX"], ["H02AB07", "L"]]
+
+
+@pytest.fixture(scope="module")
+def index() -> tuple[AtcIndex, pl.Series]:
+    """An index of 500 prescriptions of CODES (one without a code), and the
+    code of every prescription."""
+    drug_ids = np.random.default_rng(0).integers(0, len(CODES), 500)
+    drugs = pl.DataFrame({"atc_skupina": pl.Series(CODES, dtype=pl.Categorical)})
+    codes = pl.Series(CODES, dtype=pl.String).gather(drug_ids)
+    return AtcIndex.build(drug_ids, drugs), codes
+
+
+def starts_with(codes: pl.Series, prefixes: str | list[str]) -> np.ndarray:
+    prefixes = [prefixes] if isinstance(prefixes, str) else prefixes
+    matches = np.zeros(len(codes), dtype=bool)
+    for prefix in prefixes:
+        matches |= codes.str.starts_with(prefix).fill_null(False).to_numpy()
+    return matches
+
+
+@pytest.mark.parametrize("prefixes", PREFIXES)
+def test_rows_of_and_mask(index, prefixes):
+    index, codes = index
+    expected = starts_with(codes, prefixes)
+    assert np.array_equal(index.mask(prefixes), expected)
+    assert np.array_equal(index.rows_of(prefixes), np.flatnonzero(expected))
+    if isinstance(prefixes, str):
+        assert index.count(prefixes) == expected.sum()
+
+
+@pytest.mark.parametrize("level", list(ATC_LEVELS))
+def test_groups(index, level):
+    index, codes = index
+    length = ATC_LEVELS[level]
+    expected = (
+        codes.to_frame("atc")
+        .filter(pl.col("atc").str.len_chars() >= length)
+        .group_by(pl.col("atc").str.slice(0, length))
+        .agg(pl.len().cast(pl.Int64).alias("prescriptions"))
+        .sort("atc")
+    )
+    actual = index.groups(level).with_columns(pl.col("prescriptions").cast(pl.Int64))
+    assert actual.equals(expected)
+
+
+def test_store_index(store_directory):
+    store = read_store(store_directory, ["cpzp", "ozp"])
+    codes = store.prescriptions_with("atc_skupina")["atc_skupina"].cast(pl.String)
+    for prefixes in ["L04", ["H02AB", "L04AX"], "H02AB02"]:
+        expected = starts_with(codes, prefixes)
+        assert np.array_equal(
+            store.atc_index.rows_of(prefixes), np.flatnonzero(expected)
+        )
@@ -0,0 +1,109 @@
+import pytest
+
+from common import baseline
+from common.benchmark import (
+    END_DATE,
+    ONSET_THRESHOLD,
+    START_DATE,
+    VAX_PERIOD_IN_DAYS,
+    _difference,
+    _persons_difference,
+    _results_difference,
+    _study,
+    chronological,
+    verify,
+)
+from common.converter import DataframeToPersonsClassConverter
+from common.person_store import PersonStore
+
+INSURERS = ["cpzp", "ozp"]
+
+
+@pytest.fixture(scope="module")
+def reference(sources) -> dict:
+    """Per insurer: the extract, the baseline's persons and notebook maps."""
+    reference = {}
+    for insurer, (file_path, schema) in sources.items():
+        df = baseline.read_preskladane_data(file_path, schema)
+        persons = baseline.DataframeToPersonsClassConverter().convert(df)
+        maps = baseline.notebook_maps(
+            persons, START_DATE, END_DATE, VAX_PERIOD_IN_DAYS, ONSET_THRESHOLD
+        )
+        reference[insurer] = (df, persons, maps)
+    return reference
+
+
+@pytest.fixture(scope="module")
+def stores(reference) -> dict[str, PersonStore]:
+    return {
+        insurer: DataframeToPersonsClassConverter(insurer=insurer).convert_to_store(df)
+        for insurer, (df, _, _) in reference.items()
+    }
+
+
+@pytest.mark.parametrize("insurer", INSURERS)
+def test_persons_match_baseline(reference, stores, insurer):
+    df, persons, _ = reference[insurer]
+    assert _persons_difference(persons, stores[insurer].to_persons()) is None
+    converted = DataframeToPersonsClassConverter().convert(df)
+    assert _persons_difference(persons, converted) is None
+
+
+@pytest.mark.parametrize("insurer", INSURERS)
+def test_event_study_maps_match_baseline(reference, stores, insurer):
+    _, _, maps = reference[insurer]
+    for name, actual in _study(stores[insurer]).to_maps().items():
+        assert _difference(maps[name], actual, name) is None
+
+
+@pytest.mark.parametrize("insurer", INSURERS)
+def test_results_grid_matches_baseline(reference, stores, insurer):
+    _, _, maps = reference[insurer]
+    expected = baseline.notebook_results(maps, VAX_PERIOD_IN_DAYS)
+    actual = _study(stores[insurer]).results()
+    # 5 periods x 3 doses x 5 age cohorts x 4 metrics
+    assert expected.height == actual.height == 300
+    assert _results_difference(expected, actual) is None
+
+
+def test_verify(sources):
+    assert {
+        check: difference
+        for check, difference in verify(sources, 2_000).items()
+        if difference is not None
+    } == {}
+
+
+@pytest.mark.parametrize("insurer", INSURERS)
+def test_shuffled_extract_matches_chronological_baseline(shuffled_sources, insurer):
+    # the fast paths ignore row order: on a shuffled extract they give what
+    # the baseline gives on the same rows sorted by person and date ...
+    file_path, schema = shuffled_sources[insurer]
+    df = baseline.read_preskladane_data(file_path, schema)
+    persons = baseline.DataframeToPersonsClassConverter().convert(chronological(df))
+    maps = baseline.notebook_maps(
+        persons, START_DATE, END_DATE, VAX_PERIOD_IN_DAYS, ONSET_THRESHOLD
+    )
+    converter = DataframeToPersonsClassConverter()
+    store = converter.convert_to_store(df)
+    assert _persons_difference(persons, store.to_persons()) is None
+    assert _persons_difference(persons, converter.convert(df)) is None
+    study = _study(store)
+    for name, actual in study.to_maps().items():
+        assert _difference(maps[name], actual, name) is None
+    expected = baseline.notebook_results(maps, VAX_PERIOD_IN_DAYS)
+    assert _results_difference(expected, study.results()) is None
+
+    # ... while the baseline on the shuffled rows numbers doses in file order
+    unsorted = baseline.DataframeToPersonsClassConverter().convert(df)
+    assert _persons_difference(unsorted, store.to_persons()) is not None
+    unsorted_maps = baseline.notebook_maps(
+        unsorted, START_DATE, END_DATE, VAX_PERIOD_IN_DAYS, ONSET_THRESHOLD
+    )
+    assert (
+        _results_difference(
+            baseline.notebook_results(unsorted_maps, VAX_PERIOD_IN_DAYS),
+            study.results(),
+        )
+        is not None
+    )
@@ -0,0 +1,23 @@
+import pytest
+
+from common.converter import (
+    DataframeToPersonsClassConverter,
+    convert_parallel,
+    read_preskladane_data,
+)
+
+
+def persons(store):
+    return sorted(store.to_persons(), key=lambda person: person.id)
+
+
+@pytest.mark.parametrize("lazy", [True, False])
+def test_convert_parallel_matches_serial(sources, lazy):
+    frames = {
+        insurer: read_preskladane_data(file_path, schema, lazy=lazy)
+        for insurer, (file_path, schema) in sources.items()
+    }
+    stores = convert_parallel(frames, partitions=3, max_workers=2)
+    for insurer, df in frames.items():
+        serial = DataframeToPersonsClassConverter(insurer=insurer).convert_to_store(df)
+        assert persons(stores[insurer]) == persons(serial)
@@ -0,0 +1,78 @@
+from datetime import date, timedelta
+
+import numpy as np
+import polars as pl
+import pytest
+
+from common import baseline
+from common.eligibility import sliding_windows
+from common.storage import read_store
+
+
+@pytest.fixture(scope="module")
+def store(store_directory):
+    return read_store(store_directory, ["cpzp", "ozp"])
+
+
+def boundary_windows(store) -> list[tuple[date, date]]:
+    """Sliding windows, the first starting on the coverage start of an
+    eligible-looking person and ending on the coverage end of another."""
+    persons = store.persons.filter(
+        pl.col("died_at").is_null() & pl.Series(store.prescription_counts() > 0)
+    )
+    start = persons.filter(pl.col("zahajeni_pojisteni") >= date(2015, 1, 1))[
+        "zahajeni_pojisteni"
+    ].min()
+    # covered from start to at least two years later
+    end = persons.filter(
+        (pl.col("zahajeni_pojisteni") <= start)
+        & (pl.col("ukonceni_pojisteni") >= start + timedelta(days=730))
+    )["ukonceni_pojisteni"].min()
+    return sliding_windows(start, start + timedelta(days=400), (end - start).days, 100)
+
+
+def test_windows_match_baseline(store):
+    windows = boundary_windows(store)
+    assert len(windows) == 5
+    persons = store.to_persons()
+    index = store.coverage_index
+    novax = index.masks(windows, vaccinated=False)
+    vax = index.masks(windows, vaccinated=True)
+    both = index.masks(windows)
+
+    starts = store.persons["zahajeni_pojisteni"].to_numpy()
+    ends = store.persons["ukonceni_pojisteni"]
+    for i, (start_date, end_date) in enumerate(windows):
+        expected_novax = np.array(
+            [
+                not baseline.skip_person_for_novax(p, start_date, end_date)
+                for p in persons
+            ]
+        )
+        expected_vax = np.array(
+            [not baseline.skip_person_for_vax(p, start_date, end_date) for p in persons]
+        )
+        assert np.array_equal(novax[i], expected_novax)
+        assert np.array_equal(vax[i], expected_vax)
+        assert np.array_equal(both[i], expected_novax | expected_vax)
+    # the first window has eligible persons on both coverage boundaries and
+    # without a coverage end
+    start_date, end_date = windows[0]
+    assert (both[0] & (starts == np.datetime64(start_date))).any()
+    assert (both[0] & (ends == end_date).fill_null(False).to_numpy()).any()
+    assert (both[0] & ends.is_null().to_numpy()).any()
+
+    for vaccinated, masks in [(False, novax), (True, vax), (None, both)]:
+        eligible = index.eligible_many(windows, vaccinated)
+        assert [rows.tolist() for rows in eligible] == [
+            np.flatnonzero(mask).tolist() for mask in masks
+        ]
+        assert index.counts(windows, vaccinated).tolist() == masks.sum(axis=1).tolist()
+
+
+def test_sliding_windows():
+    assert sliding_windows(date(2021, 1, 1), date(2021, 1, 25), 30, 10) == [
+        (date(2021, 1, 1), date(2021, 1, 31)),
+        (date(2021, 1, 11), date(2021, 2, 10)),
+        (date(2021, 1, 21), date(2021, 2, 20)),
+    ]
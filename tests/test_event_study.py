@@ -0,0 +1,64 @@
+import dataclasses
+from datetime import date
+
+from common import baseline
+from common.benchmark import (
+    END_DATE,
+    ONSET_THRESHOLD,
+    START_DATE,
+    VAX_PERIOD_IN_DAYS,
+    _difference,
+)
+from common.event_study import METRICS, run_event_study
+from common.storage import read_store
+
+# one of the injected corticoids and the immunosuppressants: the other
+# injections must not collapse those of the outcome
+OUTCOME = ["H02AB01", "L04"]
+
+
+def test_outcome_matches_baseline_of_outcome_prescriptions(store_directory):
+    store = read_store(store_directory, ["cpzp"])
+    study = run_event_study(
+        store,
+        START_DATE,
+        END_DATE,
+        VAX_PERIOD_IN_DAYS,
+        ONSET_THRESHOLD,
+        outcome=OUTCOME,
+    )
+    # the notebook on persons keeping only their outcome prescriptions; those
+    # left without any count for nothing either way
+    persons = [
+        dataclasses.replace(
+            person,
+            prescriptions=[
+                prescription
+                for prescription in person.prescriptions
+                if (prescription.atc_skupina or "").startswith(tuple(OUTCOME))
+            ],
+        )
+        for person in store.to_persons()
+    ]
+    maps = baseline.notebook_maps(
+        persons, START_DATE, END_DATE, VAX_PERIOD_IN_DAYS, ONSET_THRESHOLD
+    )
+    for name, actual in study.to_maps().items():
+        assert _difference(maps[name], actual, name) is None
+
+
+def test_rate_columns_do_not_depend_on_the_data(store_directory):
+    store = read_store(store_directory, ["cpzp"])
+    study = run_event_study(
+        store, START_DATE, END_DATE, VAX_PERIOD_IN_DAYS, ONSET_THRESHOLD, rates=True
+    )
+    # nobody is insured since 1990, so both arms are empty
+    empty = run_event_study(
+        store, date(1990, 1, 1), END_DATE, VAX_PERIOD_IN_DAYS, rates=True
+    )
+    assert study.novax.height and study.vax.height
+    assert empty.novax.height == empty.vax.height == 0
+    for arm in ["novax", "vax"]:
+        schema = getattr(study, arm).schema
+        assert getattr(empty, arm).schema == schema
+        assert {"at_risk", *(f"{metric}_rate" for metric in METRICS)} <= set(schema)
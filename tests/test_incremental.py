@@ -0,0 +1,64 @@
+import shutil
+
+import polars as pl
+import pytest
+
+from common.converter import DataframeToPersonsClassConverter, convert
+from common.storage import read_store
+
+
+def persons(store):
+    return sorted(store.to_persons(), key=lambda person: person.id)
+
+
+def copy_sources(sources, directory):
+    """The fixtures as <insurer>_preskladane.csv extracts in directory."""
+    copies = {}
+    for insurer, (file_path, schema) in sources.items():
+        copy = directory / f"{insurer}_preskladane.csv"
+        shutil.copy(file_path, copy)
+        copies[insurer] = (str(copy), schema)
+    return copies
+
+
+@pytest.mark.parametrize("fixture", ["sources", "shuffled_sources"])
+def test_incremental_matches_full(fixture, request, tmp_path):
+    sources = copy_sources(request.getfixturevalue(fixture), tmp_path)
+    convert(str(tmp_path / "full"), sources=sources, max_workers=1)
+    convert(str(tmp_path / "incremental"), incremental=True, sources=sources)
+    for insurer in sources:
+        full = read_store(str(tmp_path / "full"), [insurer])
+        incremental = read_store(str(tmp_path / "incremental"), [insurer])
+        assert persons(incremental) == persons(full)
+
+
+def test_incremental_after_full(sources, tmp_path):
+    sources = copy_sources(sources, tmp_path)
+    directory = str(tmp_path / "persons")
+    convert(directory, incremental=True, sources=sources)
+    # a full conversion leaves a store without partition tags behind the
+    # manifest of the incremental run, which then rebuilds it
+    convert(directory, sources=sources, max_workers=1)
+    full = {insurer: persons(read_store(directory, [insurer])) for insurer in sources}
+    convert(directory, incremental=True, sources=sources)
+    for insurer in sources:
+        assert persons(read_store(directory, [insurer])) == full[insurer]
+
+    # a later extract with the last events of the first one's persons is
+    # merged into the rebuilt store
+    for insurer, (file_path, schema) in sources.items():
+        events = pl.read_csv(file_path, schema=schema, null_values=["NA", ""])
+        events.tail(50).write_csv(file_path.replace(".csv", "_late.csv"))
+    convert(directory, incremental=True, sources=sources)
+
+    for insurer, (file_path, schema) in sources.items():
+        both = pl.concat(
+            [
+                pl.read_csv(path, schema=schema, null_values=["NA", ""])
+                for path in [file_path, file_path.replace(".csv", "_late.csv")]
+            ]
+        )
+        expected = DataframeToPersonsClassConverter(insurer=insurer).convert_to_store(
+            both
+        )
+        assert persons(read_store(directory, [insurer])) == persons(expected)
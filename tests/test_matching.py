@@ -0,0 +1,51 @@
+import numpy as np
+import polars as pl
+
+from common.matching import match_controls, vaccination_cases
+from common.storage import read_store
+
+
+def _eligible(store, case: int, day: int) -> set[int]:
+    # persons of the case's stratum insured, alive and unvaccinated on day
+    persons = store.persons.with_row_index("row").with_columns(
+        pl.Series("first_dose", store.dose_rows(1))
+    )
+    first_dose = persons["first_dose"].to_numpy()
+    dose_day = np.full(len(first_dose), np.iinfo(np.int64).max)
+    dose_day[first_dose >= 0] = (
+        store.vaccines["date"].to_physical().to_numpy()[first_dose[first_dose >= 0]]
+    )
+    this = persons.row(case, named=True)
+    return set(
+        persons.filter(
+            (pl.col("born_at").dt.year() == this["born_at"].year)
+            & (pl.col("born_at").dt.month() == this["born_at"].month)
+            & (pl.col("gender") == this["gender"])
+            & (pl.col("insurer") == this["insurer"])
+            & (pl.col("zahajeni_pojisteni").to_physical() <= day)
+            & (pl.col("ukonceni_pojisteni").to_physical().fill_null(day) >= day)
+            & (pl.col("died_at").to_physical().fill_null(day) >= day)
+            & pl.Series(dose_day > day)
+        )["row"].to_list()
+    )
+
+
+def test_controls_not_yet_vaccinated(store_directory):
+    store = read_store(store_directory, ["cpzp", "ozp"])
+    for dose_number in (1, 2):
+        cases = vaccination_cases(store, dose_number)
+        matched = match_controls(store, cases, n_controls=3, seed=1)
+        assert matched.equals(match_controls(store, cases, n_controls=3, seed=1))
+
+        controls = matched.filter(pl.col("arm") == "control")
+        case_rows = matched.filter(pl.col("arm") == "vax")
+        # some controls are vaccinated later on
+        assert (store.vaccine_counts()[controls["person_idx"].to_numpy()] > 0).any()
+        for match_id, person, index_date in case_rows.select(
+            "match_id", "person_idx", pl.col("index_date").to_physical()
+        ).rows()[::97]:
+            eligible = _eligible(store, person, index_date)
+            chosen = controls.filter(pl.col("match_id") == match_id)["person_idx"]
+            assert chosen.is_unique().all()
+            assert set(chosen.to_list()) <= eligible
+            assert len(chosen) == min(3, len(eligible))
@@ -0,0 +1,28 @@
+import pickle
+from pathlib import Path
+
+from common.constants.objects import Person
+from common.person_store import PersonStore
+
+DATA = Path(__file__).parent / "data"
+
+
+def test_loads_pickles_from_before_slots():
+    # written by the classes before they had slots and the insurer field
+    with open(DATA / "old_persons.pkl", "rb") as file:
+        persons = pickle.load(file)
+    assert isinstance(persons[0], Person)
+    assert persons[0].insurer is None
+    assert persons[0].vaccines[0].nazev == "Comirnaty"
+    assert persons[0].prescriptions[0].atc_skupina == "H02AB07"
+
+    store = PersonStore.from_persons(persons)
+    assert len(store) == 1
+    assert store.to_persons()[0].vaccines[0].dose_number == 1
+
+
+def test_slotted_pickles_round_trip():
+    with open(DATA / "old_persons.pkl", "rb") as file:
+        persons = pickle.load(file)
+    persons[0].insurer = "cpzp"
+    assert pickle.loads(pickle.dumps(persons)) == persons
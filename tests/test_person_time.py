@@ -0,0 +1,137 @@
+from datetime import date, timedelta
+
+import numpy as np
+import polars as pl
+import pytest
+
+from common.constants.objects import AgeCohort
+from common.daily_series import COHORTS
+from common.person_time import (
+    AT_RISK_KEYS,
+    COHORT_AGES,
+    at_risk,
+    at_risk_around,
+    daily_rates,
+)
+from common.storage import read_store
+
+FIRST_DAY = date(2020, 11, 1)
+LAST_DAY = date(2021, 12, 31)
+
+
+@pytest.fixture(scope="module")
+def store(store_directory):
+    return read_store(store_directory, ["cpzp", "ozp"])
+
+
+def first_doses(store) -> pl.Series:
+    rows = store.dose_rows(1)
+    dates = store.vaccines["date"].gather(np.maximum(rows, 0))
+    return dates.scatter(np.flatnonzero(rows < 0), None).alias("first_dose")
+
+
+def scan(store, day: date, rows: np.ndarray) -> pl.DataFrame:
+    """Persons at risk on day, one by one: covered and alive, with their age
+    cohort and whether vaccinated by then."""
+    persons = store.persons.with_columns(first_doses(store))[rows]
+    counts = {}
+    for person in persons.iter_rows(named=True):
+        if (
+            person["zahajeni_pojisteni"] is None
+            or person["zahajeni_pojisteni"] > day
+            or (person["ukonceni_pojisteni"] or day) < day
+            or (person["died_at"] or day) < day
+        ):
+            continue
+        born = person["born_at"]
+        cohort = sum(date(born.year + age, born.month, 1) <= day for age in COHORT_AGES)
+        vaccinated = person["first_dose"] is not None and person["first_dose"] <= day
+        key = (COHORTS[cohort].value, person["gender"], person["insurer"], vaccinated)
+        counts[key] = counts.get(key, 0) + 1
+    return pl.DataFrame(
+        [(*key, count) for key, count in counts.items()],
+        schema=["age_cohort", "gender", "insurer", "vaccinated", "at_risk"],
+        orient="row",
+    ).sort(AT_RISK_KEYS)
+
+
+@pytest.mark.parametrize("subset", [False, True])
+def test_at_risk_matches_scan(store, subset):
+    rows = np.arange(len(store))
+    if subset:
+        rows = rows[np.random.default_rng(0).random(len(store)) < 0.3]
+    actual = at_risk(store, FIRST_DAY, LAST_DAY, rows if subset else None)
+    assert actual["date"].min() == FIRST_DAY and actual["date"].max() == LAST_DAY
+    for offset in range(0, (LAST_DAY - FIRST_DAY).days + 1, 61):
+        day = FIRST_DAY + timedelta(days=offset)
+        expected = scan(store, day, rows)
+        assert expected.height
+        on_day = (
+            actual.filter(pl.col("date") == day)
+            .drop("date")
+            .with_columns(pl.col("age_cohort", "gender", "insurer").cast(pl.String))
+            .sort(AT_RISK_KEYS)
+        )
+        assert on_day.equals(
+            expected.with_columns(pl.col("gender", "insurer").cast(pl.String))
+        )
+
+
+def test_at_risk_around_matches_scan(store):
+    anchors = store.vaccines.filter(pl.col("dose_number") <= 2).select(
+        "person_idx", "age_cohort", "dose_number", pl.col("date").alias("anchor")
+    )
+    keys = ["age_cohort", "dose_number"]
+    actual = at_risk_around(store, anchors, keys, -30, 400)
+    assert actual["rel_day"].min() >= -30 and actual["rel_day"].max() <= 400
+
+    covered = anchors.join(
+        store.persons.select(
+            "person_idx",
+            "zahajeni_pojisteni",
+            pl.min_horizontal("ukonceni_pojisteni", "died_at").alias("end"),
+        ),
+        on="person_idx",
+    )
+    for rel_day in [-30, -1, 0, 7, 180, 400]:
+        day = pl.col("anchor") + pl.duration(days=rel_day)
+        expected = (
+            covered.filter(
+                (pl.col("zahajeni_pojisteni") <= day)
+                & (pl.col("end").is_null() | (pl.col("end") >= day))
+            )
+            .group_by(keys)
+            .agg(pl.len().cast(pl.Int64).alias("at_risk"))
+            .sort(keys)
+        )
+        on_day = actual.filter(pl.col("rel_day") == rel_day).drop("rel_day").sort(keys)
+        assert on_day.equals(expected)
+
+
+def test_daily_rates():
+    cohorts = pl.Enum(AgeCohort)
+    young, old = COHORTS[1].value, COHORTS[4].value
+    metrics = pl.DataFrame(
+        {
+            "age_cohort": pl.Series([young, young, old], dtype=cohorts),
+            "day": [1, 2, 1],
+            "predpisy": [3, 0, 5],
+            "kortikoidy": [1.5, 0.0, 2.0],
+        }
+    )
+    population = pl.DataFrame(
+        {
+            "age_cohort": pl.Series([young, young, young], dtype=cohorts),
+            "day": [1, 1, 2],
+            "vaccinated": [False, True, False],
+            "at_risk": [200, 100, 50],
+        }
+    )
+    rates = daily_rates(
+        metrics, population, ["age_cohort", "day"], ["predpisy", "kortikoidy"], per=1000
+    )
+    assert rates.select("at_risk", "predpisy_rate", "kortikoidy_rate").rows() == [
+        (300, 10.0, 5.0),
+        (50, 0.0, 0.0),
+        (None, None, None),
+    ]
@@ -0,0 +1,55 @@
+import dataclasses
+from datetime import date, timedelta
+
+from common.render import Chart, render_charts, stored_fingerprint
+
+
+def timeline(path: str, days: int = 10) -> Chart:
+    dates = [date(2021, 1, 1) + timedelta(days=day) for day in range(days)]
+    return Chart(
+        path=path,
+        renderer="vax_timeline",
+        data={
+            "title": "Vaccination Timeline",
+            "dates": dates,
+            "counts": list(range(days)),
+            "moving_average": [float(day) for day in range(days)],
+            "onset": dates[2],
+            "vax_period_in_days": 3,
+        },
+    )
+
+
+def test_render_charts_skips_unchanged(tmp_path):
+    chart = timeline(str(tmp_path / "chart.png"))
+    assert stored_fingerprint(chart.path) is None
+    assert render_charts([chart], max_workers=1) == {"rendered": 1, "skipped": 0}
+    assert stored_fingerprint(chart.path) == chart.fingerprint()
+    assert render_charts([chart], max_workers=1) == {"rendered": 0, "skipped": 1}
+
+    # other data or savefig options draw it again
+    for changed in [
+        timeline(chart.path, days=12),
+        dataclasses.replace(chart, savefig={"dpi": 50}),
+    ]:
+        assert changed.fingerprint() != chart.fingerprint()
+        assert render_charts([changed], max_workers=1) == {"rendered": 1, "skipped": 0}
+        assert stored_fingerprint(chart.path) == changed.fingerprint()
+
+    # as does a PNG without a ChartHash, e.g. one from an older run
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    figure.savefig(chart.path)
+    assert stored_fingerprint(chart.path) is None
+    assert render_charts([chart], max_workers=1) == {"rendered": 1, "skipped": 0}
+    assert render_charts([chart], max_workers=1, force=True)["rendered"] == 1
+
+
+def test_stored_fingerprint_of_other_files(tmp_path):
+    path = tmp_path / "chart.png"
+    path.write_bytes(b"not a png")
+    assert stored_fingerprint(str(path)) is None
+    assert stored_fingerprint(str(tmp_path / "missing.png")) is None
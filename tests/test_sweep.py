@@ -0,0 +1,23 @@
+import glob
+from datetime import date
+
+import polars as pl
+from polars.testing import assert_frame_equal
+
+from common.shared import shared_path
+from common.sweep import run_scenario, run_sweep, scenarios
+
+
+def test_sweep_matches_scenarios(store_directory):
+    runs = scenarios(
+        ["cpzp", "both_companies"],
+        [30, 60],
+        [date(2020, 1, 1)],
+        [date(2022, 12, 31)],
+        [0.5],
+    )
+    swept = run_sweep(runs, store_directory, max_workers=2)
+    expected = pl.concat([run_scenario(run, store_directory) for run in runs])
+    assert_frame_equal(swept, expected)
+    # the published stores are gone once the sweep is done
+    assert not glob.glob(shared_path("sweep-*"))
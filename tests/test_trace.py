@@ -0,0 +1,10 @@
+from common.trace import _worker_file, _worker_files
+
+
+def test_worker_files_leave_neighbours_alone(tmp_path):
+    path = str(tmp_path / "trace")
+    shards = [_worker_file(path, pid) for pid in (12, 345)]
+    neighbours = [f"{path}.json", f"{path}.12", f"{path}.old.part", f"{path}x.1.part"]
+    for file in shards + neighbours:
+        open(file, "w").close()
+    assert sorted(_worker_files(path)) == sorted(shards)